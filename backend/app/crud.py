@@ -1,8 +1,21 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import (
+    func, and_, text, insert, update, delete, case, extract, bindparam, select, values, column, cast, DateTime, Text
+)
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.postgresql import insert as pg_insert, ARRAY, UUID as PG_UUID
+from datetime import datetime, timedelta
+import os
+import uuid
 from . import models, schemas
 from .utils import get_password_hash, verify_password
-from typing import List, Optional, Dict, Any  # AGREGAR Dict y Any aquí
+from .services.history import message_history
+from .services.ticket_stats import ticket_stats_cache
+from .serialization import TICKET_COLUMNS
+from .pagination import (
+    DEFAULT_PAGE_SIZE, created_at_cursor, decode_cursor, keyset_condition, split_page
+)
+from typing import List, Optional, Dict, Any, Tuple  # AGREGAR Dict y Any aquí
 from uuid import UUID
 
 # User CRUD
@@ -33,11 +46,20 @@ def authenticate_user(db: Session, email: str, password: str):
     return user
 
 # Ticket CRUD
-def get_tickets(db: Session, user_id: Optional[UUID] = None, skip: int = 0, limit: int = 100):
+def _ticket_page(query, cursor: Optional[str], limit: int, kind: str):
+    """Página de tickets del más reciente al más antiguo; devuelve (tickets, next_cursor)"""
+    after = created_at_cursor(kind, cursor)
+    if after:
+        query = query.filter(keyset_condition((models.Ticket.created_at, models.Ticket.id), after))
+    rows = query.order_by(models.Ticket.created_at.desc(), models.Ticket.id.desc()).limit(limit + 1).all()
+    return split_page(rows, limit, lambda t: (t.created_at, t.id), kind)
+
+def get_tickets(db: Session, user_id: Optional[UUID] = None, cursor: Optional[str] = None,
+                limit: int = DEFAULT_PAGE_SIZE):
     query = db.query(models.Ticket)
     if user_id:
         query = query.filter(models.Ticket.user_id == user_id)
-    return query.order_by(models.Ticket.created_at.desc()).offset(skip).limit(limit).all()
+    return _ticket_page(query, cursor, limit, "tickets")
 
 def get_ticket(db: Session, ticket_id: UUID):
     return db.query(models.Ticket).filter(models.Ticket.id == ticket_id).first()
@@ -47,89 +69,537 @@ def create_ticket(db: Session, ticket: schemas.TicketCreate):
     db.add(db_ticket)
     db.commit()
     db.refresh(db_ticket)
+    ticket_stats_cache.adjust(db_ticket.user_id, None, db_ticket.status)
     return db_ticket
 
 def update_ticket(db: Session, ticket_id: UUID, ticket_update: schemas.TicketUpdate):
     db_ticket = get_ticket(db, ticket_id)
     if db_ticket:
         update_data = ticket_update.model_dump(exclude_unset=True)
+        previous_status = db_ticket.status
         for key, value in update_data.items():
             setattr(db_ticket, key, value)
+        if db_ticket.status != previous_status:
+            _record_status_metrics(db, db_ticket, previous_status)
         db.commit()
         db.refresh(db_ticket)
+        if db_ticket.status != previous_status:
+            ticket_stats_cache.adjust(db_ticket.user_id, previous_status, db_ticket.status)
     return db_ticket
 
 def get_ticket_stats(db: Session, user_id: Optional[UUID] = None):
-    query = db.query(models.Ticket)
-    if user_id:
-        query = query.filter(models.Ticket.user_id == user_id)
-    
-    total = query.count()
-    open_count = query.filter(models.Ticket.status == "open").count()
-    in_progress = query.filter(models.Ticket.status == "in_progress").count()
-    resolved = query.filter(models.Ticket.status == "resolved").count()
-    closed = query.filter(models.Ticket.status == "closed").count()
+    """Conteo por estado: desde memoria si está en caché, si no con un solo GROUP BY status"""
+    counts = ticket_stats_cache.get(user_id)
+    if counts is None:
+        query = db.query(models.Ticket.status, func.count(models.Ticket.id))
+        if user_id:
+            query = query.filter(models.Ticket.user_id == user_id)
+        counts = dict(query.group_by(models.Ticket.status).all())
+        ticket_stats_cache.put(user_id, counts)
     
     return schemas.TicketStats(
-        total=total,
-        open=open_count,
-        in_progress=in_progress,
-        resolved=resolved,
-        closed=closed
+        total=sum(counts.values()),
+        open=counts.get("open", 0),
+        in_progress=counts.get("in_progress", 0),
+        resolved=counts.get("resolved", 0),
+        closed=counts.get("closed", 0)
     )
 
 # Message CRUD
-def get_messages(db: Session, ticket_id: UUID):
-    return db.query(models.Message).filter(
+def get_messages(db: Session, ticket_id: UUID, cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE,
+                 after_message=None):
+    """
+    Mensajes del ticket en orden cronológico, por páginas; devuelve (mensajes, next_cursor).
+    after_message (un mensaje ya conocido por el cliente) equivale a un cursor.
+    """
+    query = db.query(models.Message).filter(models.Message.ticket_id == ticket_id)
+    after = created_at_cursor("messages", cursor)
+    if after_message is not None:
+        after = (after_message.created_at, after_message.id)
+    if after:
+        query = query.filter(
+            keyset_condition((models.Message.created_at, models.Message.id), after, descending=False)
+        )
+    rows = query.order_by(models.Message.created_at.asc(), models.Message.id.asc()).limit(limit + 1).all()
+    return split_page(rows, limit, lambda m: (m.created_at, m.id), "messages")
+
+def get_ticket_version(db: Session, ticket_id: UUID):
+    """(updated_at, id del último mensaje) del ticket, o None si no existe; para ETags"""
+    latest_message = db.query(models.Message.id).filter(
         models.Message.ticket_id == ticket_id
-    ).order_by(models.Message.created_at.asc()).all()
+    ).order_by(models.Message.created_at.desc(), models.Message.id.desc()).limit(1).scalar_subquery()
+    return db.query(models.Ticket.updated_at, latest_message).filter(models.Ticket.id == ticket_id).first()
+
+def get_message(db: Session, message_id: UUID):
+    return db.query(models.Message).filter(models.Message.id == message_id).first()
+
+def get_message_with_ticket(db: Session, ticket_id: UUID, message_id: UUID):
+    """(mensaje, ticket) en una sola consulta, o None si no existe el mensaje en ese ticket"""
+    return db.query(models.Message, models.Ticket).join(
+        models.Ticket, models.Ticket.id == models.Message.ticket_id
+    ).filter(models.Message.id == message_id, models.Ticket.id == ticket_id).first()
+
+def get_recent_messages(db: Session, ticket_id: UUID, limit: Optional[int] = None):
+    """Últimos `limit` mensajes de un ticket (orden cronológico) sin cargar todo el historial"""
+    return message_history.get_recent(db, ticket_id, limit)
+
+def get_message_history(db: Session, ticket_id: UUID, before_message=None, limit: Optional[int] = None):
+    """Historial reciente previo a un mensaje (para armar el contexto del bot)"""
+    return message_history.get_history(db, ticket_id, before_message, limit)
+
+def get_messages_between(db: Session, ticket_id: UUID, after: Optional[datetime], before: datetime, limit: int):
+    """Mensajes del ticket entre dos instantes (exclusivos), los más antiguos primero"""
+    return message_history.get_range(db, ticket_id, after, before, limit)
+
+class MessageUnitOfWork:
+    """
+    Escrituras de mensajes de una interacción en una sola sentencia.
+
+    add() solo acumula; statement() arma un INSERT multi-fila con RETURNING
+    (sin db.refresh), el upsert de chatbot_metrics de cada ticket y las
+    Idempotency-Key como CTEs de un mismo SELECT. Con commit() son tres viajes
+    a la BD (BEGIN, la sentencia y COMMIT) sin importar cuántos mensajes lleve.
+    Compartida con crud_async.
+    """
+
+    def __init__(self):
+        self._rows: List[Dict[str, Any]] = []
+        self._keys: List[Dict[str, Any]] = []
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, message: schemas.MessageCreate, idempotency_key: Optional[str] = None) -> UUID:
+        """Agregar un mensaje (el id y created_at se fijan aquí, en el orden de llegada)"""
+        row = {**message.model_dump(), "id": uuid.uuid4(), "created_at": datetime.utcnow()}
+        self._rows.append(row)
+        if idempotency_key:
+            self._keys.append({
+                "key": idempotency_key, "ticket_id": row["ticket_id"],
+                "message_id": row["id"], "created_at": row["created_at"],
+            })
+        return row["id"]
+
+    def statement(self):
+        new_messages = insert(models.Message).values([
+            _bound(models.Message, row, f"m{n}") for n, row in enumerate(self._rows)
+        ]).returning(
+            *models.Message.__table__.c
+        ).cte("new_messages")
+        writes = []
+        by_ticket: Dict[UUID, List] = {}
+        for row in self._rows:
+            by_ticket.setdefault(row["ticket_id"], []).append((row["is_bot"], row["created_at"]))
+        for n, (ticket_id, events) in enumerate(by_ticket.items()):
+            writes.append(ticket_metrics_stmt(ticket_id, events, f"t{n}").cte(f"metrics_{n}"))
+        if self._keys:
+            writes.append(insert(models.IdempotencyKey).values([
+                _bound(models.IdempotencyKey, key, f"k{n}") for n, key in enumerate(self._keys)
+            ]).cte("new_keys"))
+        return select(aliased(models.Message, new_messages)).add_cte(*writes)
+
+    def sort(self, messages: List[models.Message]) -> List[models.Message]:
+        """Los mensajes devueltos en el orden en que se agregaron"""
+        order = {row["id"]: n for n, row in enumerate(self._rows)}
+        return sorted(messages, key=lambda m: order[m.id])
+
+    def idempotency_key(self, message: models.Message) -> models.IdempotencyKey:
+        """Registro (no ligado a la sesión) de la llave recién insertada de un mensaje"""
+        values = next(k for k in self._keys if k["message_id"] == message.id)
+        db_key = models.IdempotencyKey(**values)
+        db_key.message = message
+        return db_key
+
+    def commit(self, db: Session) -> List[models.Message]:
+        if not self._rows:
+            return []
+        messages = self.sort(db.scalars(self.statement()).all())
+        # Fuera de la sesión antes del commit: así no se expiran y leerlos no
+        # vuelve a consultar la BD (lo que antes hacía db.refresh)
+        for db_message in messages:
+            db.expunge(db_message)
+        db.commit()
+        for db_message in messages:
+            message_history.record(db_message)
+        return messages
+
+def _bound(model, values: Dict[str, Any], prefix: str) -> Dict[str, Any]:
+    """Parámetros con nombre propio: varias escrituras en una sentencia no pueden compartir nombres"""
+    table = model.__table__
+    return {name: bindparam(f"{prefix}_{name}", value, type_=table.c[name].type) for name, value in values.items()}
 
 def create_message(db: Session, message: schemas.MessageCreate):
-    db_message = models.Message(**message.model_dump())
-    db.add(db_message)
+    unit = MessageUnitOfWork()
+    unit.add(message)
+    return unit.commit(db)[0]
+
+def save_bot_replies(db: Session, replies: List[Tuple[Any, schemas.MessageCreate]]) -> int:
+    """
+    Guardar en lote respuestas regeneradas: cada (mensaje del usuario, respuesta)
+    reemplaza el texto de la respuesta del bot que sigue a ese mensaje o, si el
+    turno no tenía, se agrega. Un UPDATE ... FROM (VALUES ...), un INSERT
+    (MessageUnitOfWork) y un solo commit; se toca updated_at de los tickets con
+    respuesta reemplazada para que cambie su ETag.
+    """
+    if not replies:
+        return 0
+    turns = values(
+        column("user_message_id", PG_UUID(as_uuid=True)),
+        column("ticket_id", PG_UUID(as_uuid=True)),
+        column("created_at", DateTime()),
+        column("content", Text()),
+        name="turns",
+    ).data([(user_message.id, reply.ticket_id, user_message.created_at, reply.content)
+            for user_message, reply in replies])
+    following = aliased(models.Message)
+    next_message = select(following.id).where(
+        # VALUES sin tipo: el instante llega como texto
+        following.ticket_id == turns.c.ticket_id, following.created_at > cast(turns.c.created_at, DateTime)
+    ).order_by(following.created_at.asc()).limit(1).scalar_subquery()
+    messages = models.Message.__table__
+    replaced = db.execute(
+        update(messages)
+        .where(messages.c.ticket_id == turns.c.ticket_id, messages.c.id == next_message, messages.c.is_bot)
+        .values(content=turns.c.content)
+        .returning(turns.c.user_message_id, turns.c.ticket_id)
+    ).all()
+
+    replaced_messages = {row.user_message_id for row in replaced}
+    replaced_tickets = {row.ticket_id for row in replaced}
+    if replaced_tickets:
+        db.execute(update(models.Ticket).where(models.Ticket.id.in_(replaced_tickets)).values(
+            updated_at=datetime.utcnow()
+        ))
+    unit = MessageUnitOfWork()
+    for user_message, reply in replies:
+        if user_message.id not in replaced_messages:
+            unit.add(reply)
+    unit.commit(db)
+    db.commit()
+    for ticket_id in replaced_tickets:
+        message_history.invalidate(ticket_id)
+    return len(replies)
+
+def get_bot_reply(db: Session, ticket_id: UUID, user_message_id: UUID):
+    """Respuesta del bot a un mensaje del usuario (el mensaje siguiente, si es del bot)"""
+    user_message = get_message(db, user_message_id)
+    if not user_message:
+        return None
+    next_message = db.query(models.Message).filter(
+        and_(models.Message.ticket_id == ticket_id, models.Message.created_at > user_message.created_at)
+    ).order_by(models.Message.created_at.asc()).first()
+    return next_message if next_message and next_message.is_bot else None
+
+# Idempotency keys
+# Después de este tiempo la llave se olvida y se puede volver a usar
+IDEMPOTENCY_KEY_TTL_HOURS = float(os.getenv("IDEMPOTENCY_KEY_TTL_HOURS", "24"))
+
+def idempotency_key_cutoff() -> datetime:
+    return datetime.utcnow() - timedelta(hours=IDEMPOTENCY_KEY_TTL_HOURS)
+
+def idempotency_key_active(db_key: models.IdempotencyKey) -> bool:
+    return db_key.created_at is None or db_key.created_at >= idempotency_key_cutoff()
+
+def expired_idempotency_key_stmt(key: str):
+    """DELETE de la llave si ya venció (antes de volver a insertarla)"""
+    return delete(models.IdempotencyKey).where(
+        models.IdempotencyKey.key == key, models.IdempotencyKey.created_at < idempotency_key_cutoff()
+    )
+
+def get_idempotency_key(db: Session, key: str):
+    return db.query(models.IdempotencyKey).filter(models.IdempotencyKey.key == key).first()
+
+def purge_idempotency_keys(db: Session) -> int:
+    """Borrar las llaves vencidas; devuelve cuántas se borraron"""
+    deleted = db.query(models.IdempotencyKey).filter(
+        models.IdempotencyKey.created_at < idempotency_key_cutoff()
+    ).delete(synchronize_session=False)
     db.commit()
-    db.refresh(db_message)
-    return db_message
+    return deleted
 
-def get_all_users(db: Session, skip: int = 0, limit: int = 100):
-    """Obtener todos los usuarios con estadísticas"""
-    users = db.query(models.User).offset(skip).limit(limit).all()
+def create_message_idempotent(db: Session, message: schemas.MessageCreate, key: str):
+    """
+    Crear un mensaje asociado a una Idempotency-Key (misma sentencia).
     
-    users_with_stats = []
-    for user in users:
-        total_tickets = db.query(models.Ticket).filter(models.Ticket.user_id == user.id).count()
-        open_tickets = db.query(models.Ticket).filter(
-            and_(models.Ticket.user_id == user.id, models.Ticket.status.in_(["open", "in_progress"]))
-        ).count()
-        resolved_tickets = db.query(models.Ticket).filter(
-            and_(models.Ticket.user_id == user.id, models.Ticket.status.in_(["resolved", "closed"]))
-        ).count()
-        
-        user_dict = {
-            "id": user.id,
-            "email": user.email,
-            "name": user.name,
-            "role": user.role,
-            "created_at": user.created_at,
-            "total_tickets": total_tickets,
-            "open_tickets": open_tickets,
-            "resolved_tickets": resolved_tickets
-        }
-        users_with_stats.append(user_dict)
+    Returns:
+        (registro IdempotencyKey, creado) - si la llave ya existía, creado=False
+    """
+    existing = get_idempotency_key(db, key)
+    if existing and idempotency_key_active(existing):
+        return existing, False
+    if existing:
+        # Vencida: se borra en la misma transacción que la vuelve a insertar
+        db.expunge(existing)
+        db.execute(expired_idempotency_key_stmt(key))
     
-    return users_with_stats
+    unit = MessageUnitOfWork()
+    unit.add(message, idempotency_key=key)
+    try:
+        db_message = unit.commit(db)[0]
+    except IntegrityError:
+        # Otro request con la misma llave ganó la carrera
+        db.rollback()
+        return get_idempotency_key(db, key), False
+    
+    return unit.idempotency_key(db_message), True
+
+def set_idempotency_bot_job(db: Session, key: str, bot_job_id: UUID):
+    db.query(models.IdempotencyKey).filter(models.IdempotencyKey.key == key).update(
+        {"bot_job_id": bot_job_id}, synchronize_session=False
+    )
+    db.commit()
+
+# Ticket summaries (resumen acumulado de turnos antiguos)
+def get_ticket_summary(db: Session, ticket_id: UUID):
+    return db.query(models.TicketSummary).filter(models.TicketSummary.ticket_id == ticket_id).first()
+
+def upsert_ticket_summary(db: Session, ticket_id: UUID, summary: str, summarized_until: datetime, folded_messages: int):
+    """Guardar el resumen acumulado; solo avanza si es más reciente que el guardado"""
+    now = datetime.utcnow()
+    stmt = pg_insert(models.TicketSummary).values(
+        ticket_id=ticket_id,
+        summary=summary,
+        summarized_until=summarized_until,
+        summarized_messages=folded_messages,
+        created_at=now,
+        updated_at=now,
+    )
+    table = models.TicketSummary.__table__
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.ticket_id],
+        set_={
+            "summary": stmt.excluded.summary,
+            "summarized_until": stmt.excluded.summarized_until,
+            "summarized_messages": table.c.summarized_messages + stmt.excluded.summarized_messages,
+            "updated_at": now,
+        },
+        where=func.coalesce(table.c.summarized_until, datetime.min) < stmt.excluded.summarized_until,
+    )
+    db.execute(stmt)
+    db.commit()
+
+USER_SORT_FIELDS = ("created_at", "name", "email", "total_tickets", "open_tickets", "resolved_tickets")
+_USER_SORT_PARSERS = {
+    "created_at": datetime.fromisoformat,
+    "name": str,
+    "email": str,
+    "total_tickets": int,
+    "open_tickets": int,
+    "resolved_tickets": int,
+}
 
-def get_all_tickets_admin(db: Session, skip: int = 0, limit: int = 100):
-    """Obtener todos los tickets (para admin)"""
-    return db.query(models.Ticket).order_by(models.Ticket.created_at.desc()).offset(skip).limit(limit).all()
+def get_all_users(
+    db: Session,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    sort_by: str = "created_at",
+    order: str = "desc",
+    role: Optional[str] = None,
+    search: Optional[str] = None,
+    min_total_tickets: Optional[int] = None,
+    min_open_tickets: Optional[int] = None,
+    min_resolved_tickets: Optional[int] = None
+):
+    """
+    Obtener todos los usuarios con estadísticas.
 
-def get_user_tickets(db: Session, user_id: UUID):
-    """Obtener tickets de un usuario específico"""
-    return db.query(models.Ticket).filter(models.Ticket.user_id == user_id).order_by(models.Ticket.created_at.desc()).all()
+    Una sola consulta (LEFT JOIN + GROUP BY con agregados condicionales), así
+    el número de consultas no crece con el tamaño de la página. Paginada por
+    cursor sobre (columna de orden, id); devuelve (usuarios, next_cursor).
+    """
+    total_tickets = func.count(models.Ticket.id)
+    open_tickets = func.count(models.Ticket.id).filter(models.Ticket.status.in_(["open", "in_progress"]))
+    resolved_tickets = func.count(models.Ticket.id).filter(models.Ticket.status.in_(["resolved", "closed"]))
+
+    query = db.query(
+        models.User.id,
+        models.User.email,
+        models.User.name,
+        models.User.role,
+        models.User.created_at,
+        total_tickets.label("total_tickets"),
+        open_tickets.label("open_tickets"),
+        resolved_tickets.label("resolved_tickets"),
+    ).outerjoin(models.Ticket, models.Ticket.user_id == models.User.id).group_by(models.User.id)
+
+    if role:
+        query = query.filter(models.User.role == role)
+    if search:
+        pattern = f"%{search}%"
+        query = query.filter(models.User.name.ilike(pattern) | models.User.email.ilike(pattern))
+    if min_total_tickets is not None:
+        query = query.having(total_tickets >= min_total_tickets)
+    if min_open_tickets is not None:
+        query = query.having(open_tickets >= min_open_tickets)
+    if min_resolved_tickets is not None:
+        query = query.having(resolved_tickets >= min_resolved_tickets)
+
+    sort_columns = {
+        "created_at": models.User.created_at,
+        "name": models.User.name,
+        "email": models.User.email,
+        "total_tickets": total_tickets,
+        "open_tickets": open_tickets,
+        "resolved_tickets": resolved_tickets,
+    }
+    if sort_by not in sort_columns:
+        sort_by = "created_at"
+    sort_column = sort_columns[sort_by]
+    descending = order != "asc"
+    kind = f"users:{sort_by}:{order}"
+
+    if cursor:
+        after = decode_cursor(cursor, kind, _USER_SORT_PARSERS[sort_by], UUID)
+        condition = keyset_condition((sort_column, models.User.id), after, descending)
+        # Los conteos son agregados: la condición va en HAVING
+        query = query.having(condition) if sort_by.endswith("_tickets") else query.filter(condition)
+
+    # Desempate por id (en el mismo sentido) para que el cursor sea estable
+    if descending:
+        query = query.order_by(sort_column.desc(), models.User.id.desc())
+    else:
+        query = query.order_by(sort_column.asc(), models.User.id.asc())
+    rows = [dict(row._mapping) for row in query.limit(limit + 1).all()]
+
+    return split_page(rows, limit, lambda u: (u[sort_by], u["id"]), kind)
+
+def get_all_tickets_admin(db: Session, cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE):
+    """Obtener todos los tickets (para admin), por páginas; filas de TICKET_COLUMNS"""
+    return _ticket_page(db.query(*TICKET_COLUMNS), cursor, limit, "admin_tickets")
+
+# Un acierto en título / descripción pesa más que uno en los mensajes
+SEARCH_TICKET_WEIGHT = 2.0
+SEARCH_HEADLINE_OPTIONS = "MaxFragments=2, MaxWords=18, MinWords=6, StartSel=<<, StopSel=>>"
+
+# Búsqueda de texto completo (migración 0007). Los aciertos en mensajes se
+# agrupan por ticket (el mejor mensaje da el fragmento); el orden es
+# (rank DESC, ticket_id DESC) y el cursor guarda esos dos valores. ts_headline
+# solo corre sobre las filas de la página.
+SEARCH_SQL = """
+    WITH q AS (
+        SELECT websearch_to_tsquery('spanish_unaccent', :query) AS query
+    ),
+    message_hits AS (
+        SELECT m.ticket_id,
+               MAX(ts_rank_cd(m.search_vector, q.query, 32)) AS rank,
+               COUNT(*) AS hits,
+               (array_agg(m.id ORDER BY ts_rank_cd(m.search_vector, q.query, 32) DESC, m.created_at DESC))[1]
+                   AS message_id,
+               (array_agg(m.created_at ORDER BY ts_rank_cd(m.search_vector, q.query, 32) DESC, m.created_at DESC))[1]
+                   AS message_created_at
+        FROM messages m, q
+        WHERE m.search_vector @@ q.query
+          AND (CAST(:created_from AS timestamp) IS NULL OR m.created_at >= CAST(:created_from AS timestamp))
+          AND (CAST(:created_to AS timestamp) IS NULL OR m.created_at < CAST(:created_to AS timestamp))
+        GROUP BY m.ticket_id
+    ),
+    ticket_hits AS (
+        SELECT t.id AS ticket_id, ts_rank_cd(t.search_vector, q.query, 32) AS rank
+        FROM tickets t, q
+        WHERE t.search_vector @@ q.query
+          AND (CAST(:created_from AS timestamp) IS NULL OR t.created_at >= CAST(:created_from AS timestamp))
+          AND (CAST(:created_to AS timestamp) IS NULL OR t.created_at < CAST(:created_to AS timestamp))
+    ),
+    ranked AS (
+        SELECT COALESCE(th.ticket_id, mh.ticket_id) AS ticket_id,
+               (COALESCE(th.rank, 0) * :ticket_weight + COALESCE(mh.rank, 0))::float8 AS rank,
+               COALESCE(mh.hits, 0) AS message_hits,
+               mh.message_id, mh.message_created_at
+        FROM ticket_hits th
+        FULL JOIN message_hits mh ON mh.ticket_id = th.ticket_id
+    ),
+    page AS (
+        SELECT r.*, t.user_id, t.title, t.category, t.status, t.description, t.created_at
+        FROM ranked r
+        JOIN tickets t ON t.id = r.ticket_id
+        WHERE (CAST(:status AS text) IS NULL OR t.status = CAST(:status AS text))
+          AND (CAST(:category AS text) IS NULL OR t.category = CAST(:category AS text))
+          AND (CAST(:after_rank AS float8) IS NULL
+               OR (r.rank, r.ticket_id) < (CAST(:after_rank AS float8), CAST(:after_id AS uuid)))
+        ORDER BY r.rank DESC, r.ticket_id DESC
+        LIMIT :limit
+    )
+    SELECT p.ticket_id, p.user_id, p.title, p.category, p.status, p.created_at, p.rank,
+           p.message_hits, p.message_id,
+           ts_headline('spanish_unaccent', COALESCE(m.content, p.title || '. ' || p.description),
+                       q.query, :headline_options) AS snippet
+    FROM page p
+    CROSS JOIN q
+    LEFT JOIN messages m ON m.id = p.message_id AND m.created_at = p.message_created_at
+    ORDER BY p.rank DESC, p.ticket_id DESC
+"""
+
+def search_tickets(
+    db: Session,
+    query: str,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    status: Optional[str] = None,
+    category: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None
+):
+    """Tickets cuyo título, descripción o mensajes coinciden con `query`, por relevancia"""
+    after = decode_cursor(cursor, "search", float, UUID) if cursor else (None, None)
+    rows = db.execute(text(SEARCH_SQL), {
+        "query": query,
+        "status": status,
+        "category": category,
+        "created_from": created_from,
+        "created_to": created_to,
+        "after_rank": after[0],
+        "after_id": str(after[1]) if after[1] else None,
+        "ticket_weight": SEARCH_TICKET_WEIGHT,
+        "headline_options": SEARCH_HEADLINE_OPTIONS,
+        "limit": limit + 1,
+    }).mappings().all()
+    return split_page([dict(row) for row in rows], limit, lambda r: (r["rank"], r["ticket_id"]), "search")
+
+def get_tickets_for_regeneration(
+    db: Session,
+    statuses: Optional[List[str]] = None,
+    category: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    ticket_ids: Optional[List[UUID]] = None,
+    limit: int = 500
+):
+    """Tickets (id, categoría, descripción) que cumplen el filtro de regeneración masiva"""
+    query = db.query(models.Ticket.id, models.Ticket.category, models.Ticket.description)
+    if statuses:
+        query = query.filter(models.Ticket.status.in_(statuses))
+    if category:
+        query = query.filter(models.Ticket.category == category)
+    if created_after:
+        query = query.filter(models.Ticket.created_at >= created_after)
+    if created_before:
+        query = query.filter(models.Ticket.created_at < created_before)
+    if ticket_ids:
+        query = query.filter(models.Ticket.id.in_(ticket_ids))
+    return query.order_by(models.Ticket.created_at.desc()).limit(limit).all()
+
+def get_user_tickets(db: Session, user_id: UUID, cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE):
+    """Obtener tickets de un usuario específico, por páginas; filas de TICKET_COLUMNS"""
+    query = db.query(*TICKET_COLUMNS).filter(models.Ticket.user_id == user_id)
+    return _ticket_page(query, cursor, limit, f"user_tickets:{user_id}")
 
 # Ratings CRUD
 def create_message_rating(db: Session, rating: schemas.MessageRatingCreate):
-    """Crear evaluación de un mensaje"""
+    """
+    Crear evaluación de un mensaje; None si el mensaje no existe en ese ticket.
+    
+    messages está particionada y message_ratings ya no tiene FK hacia ella
+    (migración 0006): la existencia se verifica aquí, con FOR KEY SHARE para
+    que el mensaje no se borre antes del commit.
+    """
+    message_id = db.query(models.Message.id).filter(
+        models.Message.id == rating.message_id,
+        models.Message.ticket_id == rating.ticket_id
+    ).with_for_update(read=True, key_share=True).scalar()
+    if message_id is None:
+        db.rollback()
+        return None
+    
     db_rating = models.MessageRating(**rating.model_dump())
     db.add(db_rating)
     db.commit()
@@ -159,81 +629,305 @@ def update_ticket_satisfaction_score(db: Session, ticket_id: UUID):
             metric.user_satisfaction_score = avg_score
             db.commit()
 
+def get_faq_candidates(db: Session, min_rating: int = 4, ticket_id: Optional[UUID] = None) -> List[Dict[str, Any]]:
+    """
+    Pares (pregunta del usuario, respuesta del bot) de tickets resueltos/cerrados
+    cuya respuesta fue calificada con rating >= min_rating
+    """
+    rows = db.execute(text("""
+        SELECT t.id AS ticket_id, t.category, q.content AS question, b.content AS answer,
+               u.name AS customer_name
+        FROM tickets t
+        LEFT JOIN users u ON u.id = t.user_id
+        JOIN messages b ON b.ticket_id = t.id AND b.is_bot
+        JOIN message_ratings r ON r.message_id = b.id AND r.rating >= :min_rating
+        JOIN LATERAL (
+            SELECT u.content
+            FROM messages u
+            WHERE u.ticket_id = t.id AND NOT u.is_bot AND u.created_at < b.created_at
+            ORDER BY u.created_at DESC
+            LIMIT 1
+        ) q ON true
+        WHERE t.status IN ('resolved', 'closed')
+          AND (CAST(:ticket_id AS uuid) IS NULL OR t.id = CAST(:ticket_id AS uuid))
+    """), {"min_rating": min_rating, "ticket_id": str(ticket_id) if ticket_id else None}).mappings().all()
+    return [dict(row) for row in rows]
+
 # Metrics CRUD
 def get_chatbot_metrics(db: Session, ticket_id: UUID):
     """Obtener métricas de un ticket"""
     return db.query(models.ChatbotMetric).filter(models.ChatbotMetric.ticket_id == ticket_id).first()
 
-def get_admin_dashboard_stats(db: Session) -> Dict[str, Any]:
-    """Obtener estadísticas completas para el dashboard de admin"""
-    
-    # Usuarios totales
-    total_users = db.query(models.User).filter(models.User.role == "user").count()
-    
-    # Tickets totales y por estado
-    total_tickets = db.query(models.Ticket).count()
-    open_tickets = db.query(models.Ticket).filter(models.Ticket.status.in_(["open", "in_progress"])).count()
-    resolved_tickets = db.query(models.Ticket).filter(models.Ticket.status.in_(["resolved", "closed"])).count()
-    
-    # Mensajes totales
-    total_messages = db.query(models.Message).count()
-    bot_messages = db.query(models.Message).filter(models.Message.is_bot == True).count()
-    
-    # Tasa de éxito del chatbot (tickets resueltos sin escalamiento)
-    total_resolved = db.query(models.Ticket).filter(models.Ticket.status == "resolved").count()
-    escalated = db.query(models.ChatbotMetric).filter(models.ChatbotMetric.was_escalated == True).count()
-    chatbot_success_rate = ((total_resolved - escalated) / total_resolved * 100) if total_resolved > 0 else 0
-    
-    # Tiempo promedio de resolución
-    metrics_with_time = db.query(models.ChatbotMetric).filter(
-        models.ChatbotMetric.resolution_time_minutes.isnot(None)
-    ).all()
-    avg_resolution_time = sum(m.resolution_time_minutes for m in metrics_with_time) / len(metrics_with_time) if metrics_with_time else 0
-    
-    # Satisfacción promedio
-    metrics_with_satisfaction = db.query(models.ChatbotMetric).filter(
-        models.ChatbotMetric.user_satisfaction_score.isnot(None)
-    ).all()
-    avg_satisfaction = sum(m.user_satisfaction_score for m in metrics_with_satisfaction) / len(metrics_with_satisfaction) if metrics_with_satisfaction else 0
-    
-    # Tickets por categoría
-    tickets_by_category = {}
-    categories = db.query(models.Ticket.category, func.count(models.Ticket.id)).group_by(models.Ticket.category).all()
-    for category, count in categories:
-        tickets_by_category[category] = count
-    
-    # Tickets por estado
-    tickets_by_status = {
-        "open": db.query(models.Ticket).filter(models.Ticket.status == "open").count(),
-        "in_progress": db.query(models.Ticket).filter(models.Ticket.status == "in_progress").count(),
-        "resolved": db.query(models.Ticket).filter(models.Ticket.status == "resolved").count(),
-        "closed": db.query(models.Ticket).filter(models.Ticket.status == "closed").count()
+def ticket_metrics_stmt(ticket_id: UUID, events: List[Tuple[bool, datetime]], prefix: str = "metrics"):
+    """
+    Upsert de chatbot_metrics por los mensajes nuevos (is_bot, created_at) de
+    un ticket, con incrementos atómicos.
+
+    La latencia del bot se mide desde el primer mensaje del usuario aún sin
+    respuesta y se acumula como promedio móvil. Solo la primera respuesta del
+    bot depende del estado guardado (pending_user_message_at); las latencias
+    posteriores dentro del mismo lote se calculan aquí.
+    """
+    events = sorted(events, key=lambda e: e[1])
+    first_bot = next((n for n, (is_bot, _) in enumerate(events) if is_bot), None)
+    first_user = next((at for is_bot, at in events if not is_bot), None)
+
+    def replay(pending, start):
+        """Latencias (suma, muestras) y mensaje pendiente al final, desde events[start:]"""
+        total, samples = 0.0, 0
+        for is_bot, at in events[start:]:
+            if not is_bot:
+                pending = pending or at
+            elif pending:
+                total += (at - pending).total_seconds()
+                samples += 1
+                pending = None
+        return total, samples, pending
+
+    # Ticket sin fila de métricas: todo se conoce aquí
+    new_total, new_samples, new_pending = replay(None, 0)
+    now = datetime.utcnow()
+    stmt = pg_insert(models.ChatbotMetric).values(_bound(models.ChatbotMetric, {
+        "id": uuid.uuid4(),
+        "ticket_id": ticket_id,
+        "total_messages": len(events),
+        "bot_messages": sum(1 for is_bot, _ in events if is_bot),
+        "user_messages": sum(1 for is_bot, _ in events if not is_bot),
+        "average_response_time_seconds": new_total / new_samples if new_samples else None,
+        "response_samples": new_samples,
+        "pending_user_message_at": new_pending,
+        "was_escalated": False,
+        "created_at": now,
+        "updated_at": now,
+    }, prefix))
+
+    table = models.ChatbotMetric.__table__
+    excluded = stmt.excluded
+    update = {
+        "total_messages": table.c.total_messages + excluded.total_messages,
+        "bot_messages": table.c.bot_messages + excluded.bot_messages,
+        "user_messages": table.c.user_messages + excluded.user_messages,
+        "updated_at": excluded.updated_at,
     }
-    
-    # Actividad reciente (últimos 10 tickets)
-    recent_tickets = db.query(models.Ticket).order_by(models.Ticket.created_at.desc()).limit(10).all()
-    recent_activity = []
-    for ticket in recent_tickets:
-        recent_activity.append({
-            "ticket_id": str(ticket.id),
-            "user_name": ticket.user.name,
-            "title": ticket.title,
-            "status": ticket.status,
-            "category": ticket.category,
-            "created_at": ticket.created_at.isoformat()
+    if first_bot is None:
+        update["pending_user_message_at"] = func.coalesce(table.c.pending_user_message_at, first_user)
+    else:
+        bot_at = events[first_bot][1]
+        asked_before = next((at for is_bot, at in events[:first_bot] if not is_bot), None)
+        pending = func.coalesce(table.c.pending_user_message_at, asked_before) if asked_before \
+            else table.c.pending_user_message_at
+        answered = pending.isnot(None)
+        later_total, later_samples, final_pending = replay(None, first_bot + 1)
+        samples = func.coalesce(table.c.response_samples, 0)
+        average = func.coalesce(table.c.average_response_time_seconds, 0)
+        latency = extract("epoch", bot_at - pending)
+        if later_samples:
+            average_update = (
+                (average * samples + case((answered, latency), else_=0) + later_total)
+                / (samples + case((answered, 1), else_=0) + later_samples)
+            )
+        else:
+            average_update = case(
+                (answered, (average * samples + latency) / (samples + 1)),
+                else_=table.c.average_response_time_seconds,
+            )
+        update.update({
+            "average_response_time_seconds": average_update,
+            "response_samples": samples + case((answered, 1), else_=0) + later_samples,
+            "pending_user_message_at": final_pending,
         })
-    
+    return stmt.on_conflict_do_update(index_elements=[table.c.ticket_id], set_=update)
+
+def _record_status_metrics(db: Session, db_ticket: models.Ticket, previous_status: Optional[str]):
+    """Tiempo de resolución al pasar a resuelto/cerrado; se borra si el ticket se reabre (no hace commit)"""
+    closed = ("resolved", "closed")
+    if db_ticket.status in closed and previous_status not in closed:
+        resolution_minutes = int((datetime.utcnow() - db_ticket.created_at).total_seconds() // 60)
+    elif db_ticket.status not in closed and previous_status in closed:
+        resolution_minutes = None
+    else:
+        return
+    now = datetime.utcnow()
+    stmt = pg_insert(models.ChatbotMetric).values(
+        ticket_id=db_ticket.id,
+        total_messages=0,
+        bot_messages=0,
+        user_messages=0,
+        response_samples=0,
+        resolution_time_minutes=resolution_minutes,
+        was_escalated=False,
+        created_at=now,
+        updated_at=now,
+    )
+    table = models.ChatbotMetric.__table__
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[table.c.ticket_id],
+        set_={"resolution_time_minutes": resolution_minutes, "updated_at": now},
+    ))
+
+def backfill_chatbot_metrics(db: Session, ticket_ids: Optional[List[UUID]] = None) -> int:
+    """
+    Recalcular chatbot_metrics de todos los tickets desde messages (job de una
+    vez, para tickets anteriores a los contadores incrementales). Devuelve
+    cuántos tickets se escribieron. Con ticket_ids solo se recalculan esos
+    (p. ej. los que tocó una importación masiva).
+
+    El tiempo de resolución de tickets ya cerrados se aproxima con updated_at
+    (no hay registro del momento exacto del cambio de estado).
+    """
+    only = "WHERE ticket_id = ANY(:ticket_ids)" if ticket_ids is not None else ""
+    only_ratings = "AND ticket_id = ANY(:ticket_ids)" if ticket_ids is not None else ""
+    only_tickets = "WHERE t.id = ANY(:ticket_ids)" if ticket_ids is not None else ""
+    statement = text(f"""
+        WITH ordered AS (
+            SELECT ticket_id, created_at, is_bot,
+                   -- respuestas del bot anteriores: agrupa cada pregunta con la respuesta que la cierra
+                   COUNT(*) FILTER (WHERE is_bot) OVER (
+                       PARTITION BY ticket_id ORDER BY created_at, id
+                       ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+                   ) AS turn
+            FROM messages
+            {only}
+        ),
+        turns AS (
+            SELECT ticket_id, turn,
+                   MIN(created_at) FILTER (WHERE NOT is_bot) AS asked_at,
+                   MIN(created_at) FILTER (WHERE is_bot) AS answered_at
+            FROM ordered
+            GROUP BY ticket_id, turn
+        ),
+        latency AS (
+            SELECT ticket_id,
+                   AVG(EXTRACT(EPOCH FROM answered_at - asked_at)) AS average_response_time_seconds,
+                   COUNT(*) FILTER (WHERE asked_at IS NOT NULL AND answered_at IS NOT NULL) AS response_samples,
+                   MAX(asked_at) FILTER (WHERE answered_at IS NULL) AS pending_user_message_at
+            FROM turns
+            GROUP BY ticket_id
+        ),
+        counts AS (
+            SELECT ticket_id,
+                   COUNT(*) AS total_messages,
+                   COUNT(*) FILTER (WHERE is_bot) AS bot_messages,
+                   COUNT(*) FILTER (WHERE NOT is_bot) AS user_messages
+            FROM messages
+            {only}
+            GROUP BY ticket_id
+        ),
+        satisfaction AS (
+            SELECT ticket_id, AVG(rating) AS user_satisfaction_score
+            FROM message_ratings
+            WHERE rating IS NOT NULL {only_ratings}
+            GROUP BY ticket_id
+        )
+        INSERT INTO chatbot_metrics (
+            id, ticket_id, total_messages, bot_messages, user_messages,
+            resolution_time_minutes, was_escalated, average_response_time_seconds,
+            response_samples, pending_user_message_at, user_satisfaction_score,
+            created_at, updated_at
+        )
+        SELECT gen_random_uuid(), t.id,
+               COALESCE(c.total_messages, 0), COALESCE(c.bot_messages, 0), COALESCE(c.user_messages, 0),
+               CASE WHEN t.status IN ('resolved', 'closed')
+                    THEN (EXTRACT(EPOCH FROM t.updated_at - t.created_at) / 60)::int END,
+               false, l.average_response_time_seconds,
+               COALESCE(l.response_samples, 0), l.pending_user_message_at, s.user_satisfaction_score,
+               now(), now()
+        FROM tickets t
+        LEFT JOIN counts c ON c.ticket_id = t.id
+        LEFT JOIN latency l ON l.ticket_id = t.id
+        LEFT JOIN satisfaction s ON s.ticket_id = t.id
+        {only_tickets}
+        ON CONFLICT (ticket_id) DO UPDATE SET
+            total_messages = EXCLUDED.total_messages,
+            bot_messages = EXCLUDED.bot_messages,
+            user_messages = EXCLUDED.user_messages,
+            resolution_time_minutes = COALESCE(chatbot_metrics.resolution_time_minutes,
+                                               EXCLUDED.resolution_time_minutes),
+            average_response_time_seconds = EXCLUDED.average_response_time_seconds,
+            response_samples = EXCLUDED.response_samples,
+            pending_user_message_at = EXCLUDED.pending_user_message_at,
+            user_satisfaction_score = EXCLUDED.user_satisfaction_score,
+            updated_at = now()
+    """)
+    params = {}
+    if ticket_ids is not None:
+        statement = statement.bindparams(bindparam("ticket_ids", type_=ARRAY(PG_UUID(as_uuid=True))))
+        params["ticket_ids"] = list(ticket_ids)
+    result = db.execute(statement, params)
+    db.commit()
+    return result.rowcount
+
+def get_admin_dashboard_stats(db: Session) -> Dict[str, Any]:
+    """
+    Obtener estadísticas completas para el dashboard de admin.
+
+    Una sola sentencia sobre dashboard_rollup (contadores que mantienen los
+    triggers de la migración 0003, repartidos en shards que aquí se
+    suman) más los últimos 10 tickets con su usuario.
+    """
+    row = db.execute(text("""
+        SELECT
+            COALESCE(SUM(count) FILTER (WHERE metric = 'users' AND bucket = 'user'), 0) AS total_users,
+            COALESCE(SUM(count) FILTER (WHERE metric = 'tickets_status'), 0) AS total_tickets,
+            COALESCE(SUM(count) FILTER (WHERE metric = 'tickets_status'
+                                          AND bucket IN ('open', 'in_progress')), 0) AS open_tickets,
+            COALESCE(SUM(count) FILTER (WHERE metric = 'tickets_status'
+                                          AND bucket IN ('resolved', 'closed')), 0) AS resolved_tickets,
+            COALESCE(SUM(count) FILTER (WHERE metric = 'tickets_status' AND bucket = 'resolved'), 0) AS total_resolved,
+            COALESCE(SUM(count) FILTER (WHERE metric = 'messages' AND bucket = 'all'), 0) AS total_messages,
+            COALESCE(SUM(count) FILTER (WHERE metric = 'messages' AND bucket = 'bot'), 0) AS bot_messages,
+            COALESCE(SUM(count) FILTER (WHERE metric = 'metric_escalated'), 0) AS escalated,
+            COALESCE(SUM(count) FILTER (WHERE metric = 'metric_resolution_time'), 0) AS resolution_count,
+            COALESCE(SUM(total) FILTER (WHERE metric = 'metric_resolution_time'), 0) AS resolution_total,
+            COALESCE(SUM(count) FILTER (WHERE metric = 'metric_satisfaction'), 0) AS satisfaction_count,
+            COALESCE(SUM(total) FILTER (WHERE metric = 'metric_satisfaction'), 0) AS satisfaction_total,
+            COALESCE(jsonb_object_agg(bucket, count) FILTER (WHERE metric = 'tickets_category' AND count > 0),
+                     '{}'::jsonb) AS tickets_by_category,
+            COALESCE(jsonb_object_agg(bucket, count) FILTER (WHERE metric = 'tickets_status'),
+                     '{}'::jsonb) AS tickets_by_status,
+            (
+                SELECT COALESCE(jsonb_agg(recent ORDER BY recent.created_at DESC), '[]'::jsonb)
+                FROM (
+                    SELECT t.id::text AS ticket_id, u.name AS user_name, t.title, t.status,
+                           t.category, t.created_at
+                    FROM tickets t
+                    JOIN users u ON u.id = t.user_id
+                    ORDER BY t.created_at DESC
+                    LIMIT 10
+                ) recent
+            ) AS recent_activity
+        FROM (
+            SELECT metric, bucket, SUM(count) AS count, SUM(total) AS total
+            FROM dashboard_rollup
+            GROUP BY metric, bucket
+        ) dashboard_rollup
+    """)).mappings().one()
+
+    # Tasa de éxito del chatbot (tickets resueltos sin escalamiento)
+    total_resolved = row["total_resolved"]
+    chatbot_success_rate = ((total_resolved - row["escalated"]) / total_resolved * 100) if total_resolved > 0 else 0
+    avg_resolution_time = row["resolution_total"] / row["resolution_count"] if row["resolution_count"] else 0
+    avg_satisfaction = row["satisfaction_total"] / row["satisfaction_count"] if row["satisfaction_count"] else 0
+
+    by_status = row["tickets_by_status"]
+    tickets_by_status = {s: by_status.get(s, 0) for s in ("open", "in_progress", "resolved", "closed")}
+
     return {
-        "total_users": total_users,
-        "total_tickets": total_tickets,
-        "open_tickets": open_tickets,
-        "resolved_tickets": resolved_tickets,
-        "total_messages": total_messages,
-        "bot_messages": bot_messages,
+        "total_users": row["total_users"],
+        "total_tickets": row["total_tickets"],
+        "open_tickets": row["open_tickets"],
+        "resolved_tickets": row["resolved_tickets"],
+        "total_messages": row["total_messages"],
+        "bot_messages": row["bot_messages"],
         "chatbot_success_rate": round(chatbot_success_rate, 2),
         "average_resolution_time": round(avg_resolution_time, 2),
         "average_satisfaction_score": round(avg_satisfaction, 2),
-        "tickets_by_category": tickets_by_category,
+        "tickets_by_category": row["tickets_by_category"],
         "tickets_by_status": tickets_by_status,
-        "recent_activity": recent_activity
-    }
\ No newline at end of file
+        "recent_activity": row["recent_activity"]
+    }
+
+def refresh_dashboard_rollup(db: Session):
+    """Recalcular los contadores del dashboard desde cero (p. ej. tras una carga masiva)"""
+    db.execute(text("SELECT refresh_dashboard_rollup()"))
+    db.commit()
@@ -0,0 +1,165 @@
+"""
+Equivalentes async (AsyncSession + asyncpg) de las funciones de crud.py que
+usan las rutas de más tráfico: lectura de tickets y mensajes (polling),
+estadísticas y alta de mensajes. Comparten modelos, cursores, cachés en
+memoria y el upsert de métricas con la versión sync.
+"""
+from typing import Optional
+from uuid import UUID
+
+from sqlalchemy import select, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from . import models, schemas
+from .crud import MessageUnitOfWork, expired_idempotency_key_stmt, idempotency_key_active
+from .pagination import DEFAULT_PAGE_SIZE, created_at_cursor, keyset_condition, split_page
+from .serialization import MESSAGE_COLUMNS, TICKET_COLUMNS, rows_to_dicts
+from .services.history import message_history
+from .services.ticket_stats import ticket_stats_cache
+
+
+# Ticket CRUD
+async def get_ticket(db: AsyncSession, ticket_id: UUID):
+    return await db.get(models.Ticket, ticket_id)
+
+async def get_ticket_with_messages(db: AsyncSession, ticket_id: UUID):
+    """
+    Ticket con sus mensajes (cronológicos) como dict listo para
+    serialization.json_response, o None si no existe. Solo las columnas de
+    schemas.TicketWithMessages, sin objetos ORM.
+    """
+    ticket = (await db.execute(select(*TICKET_COLUMNS).where(models.Ticket.id == ticket_id))).first()
+    if ticket is None:
+        return None
+    messages = await db.execute(
+        select(*MESSAGE_COLUMNS)
+        .where(models.Message.ticket_id == ticket_id)
+        .order_by(models.Message.created_at.asc(), models.Message.id.asc())
+    )
+    return {**ticket._asdict(), "messages": rows_to_dicts(messages)}
+
+async def get_ticket_version(db: AsyncSession, ticket_id: UUID):
+    """(updated_at, id del último mensaje) del ticket, o None si no existe; para ETags"""
+    latest_message = (
+        select(models.Message.id)
+        .where(models.Message.ticket_id == ticket_id)
+        .order_by(models.Message.created_at.desc(), models.Message.id.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    result = await db.execute(
+        select(models.Ticket.updated_at, latest_message).where(models.Ticket.id == ticket_id)
+    )
+    return result.first()
+
+async def get_tickets(db: AsyncSession, user_id: Optional[UUID] = None, cursor: Optional[str] = None,
+                      limit: int = DEFAULT_PAGE_SIZE):
+    """
+    Página de tickets (filas de TICKET_COLUMNS) del más reciente al más
+    antiguo; devuelve (tickets, next_cursor)
+    """
+    query = select(*TICKET_COLUMNS)
+    if user_id:
+        query = query.where(models.Ticket.user_id == user_id)
+    after = created_at_cursor("tickets", cursor)
+    if after:
+        query = query.where(keyset_condition((models.Ticket.created_at, models.Ticket.id), after))
+    query = query.order_by(models.Ticket.created_at.desc(), models.Ticket.id.desc()).limit(limit + 1)
+    rows = (await db.execute(query)).all()
+    return split_page(list(rows), limit, lambda t: (t.created_at, t.id), "tickets")
+
+async def get_ticket_stats(db: AsyncSession, user_id: Optional[UUID] = None):
+    """Conteo por estado: desde memoria si está en caché, si no con un solo GROUP BY status"""
+    counts = ticket_stats_cache.get(user_id)
+    if counts is None:
+        query = select(models.Ticket.status, func.count(models.Ticket.id))
+        if user_id:
+            query = query.where(models.Ticket.user_id == user_id)
+        counts = dict((await db.execute(query.group_by(models.Ticket.status))).all())
+        ticket_stats_cache.put(user_id, counts)
+
+    return schemas.TicketStats(
+        total=sum(counts.values()),
+        open=counts.get("open", 0),
+        in_progress=counts.get("in_progress", 0),
+        resolved=counts.get("resolved", 0),
+        closed=counts.get("closed", 0)
+    )
+
+# Message CRUD
+async def get_message(db: AsyncSession, message_id: UUID):
+    return await db.get(models.Message, message_id)
+
+async def get_messages(db: AsyncSession, ticket_id: UUID, cursor: Optional[str] = None,
+                       limit: int = DEFAULT_PAGE_SIZE, after_message=None):
+    """
+    Mensajes del ticket (filas de MESSAGE_COLUMNS) en orden cronológico, por
+    páginas; devuelve (mensajes, next_cursor)
+    """
+    query = select(*MESSAGE_COLUMNS).where(models.Message.ticket_id == ticket_id)
+    after = created_at_cursor("messages", cursor)
+    if after_message is not None:
+        after = (after_message.created_at, after_message.id)
+    if after:
+        query = query.where(
+            keyset_condition((models.Message.created_at, models.Message.id), after, descending=False)
+        )
+    query = query.order_by(models.Message.created_at.asc(), models.Message.id.asc()).limit(limit + 1)
+    rows = (await db.execute(query)).all()
+    return split_page(list(rows), limit, lambda m: (m.created_at, m.id), "messages")
+
+async def commit_messages(db: AsyncSession, unit: MessageUnitOfWork):
+    """Equivalente async de MessageUnitOfWork.commit (misma sentencia única)"""
+    messages = unit.sort((await db.scalars(unit.statement())).all())
+    await db.commit()
+    for db_message in messages:
+        message_history.record(db_message)
+    return messages
+
+async def create_message(db: AsyncSession, message: schemas.MessageCreate):
+    unit = MessageUnitOfWork()
+    unit.add(message)
+    return (await commit_messages(db, unit))[0]
+
+# Idempotency keys
+async def get_idempotency_key(db: AsyncSession, key: str):
+    result = await db.execute(
+        select(models.IdempotencyKey)
+        .options(selectinload(models.IdempotencyKey.message))
+        .where(models.IdempotencyKey.key == key)
+    )
+    return result.scalar_one_or_none()
+
+async def create_message_idempotent(db: AsyncSession, message: schemas.MessageCreate, key: str):
+    """
+    Crear un mensaje asociado a una Idempotency-Key (misma sentencia).
+
+    Returns:
+        (registro IdempotencyKey, creado) - si la llave ya existía, creado=False
+    """
+    existing = await get_idempotency_key(db, key)
+    if existing and idempotency_key_active(existing):
+        return existing, False
+    if existing:
+        # Vencida: se borra en la misma transacción que la vuelve a insertar
+        db.expunge(existing)
+        await db.execute(expired_idempotency_key_stmt(key))
+
+    unit = MessageUnitOfWork()
+    unit.add(message, idempotency_key=key)
+    try:
+        db_message = (await commit_messages(db, unit))[0]
+    except IntegrityError:
+        # Otro request con la misma llave ganó la carrera
+        await db.rollback()
+        return await get_idempotency_key(db, key), False
+
+    return unit.idempotency_key(db_message), True
+
+async def set_idempotency_bot_job(db: AsyncSession, key: str, bot_job_id: UUID):
+    db_key = await db.get(models.IdempotencyKey, key)
+    if db_key:
+        db_key.bot_job_id = bot_job_id
+        await db.commit()
@@ -1,10 +1,15 @@
 from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import QueuePool
 from dotenv import load_dotenv
 import os
+import time
+import uuid
 import logging
+import threading
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -34,6 +39,24 @@ engine = create_engine(
     }
 )
 
+# Pool aparte para los advisory locks de coalescencia (single-flight): una
+# generación mantiene su lock mientras llama al LLM sin ocupar el pool principal
+lock_engine = create_engine(
+    DATABASE_URL,
+    poolclass=QueuePool,
+    pool_size=int(os.getenv("LOCK_POOL_SIZE", "4")),
+    max_overflow=4,
+    pool_pre_ping=True,
+    pool_recycle=1800,
+    connect_args={
+        "connect_timeout": 10,
+        "keepalives": 1,
+        "keepalives_idle": 30,
+        "keepalives_interval": 10,
+        "keepalives_count": 5,
+    }
+)
+
 # Verificar conexión al iniciar
 try:
     with engine.connect() as conn:
@@ -46,6 +69,148 @@ except Exception as e:
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+
+# ✅ Réplica de lectura opcional para dashboards y analítica: los scans de
+# admin no compiten con los INSERT del chat en el primario
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "10"))
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "5"))
+
+replica_engine = create_engine(
+    DATABASE_REPLICA_URL,
+    poolclass=QueuePool,
+    pool_size=int(os.getenv("REPLICA_POOL_SIZE", "5")),
+    max_overflow=10,
+    pool_pre_ping=True,
+    pool_recycle=1800,
+    connect_args={
+        "connect_timeout": int(os.getenv("REPLICA_CONNECT_TIMEOUT", "3")),
+        "keepalives": 1,
+        "keepalives_idle": 30,
+        "keepalives_interval": 10,
+        "keepalives_count": 5,
+    }
+) if DATABASE_REPLICA_URL else None
+
+# Segundos de atraso de la réplica. Sin WAL pendiente de aplicar el atraso es 0
+# aunque el último commit replicado sea viejo (primario sin escrituras); una BD
+# que no está en recovery (p. ej. un segundo Postgres local en pruebas) cuenta como al día.
+REPLICA_LAG_SQL = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+
+class ReplicaRouter:
+    """
+    Elige el engine para las lecturas de analítica: la réplica mientras
+    responda y su atraso no pase de REPLICA_MAX_LAG_SECONDS; si no, el primario.
+    El atraso se consulta como mucho cada REPLICA_CHECK_INTERVAL segundos y
+    solo un hilo a la vez lo revisa (los demás usan el último resultado).
+    """
+
+    def __init__(self, replica, primary, max_lag: float, check_interval: float):
+        self.replica = replica
+        self.primary = primary
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._lag = None
+        self._healthy = replica is not None
+        self._replica_reads = 0
+        self._primary_reads = 0
+
+    def _check(self):
+        try:
+            with self.replica.connect() as conn:
+                lag = float(conn.execute(REPLICA_LAG_SQL).scalar())
+            healthy = lag <= self.max_lag
+            if not healthy:
+                logger.warning(f"⚠️ Réplica con {lag:.1f}s de atraso; lecturas al primario")
+        except Exception as e:
+            lag, healthy = None, False
+            logger.warning(f"⚠️ Réplica no disponible ({e}); lecturas al primario")
+        if healthy and not self._healthy:
+            logger.info("✅ Réplica al día; lecturas de analítica de vuelta a la réplica")
+        self._lag, self._healthy = lag, healthy
+        self._checked_at = time.monotonic()
+
+    def read_engine(self):
+        if self.replica is None:
+            return self.primary
+        if time.monotonic() - self._checked_at >= self.check_interval and self._lock.acquire(blocking=False):
+            try:
+                self._check()
+            finally:
+                self._lock.release()
+        if self._healthy:
+            self._replica_reads += 1
+            return self.replica
+        self._primary_reads += 1
+        return self.primary
+
+    def stats(self):
+        return {
+            "configured": self.replica is not None,
+            "healthy": self._healthy,
+            "lag_seconds": self._lag,
+            "max_lag_seconds": self.max_lag,
+            "replica_reads": self._replica_reads,
+            "primary_reads": self._primary_reads,
+        }
+
+
+replica_router = ReplicaRouter(replica_engine, engine, REPLICA_MAX_LAG_SECONDS, REPLICA_CHECK_INTERVAL)
+
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False)
+
+
+@event.listens_for(ReadSessionLocal, "after_begin")
+def _read_only_transaction(session, transaction, connection):
+    """Las sesiones de lectura no escriben, aunque caigan en el primario"""
+    connection.exec_driver_sql("SET TRANSACTION READ ONLY")
+
+
+def _async_url(url: str):
+    """Misma BD con el driver asyncpg (sslmode de libpq se traduce a ssl)"""
+    url = make_url(url)
+    query = dict(url.query)
+    sslmode = query.pop("sslmode", None)
+    if sslmode and sslmode != "disable":
+        query["ssl"] = sslmode
+    return url.set(drivername="postgresql+asyncpg", query=query)
+
+
+# El pooler de Supabase en modo transacción (puerto 6543) no soporta
+# prepared statements con nombre: se desactiva el caché de asyncpg
+ASYNC_DATABASE_URL = make_url(os.getenv("ASYNC_DATABASE_URL") or _async_url(DATABASE_URL))
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "1" if make_url(DATABASE_URL).port == 6543 else "0") == "1"
+if DB_PGBOUNCER:
+    ASYNC_DATABASE_URL = ASYNC_DATABASE_URL.update_query_dict({"prepared_statement_cache_size": "0"})
+
+# ✅ Engine async (asyncpg) para los handlers async de las rutas de más tráfico;
+# comparte esquema y modelos con el engine sync
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=int(os.getenv("ASYNC_POOL_SIZE", "10")),
+    max_overflow=int(os.getenv("ASYNC_MAX_OVERFLOW", "20")),
+    pool_pre_ping=True,
+    pool_recycle=1800,
+    connect_args={
+        "timeout": 10,
+        **({
+            "statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+        } if DB_PGBOUNCER else {}),
+    },
+)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
 def get_db():
     db = SessionLocal()
     try:
@@ -55,4 +220,25 @@ def get_db():
         db.rollback()
         raise
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def get_read_db():
+    """Sesión de solo lectura en la réplica (o en el primario si la réplica está atrasada)"""
+    db = ReadSessionLocal(bind=replica_router.read_engine())
+    try:
+        yield db
+    except Exception as e:
+        logger.error(f"❌ Error en sesión de lectura: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+        except Exception as e:
+            logger.error(f"❌ Error en sesión async: {e}")
+            await db.rollback()
+            raise
@@ -0,0 +1,40 @@
+"""
+ETags para lecturas que los frontends consultan en polling.
+
+La versión de un ticket es (updated_at, id del último mensaje): cambia cuando
+se edita el ticket o llega un mensaje, y se obtiene con una consulta indexada
+sin cargar los mensajes. Si el cliente manda el mismo ETag en If-None-Match
+se responde 304 sin cuerpo.
+"""
+import hashlib
+from typing import Any
+
+from fastapi import Request, Response
+
+# Revalidar siempre, pero permitir que el navegador guarde la respuesta
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts: Any) -> str:
+    digest = hashlib.sha1("\x1f".join(str(p) for p in parts).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Comparación débil: se ignora el prefijo W/
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in header.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+def set_etag(response: Response, etag: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
@@ -2,9 +2,24 @@ import psycopg2
 from psycopg2.extras import RealDictCursor
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional
+import os
 import json
 import traceback
 
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "10"))
+REPLICA_CONNECT_TIMEOUT = int(os.getenv("REPLICA_CONNECT_TIMEOUT", "3"))
+
+# Misma consulta de atraso que app.database.REPLICA_LAG_SQL (este script corre
+# suelto, sin importar app.database)
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
 class KavakMetricsEvaluator:
     """
     Sistema de evaluación de métricas para agente de soporte Kavak
@@ -24,12 +39,41 @@ class KavakMetricsEvaluator:
     def connect(self):
         """Conectar a la base de datos PostgreSQL"""
         try:
-            self.conn = psycopg2.connect(**self.db_config)
-            print("✅ Conexión exitosa a Supabase")
+            # Las evaluaciones por lote solo leen: a la réplica si está configurada
+            # y al día; si no responde o va atrasada, al primario
+            replica_url = os.getenv("DATABASE_REPLICA_URL")
+            self.conn = self._connect_replica(replica_url) if replica_url else None
+            on_replica = self.conn is not None
+            if not on_replica:
+                self.conn = psycopg2.connect(**self.db_config)
+            self.conn.set_session(readonly=True)
+            print(f"✅ Conexión exitosa a Supabase{' (réplica)' if on_replica else ''}")
         except Exception as e:
             print(f"❌ Error de conexión: {e}")
             raise
 
+    def _connect_replica(self, replica_url: str):
+        """Conexión a la réplica si responde y su atraso no pasa de REPLICA_MAX_LAG_SECONDS; si no, None"""
+        try:
+            conn = psycopg2.connect(replica_url, connect_timeout=REPLICA_CONNECT_TIMEOUT)
+        except psycopg2.Error as e:
+            print(f"⚠️ Réplica no disponible ({e}); se usa el primario")
+            return None
+        try:
+            with conn.cursor() as cur:
+                cur.execute(REPLICA_LAG_SQL)
+                lag = float(cur.fetchone()[0])
+            conn.rollback()
+        except psycopg2.Error as e:
+            conn.close()
+            print(f"⚠️ No se pudo medir el atraso de la réplica ({e}); se usa el primario")
+            return None
+        if lag > REPLICA_MAX_LAG_SECONDS:
+            conn.close()
+            print(f"⚠️ Réplica con {lag:.1f}s de atraso; se usa el primario")
+            return None
+        return conn
+
     def close(self):
         """Cerrar conexión"""
         if self.conn:
@@ -239,7 +283,7 @@ class KavakMetricsEvaluator:
             t.description
         FROM messages m
         JOIN tickets t ON m.ticket_id = t.id
-        WHERE m.ticket_id::text = %s
+        WHERE m.ticket_id = %s::uuid
         ORDER BY m.created_at ASC
         """
         
@@ -94,4 +94,34 @@ except Exception as e:
     import traceback
     traceback.print_exc()
 
+@app.on_event("startup")
+def start_partition_maintainer():
+    """Crear las particiones mensuales de messages que falten (y revisarlas a diario)"""
+    from .services.message_partitions import partition_maintainer
+    partition_maintainer.start()
+
+@app.on_event("shutdown")
+def stop_partition_maintainer():
+    from .services.message_partitions import partition_maintainer
+    partition_maintainer.shutdown()
+
+@app.on_event("shutdown")
+def shutdown_bot_workers():
+    """Esperar a que terminen los jobs del bot antes de apagar"""
+    from .services.bot_worker import bot_workers
+    from .services.llm_client import llm_client
+    from .services import bot_reply
+    from .services.message_writer import message_writer
+    bot_workers.shutdown(wait=True)
+    bot_reply.shutdown(wait=True)
+    # Después de los workers: sus respuestas pueden estar en el buffer
+    message_writer.shutdown()
+    llm_client.close()
+
+@app.on_event("shutdown")
+async def dispose_async_engine():
+    """Cerrar las conexiones asyncpg del pool"""
+    from .database import async_engine
+    await async_engine.dispose()
+
 logger.info("🎉 Aplicación lista!")
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Text, Boolean, DateTime, ForeignKey, Integer, Float
+from sqlalchemy import Column, String, Text, Boolean, DateTime, ForeignKey, Integer, SmallInteger, Float, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -33,8 +33,13 @@ class Ticket(Base):
     messages = relationship("Message", back_populates="ticket")
     ratings = relationship("MessageRating", back_populates="ticket")
     metrics = relationship("ChatbotMetric", back_populates="ticket", uselist=False)
+    summary = relationship("TicketSummary", back_populates="ticket", uselist=False)
 
 class Message(Base):
+    """
+    Particionada por mes sobre created_at (migración 0006): en la BD la llave
+    primaria es (id, created_at); para el ORM basta con id.
+    """
     __tablename__ = "messages"
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -45,20 +50,25 @@ class Message(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     
     ticket = relationship("Ticket", back_populates="messages")
-    rating = relationship("MessageRating", back_populates="message", uselist=False)
+    rating = relationship(
+        "MessageRating", primaryjoin="Message.id == foreign(MessageRating.message_id)",
+        back_populates="message", uselist=False
+    )
 
 class MessageRating(Base):
     __tablename__ = "message_ratings"
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    message_id = Column(UUID(as_uuid=True), ForeignKey("messages.id", ondelete="CASCADE"))
+    message_id = Column(UUID(as_uuid=True))  # sin FK: messages está particionada (migración 0006)
     ticket_id = Column(UUID(as_uuid=True), ForeignKey("tickets.id", ondelete="CASCADE"))
     rating = Column(Integer)  # 1-5
     is_helpful = Column(Boolean)
     feedback_text = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
     
-    message = relationship("Message", back_populates="rating")
+    message = relationship(
+        "Message", primaryjoin="foreign(MessageRating.message_id) == Message.id", back_populates="rating"
+    )
     ticket = relationship("Ticket", back_populates="ratings")
 
 class ChatbotMetric(Base):
@@ -72,8 +82,60 @@ class ChatbotMetric(Base):
     resolution_time_minutes = Column(Integer)
     was_escalated = Column(Boolean, default=False)
     average_response_time_seconds = Column(Float)
+    response_samples = Column(Integer, default=0)  # respuestas promediadas en average_response_time_seconds
+    pending_user_message_at = Column(DateTime)  # primer mensaje del usuario aún sin respuesta del bot
     user_satisfaction_score = Column(Float)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    ticket = relationship("Ticket", back_populates="metrics")
\ No newline at end of file
+    ticket = relationship("Ticket", back_populates="metrics")
+
+class TicketSummary(Base):
+    __tablename__ = "ticket_summaries"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    ticket_id = Column(UUID(as_uuid=True), ForeignKey("tickets.id", ondelete="CASCADE"), unique=True, nullable=False)
+    summary = Column(Text, nullable=False, default="")
+    summarized_until = Column(DateTime)  # created_at del último mensaje incluido en el resumen
+    summarized_messages = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    ticket = relationship("Ticket", back_populates="summary")
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    
+    key = Column(String(255), primary_key=True)
+    ticket_id = Column(UUID(as_uuid=True), ForeignKey("tickets.id", ondelete="CASCADE"), nullable=False)
+    message_id = Column(UUID(as_uuid=True), nullable=False)  # sin FK: messages está particionada
+    bot_job_id = Column(UUID(as_uuid=True))
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    message = relationship("Message", primaryjoin="foreign(IdempotencyKey.message_id) == Message.id")
+
+
+class DashboardRollup(Base):
+    """Contadores del dashboard; los mantienen triggers de BD (migración 0003)"""
+    __tablename__ = "dashboard_rollup"
+    
+    metric = Column(String(50), primary_key=True)
+    bucket = Column(String(255), primary_key=True, default="")
+    shard = Column(SmallInteger, primary_key=True, default=0)  # se suman al leer
+    count = Column(Integer, nullable=False, default=0)
+    total = Column(Float, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+# Índices de las consultas frecuentes (migración 0004_hot_path_indexes)
+Index("ix_messages_ticket_created", Message.ticket_id, Message.created_at, Message.id)
+Index("ix_messages_created", Message.created_at, postgresql_include=["ticket_id", "is_bot"])
+Index("ix_messages_id", Message.id)  # migración 0006
+Index("ix_tickets_user_created", Ticket.user_id, Ticket.created_at.desc(), Ticket.id.desc())
+Index("ix_tickets_created", Ticket.created_at.desc(), Ticket.id.desc())
+Index("ix_tickets_status_created", Ticket.status, Ticket.created_at.desc())
+Index("ix_message_ratings_ticket", MessageRating.ticket_id)
+Index("ix_message_ratings_message", MessageRating.message_id)
+Index("ix_idempotency_keys_ticket", IdempotencyKey.ticket_id)
+Index("ix_idempotency_keys_created_at", IdempotencyKey.created_at)  # migración 0008
@@ -0,0 +1,80 @@
+"""
+Paginación por cursor (keyset) para los listados.
+
+El cursor es opaco para el cliente: codifica los valores de la clave de
+orden de la última fila devuelta, por defecto (created_at, id). La página
+siguiente filtra con una comparación de filas
+`(created_at, id) < (:created_at, :id)`, que Postgres resuelve con el índice
+compuesto sin recorrer ni descartar las filas de páginas anteriores.
+"""
+import json
+import base64
+from datetime import datetime
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from fastapi import HTTPException, Response, status
+from sqlalchemy import tuple_
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 200
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class InvalidCursorError(ValueError):
+    """Cursor mal formado o de otro listado/orden"""
+
+
+def encode_cursor(kind: str, *values: Any) -> str:
+    payload = [kind] + [v.isoformat() if isinstance(v, datetime) else str(v) if isinstance(v, UUID) else v
+                        for v in values]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, kind: str, *parsers: Callable[[Any], Any]) -> List[Any]:
+    """Valores de la clave guardados en el cursor, convertidos con `parsers`"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        if payload[0] != kind or len(payload) != len(parsers) + 1:
+            raise InvalidCursorError("El cursor no corresponde a este listado")
+        return [parse(value) for parse, value in zip(parsers, payload[1:])]
+    except InvalidCursorError:
+        raise
+    except Exception:
+        raise InvalidCursorError("Cursor inválido")
+
+
+def created_at_cursor(kind: str, cursor: Optional[str]) -> Optional[List[Any]]:
+    """Decodificar un cursor de la clave (created_at, id)"""
+    if not cursor:
+        return None
+    return decode_cursor(cursor, kind, datetime.fromisoformat, UUID)
+
+
+def keyset_condition(columns: Sequence, values: Sequence, descending: bool = True):
+    """Filas posteriores al cursor en el orden dado"""
+    if descending:
+        return tuple_(*columns) < tuple_(*values)
+    return tuple_(*columns) > tuple_(*values)
+
+
+def split_page(rows: List[Any], limit: int, key: Callable[[Any], Tuple], kind: str) -> Tuple[List[Any], Optional[str]]:
+    """
+    Las consultas piden limit + 1 filas: si llegó la extra hay otra página y
+    el cursor apunta a la última fila devuelta.
+    """
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(kind, *key(rows[-1]))
+
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]):
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
+
+def cursor_error(error: InvalidCursorError) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
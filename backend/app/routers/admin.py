@@ -1,11 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import io
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Query, Response, UploadFile, File
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Dict, Optional
 from uuid import UUID
 
 from .. import crud, schemas
-from ..database import get_db
+from ..database import get_db, get_read_db, replica_router
 from ..models import User
+from ..services.response_cache import response_cache
+from ..services.llm_client import llm_client
+from ..services.faq_index import faq_index, FAQ_MIN_RATING
+from ..services.model_routing import routing_metrics
+from ..services.bulk_regeneration import bulk_regenerator
+from ..services.metrics_backfill import run_backfill
+from ..services.bulk_import import BulkImporter, IMPORT_BATCH_SIZE, IMPORT_FORMATS
+from ..services.message_partitions import list_partitions
+from ..services.message_archive import archive_messages, MESSAGE_ARCHIVE_AFTER_DAYS
+from ..database import SessionLocal
+from ..serialization import json_response, rows_to_dicts
+from ..pagination import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursorError, cursor_error, set_next_cursor
+)
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
@@ -26,40 +42,263 @@ def verify_admin(user_id: str, db: Session = Depends(get_db)):
         )
 
 @router.get("/dashboard", response_model=schemas.AdminDashboardStats)
-def get_admin_dashboard(user_id: str, db: Session = Depends(get_db)):
+def get_admin_dashboard(user_id: str, db: Session = Depends(get_read_db)):
     """Obtener estadísticas del dashboard de admin"""
     verify_admin(user_id, db)
     return crud.get_admin_dashboard_stats(db)
 
-@router.get("/users")
-def get_all_users(user_id: str, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    """Obtener todos los usuarios"""
+@router.post("/dashboard/refresh", response_model=schemas.AdminDashboardStats)
+def refresh_admin_dashboard(user_id: str, db: Session = Depends(get_db)):
+    """Recalcular los contadores del dashboard desde las tablas (tras cargas masivas o TRUNCATE)"""
     verify_admin(user_id, db)
-    return crud.get_all_users(db, skip, limit)
+    crud.refresh_dashboard_rollup(db)
+    return crud.get_admin_dashboard_stats(db)
+
+@router.get("/users", response_model=List[schemas.UserWithStats])
+def get_all_users(
+    user_id: str,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    sort_by: str = Query("created_at", pattern="^(" + "|".join(crud.USER_SORT_FIELDS) + ")$"),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    role: Optional[str] = None,
+    search: Optional[str] = None,
+    min_total_tickets: Optional[int] = Query(None, ge=0),
+    min_open_tickets: Optional[int] = Query(None, ge=0),
+    min_resolved_tickets: Optional[int] = Query(None, ge=0),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Obtener todos los usuarios con sus conteos de tickets (ordenables y filtrables).
+    La página siguiente se pide con el cursor del header X-Next-Cursor.
+    """
+    verify_admin(user_id, db)
+    try:
+        users, next_cursor = crud.get_all_users(
+            db, cursor, limit,
+            sort_by=sort_by,
+            order=order,
+            role=role,
+            search=search,
+            min_total_tickets=min_total_tickets,
+            min_open_tickets=min_open_tickets,
+            min_resolved_tickets=min_resolved_tickets
+        )
+    except InvalidCursorError as e:
+        raise cursor_error(e)
+    set_next_cursor(response, next_cursor)
+    return users
 
 @router.get("/users/{target_user_id}/tickets", response_model=List[schemas.Ticket])
-def get_user_tickets(target_user_id: UUID, user_id: str, db: Session = Depends(get_db)):
-    """Obtener tickets de un usuario específico"""
+def get_user_tickets(
+    target_user_id: UUID,
+    user_id: str,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_read_db)
+):
+    """Obtener tickets de un usuario específico (siguiente página en X-Next-Cursor)"""
     verify_admin(user_id, db)
-    return crud.get_user_tickets(db, target_user_id)
+    try:
+        tickets, next_cursor = crud.get_user_tickets(db, target_user_id, cursor, limit)
+    except InvalidCursorError as e:
+        raise cursor_error(e)
+    set_next_cursor(response, next_cursor)
+    return json_response(rows_to_dicts(tickets), response)
 
 @router.get("/tickets", response_model=List[schemas.Ticket])
-def get_all_tickets(user_id: str, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    """Obtener todos los tickets"""
+def get_all_tickets(
+    user_id: str,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_read_db)
+):
+    """Obtener todos los tickets (siguiente página en X-Next-Cursor)"""
     verify_admin(user_id, db)
-    return crud.get_all_tickets_admin(db, skip, limit)
+    try:
+        tickets, next_cursor = crud.get_all_tickets_admin(db, cursor, limit)
+    except InvalidCursorError as e:
+        raise cursor_error(e)
+    set_next_cursor(response, next_cursor)
+    return json_response(rows_to_dicts(tickets), response)
+
+@router.get("/search", response_model=List[schemas.SearchResult])
+def search_tickets(
+    user_id: str,
+    response: Response,
+    q: str = Query(..., min_length=2, max_length=200),
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    ticket_status: Optional[str] = Query(None, alias="status"),
+    category: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    db: Session = Depends(get_read_db)
+):
+    """
+    Buscar tickets por texto en título, descripción y mensajes (español, sin
+    distinguir acentos; admite "frases", OR y -exclusiones). Ordenados por
+    relevancia; siguiente página en X-Next-Cursor.
+    """
+    verify_admin(user_id, db)
+    try:
+        results, next_cursor = crud.search_tickets(
+            db, q, cursor, limit, ticket_status, category, created_from, created_to
+        )
+    except InvalidCursorError as e:
+        raise cursor_error(e)
+    set_next_cursor(response, next_cursor)
+    return results
 
 @router.post("/ratings", response_model=schemas.MessageRating)
-def rate_message(rating: schemas.MessageRatingCreate, user_id: str, db: Session = Depends(get_db)):
+def rate_message(rating: schemas.MessageRatingCreate, user_id: str, background_tasks: BackgroundTasks,
+                 db: Session = Depends(get_db)):
     """Evaluar un mensaje del bot"""
     verify_admin(user_id, db)
-    return crud.create_message_rating(db, rating)
+    db_rating = crud.create_message_rating(db, rating)
+    if not db_rating:
+        raise HTTPException(status_code=404, detail="Mensaje no encontrado en el ticket")
+    
+    # Una buena calificación sobre un ticket ya cerrado también alimenta el índice FAQ
+    if rating.rating is not None and rating.rating >= FAQ_MIN_RATING:
+        ticket = crud.get_ticket(db, rating.ticket_id)
+        if ticket and ticket.status in ("resolved", "closed"):
+            background_tasks.add_task(faq_index.add_ticket, ticket.id)
+    return db_rating
 
 @router.get("/tickets/{ticket_id}/metrics", response_model=schemas.ChatbotMetric)
-def get_ticket_metrics(ticket_id: UUID, user_id: str, db: Session = Depends(get_db)):
+def get_ticket_metrics(ticket_id: UUID, user_id: str, db: Session = Depends(get_read_db)):
     """Obtener métricas de un ticket"""
     verify_admin(user_id, db)
     metric = crud.get_chatbot_metrics(db, ticket_id)
     if not metric:
         raise HTTPException(status_code=404, detail="Métricas no encontradas")
-    return metric
\ No newline at end of file
+    return metric
+
+@router.get("/database/replica", response_model=schemas.ReplicaStats)
+def get_replica_stats(user_id: str, db: Session = Depends(get_db)):
+    """Atraso de la réplica de lectura y lecturas servidas por réplica / primario"""
+    verify_admin(user_id, db)
+    return replica_router.stats()
+
+@router.get("/database/partitions", response_model=List[schemas.MessagePartition])
+def get_message_partitions(user_id: str, db: Session = Depends(get_db)):
+    """Particiones mensuales de messages con filas estimadas y tamaño"""
+    verify_admin(user_id, db)
+    return list_partitions(db)
+
+@router.post("/messages/archive", response_model=List[schemas.MessageArchiveResult])
+def archive_old_messages(
+    user_id: str,
+    older_than_days: int = Query(MESSAGE_ARCHIVE_AFTER_DAYS, ge=30),
+    drop: bool = False,
+    dry_run: bool = True,
+    db: Session = Depends(get_db)
+):
+    """
+    Exportar a Parquet los meses de mensajes de tickets cerrados anteriores al
+    corte y desprender sus particiones. Por defecto solo reporta (dry_run).
+    """
+    verify_admin(user_id, db)
+    return archive_messages(older_than_days, drop=drop, dry_run=dry_run)
+
+@router.get("/chatbot/cache", response_model=schemas.ResponseCacheStats)
+def get_response_cache_stats(user_id: str, db: Session = Depends(get_db)):
+    """Obtener hits/misses del caché de respuestas del chatbot"""
+    verify_admin(user_id, db)
+    return response_cache.stats()
+
+@router.delete("/chatbot/cache", response_model=schemas.ResponseCacheStats)
+def clear_response_cache(user_id: str, db: Session = Depends(get_db)):
+    """Vaciar el caché de respuestas (p. ej. después de cambiar el prompt)"""
+    verify_admin(user_id, db)
+    response_cache.clear()
+    return response_cache.stats()
+
+@router.get("/chatbot/llm", response_model=schemas.LLMClientStats)
+def get_llm_client_stats(user_id: str, db: Session = Depends(get_db)):
+    """Estado del circuit breaker y uso del cliente LLM"""
+    verify_admin(user_id, db)
+    return llm_client.stats()
+
+@router.get("/chatbot/routing", response_model=Dict[str, schemas.ModelTierStats])
+def get_model_routing_stats(user_id: str, db: Session = Depends(get_db)):
+    """Llamadas y latencia por tier de modelo (simple / complex)"""
+    verify_admin(user_id, db)
+    return routing_metrics.stats()
+
+@router.get("/chatbot/faq", response_model=schemas.FAQIndexStats)
+def get_faq_index_stats(user_id: str, db: Session = Depends(get_db)):
+    """Tamaño y tasa de aciertos del índice de preguntas frecuentes"""
+    verify_admin(user_id, db)
+    return faq_index.stats()
+
+def _rebuild_faq_index():
+    db = SessionLocal()
+    try:
+        pairs = crud.get_faq_candidates(db, FAQ_MIN_RATING)
+    finally:
+        db.close()
+    faq_index.rebuild(pairs)
+
+@router.post("/chatbot/faq/rebuild", status_code=status.HTTP_202_ACCEPTED)
+def rebuild_faq_index(user_id: str, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    """Reconstruir el índice FAQ desde los tickets resueltos (en segundo plano)"""
+    verify_admin(user_id, db)
+    background_tasks.add_task(_rebuild_faq_index)
+    return {"message": "Reconstrucción del índice FAQ iniciada"}
+
+@router.post("/chatbot/metrics/backfill", status_code=status.HTTP_202_ACCEPTED)
+def backfill_chatbot_metrics(user_id: str, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    """Recalcular las métricas de todos los tickets desde los mensajes (en segundo plano)"""
+    verify_admin(user_id, db)
+    background_tasks.add_task(run_backfill)
+    return {"message": "Backfill de métricas iniciado"}
+
+@router.post("/import", response_model=schemas.BulkImportResult)
+def bulk_import(
+    user_id: str,
+    files: List[UploadFile] = File(...),
+    owner_id: Optional[UUID] = None,
+    format: Optional[str] = Query(None, pattern="^(" + "|".join(IMPORT_FORMATS) + ")$"),
+    batch_size: int = Query(IMPORT_BATCH_SIZE, ge=1000, le=500000),
+    update_metrics: bool = True,
+    db: Session = Depends(get_db)
+):
+    """
+    Importar conversaciones (JSONL del workbench, CSV de mensajes o de metadatos)
+    con COPY por lotes. Los archivos se procesan en el orden enviado; los tickets
+    quedan a nombre de owner_id (por defecto el admin que importa).
+    """
+    admin = verify_admin(user_id, db)
+    if owner_id and not crud.get_user(db, owner_id):
+        raise HTTPException(status_code=404, detail="Usuario dueño no encontrado")
+    sources = [
+        (upload.filename or "upload", io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline=""), format)
+        for upload in files
+    ]
+    try:
+        result = BulkImporter(owner_id or admin.id, batch_size).import_streams(sources, update_metrics)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    return result.to_dict()
+
+@router.post("/bot-responses/regenerate", response_model=schemas.BulkRegenerationJob,
+             status_code=status.HTTP_202_ACCEPTED)
+def regenerate_bot_responses(request: schemas.BulkRegenerateRequest, user_id: str, db: Session = Depends(get_db)):
+    """Regenerar (o previsualizar con dry_run) la respuesta del bot en los tickets del filtro"""
+    verify_admin(user_id, db)
+    job = bulk_regenerator.start(request)
+    return job.to_dict()
+
+@router.get("/bot-responses/regenerate/{job_id}", response_model=schemas.BulkRegenerationJob)
+def get_regeneration_job(job_id: UUID, user_id: str, db: Session = Depends(get_db)):
+    """Progreso y throughput de una regeneración masiva"""
+    verify_admin(user_id, db)
+    job = bulk_regenerator.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job de regeneración no encontrado")
+    return job.to_dict()
@@ -1,105 +1,263 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, Header, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from uuid import UUID
+import asyncio
+import json
 
-from .. import crud, schemas
-from ..database import get_db
-from ..services.chatbot import ChatbotService
+from .. import crud, crud_async, schemas
+from ..database import get_db, get_async_db
+from ..services.bot_worker import bot_workers, QueueFullError
+from ..services.history import HISTORY_WINDOW
+from ..services.bot_reply import generate_bot_reply, stream_bot_reply
+from ..services.message_writer import message_writer, BufferFullError
+from ..pagination import MAX_PAGE_SIZE, InvalidCursorError, cursor_error, encode_cursor, set_next_cursor
+from ..etag import make_etag, etag_matches, not_modified, set_etag
+from ..serialization import json_response, rows_to_dicts
 
 router = APIRouter(prefix="/messages", tags=["messages"])
 
+# Tiempo máximo que un cliente puede esperar un job en una sola petición
+MAX_JOB_WAIT_SECONDS = 30
+
+@router.get("/jobs/stats", response_model=schemas.BotWorkerStats)
+def get_bot_job_stats():
+    """Profundidad de cola y latencia de los jobs de respuesta del bot"""
+    return bot_workers.stats()
+
+@router.get("/writer/stats", response_model=schemas.MessageWriterStats)
+def get_message_writer_stats():
+    """Lotes, commits y latencia de confirmación del write-behind de mensajes"""
+    return message_writer.stats()
+
+@router.get("/jobs/{job_id}", response_model=schemas.BotJob)
+async def get_bot_job(job_id: UUID, wait: float = 0):
+    """Consultar un job de respuesta del bot; con wait > 0 espera hasta que termine"""
+    job = bot_workers.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+    
+    if wait > 0 and not job.done and job.future is not None:
+        try:
+            await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(job.future)),
+                timeout=min(wait, MAX_JOB_WAIT_SECONDS)
+            )
+        except asyncio.TimeoutError:
+            pass
+    
+    return job.to_dict()
+
 @router.get("/{ticket_id}", response_model=List[schemas.Message])
-def get_messages(ticket_id: UUID, db: Session = Depends(get_db)):
-    """Obtener mensajes de un ticket"""
+async def get_messages(
+    ticket_id: UUID,
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Obtener mensajes de un ticket en orden cronológico (siguiente página en X-Next-Cursor).
+    Responde 304 si el ticket no cambió desde el ETag del cliente.
+    """
+    version = await crud_async.get_ticket_version(db, ticket_id)
+    if not version:
+        raise HTTPException(status_code=404, detail="Ticket no encontrado")
+    etag = make_etag("messages", ticket_id, *version, cursor, limit)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    try:
+        messages, next_cursor = await crud_async.get_messages(db, ticket_id, cursor, limit)
+    except InvalidCursorError as e:
+        raise cursor_error(e)
+    set_next_cursor(response, next_cursor)
+    set_etag(response, etag)
+    return json_response(rows_to_dicts(messages), response)
+
+@router.get("/{ticket_id}/sync", response_model=schemas.MessageSync)
+async def sync_messages(
+    ticket_id: UUID,
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    after_id: Optional[UUID] = None,
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Sincronización incremental: solo los mensajes posteriores al cursor del
+    sync anterior (o al mensaje after_id). Sin cursor devuelve desde el inicio.
+    """
+    version = await crud_async.get_ticket_version(db, ticket_id)
+    if not version:
+        raise HTTPException(status_code=404, detail="Ticket no encontrado")
+    etag = make_etag("sync", ticket_id, *version, cursor, after_id, limit)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    after_message = None
+    if after_id:
+        after_message = await crud_async.get_message(db, after_id)
+        if not after_message or after_message.ticket_id != ticket_id:
+            raise HTTPException(status_code=404, detail="Mensaje no encontrado en el ticket")
+    try:
+        messages, next_cursor = await crud_async.get_messages(db, ticket_id, cursor, limit, after_message=after_message)
+    except InvalidCursorError as e:
+        raise cursor_error(e)
+
+    # Sin mensajes nuevos el cursor no avanza
+    if messages:
+        sync_cursor = encode_cursor("messages", messages[-1].created_at, messages[-1].id)
+    elif after_message is not None:
+        sync_cursor = encode_cursor("messages", after_message.created_at, after_message.id)
+    else:
+        sync_cursor = cursor
+    set_etag(response, etag)
+    return json_response(
+        {"messages": rows_to_dicts(messages), "cursor": sync_cursor, "has_more": next_cursor is not None},
+        response
+    )
+
+def _sse(data: dict, event: str = None) -> str:
+    """Formatear un evento Server-Sent Events"""
+    payload = f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+    if event:
+        payload = f"event: {event}\n" + payload
+    return payload
+
+@router.get("/{ticket_id}/stream")
+def stream_bot_response(ticket_id: UUID, db: Session = Depends(get_db)):
+    """
+    Generar la respuesta del bot como stream SSE (token por token).
+    
+    Comparte el single-flight de la generación en segundo plano: si el mensaje
+    ya se está respondiendo (o ya tiene respuesta) no se vuelve a llamar al LLM
+    y la respuesta llega completa en un solo evento token.
+    """
     ticket = crud.get_ticket(db, ticket_id)
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket no encontrado")
-    return crud.get_messages(db, ticket_id)
+    
+    recent_messages = crud.get_recent_messages(db, ticket_id, 1)
+    
+    # Debe haber un mensaje del usuario pendiente de respuesta
+    if not recent_messages or recent_messages[-1].is_bot:
+        raise HTTPException(status_code=400, detail="No hay mensaje del usuario pendiente de respuesta")
+    
+    last_user_message = recent_messages[-1]
+    
+    # Liberar la conexión mientras se llama al LLM
+    db.close()
+    
+    def event_stream():
+        streamed = False
+        try:
+            for item in stream_bot_reply(ticket_id, last_user_message.id):
+                if isinstance(item, str):
+                    streamed = True
+                    yield _sse({"token": item})
+                else:
+                    saved = item
+        except Exception as e:
+            print(f"Error durante el stream del bot: {e}")
+            yield _sse({"detail": "Error al generar la respuesta"}, event="error")
+            return
+        
+        if not streamed:
+            yield _sse({"token": saved.content})
+        yield _sse(json.loads(saved.model_dump_json()), event="done")
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def _create_message(db: AsyncSession, message: schemas.MessageCreate):
+    """Con write-behind activo se escribe en lote; se responde después del commit del lote"""
+    if message_writer.enabled:
+        try:
+            return await asyncio.wrap_future(message_writer.submit(message))
+        except BufferFullError:
+            pass  # buffer lleno: escritura directa
+    return await crud_async.create_message(db, message)
 
 @router.post("/", response_model=schemas.Message)
-def create_message(message: schemas.MessageCreate, db: Session = Depends(get_db)):
-    """Crear un nuevo mensaje en un ticket"""
-    ticket = crud.get_ticket(db, message.ticket_id)
+async def create_message(
+    message: schemas.MessageCreate,
+    response: Response,
+    generate_reply: bool = True,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Crear un nuevo mensaje en un ticket
+    
+    La respuesta del bot se genera en segundo plano: el id del job viene en el
+    header X-Bot-Job-Id y se puede esperar en GET /messages/jobs/{job_id}?wait=N.
+    Con generate_reply=false solo se guarda el mensaje; el cliente puede
+    obtener la respuesta del bot por stream en GET /messages/{ticket_id}/stream
+    
+    Con el header Idempotency-Key los reintentos devuelven el mensaje ya
+    guardado (y su job) en lugar de duplicarlo.
+    """
+    ticket = await crud_async.get_ticket(db, message.ticket_id)
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket no encontrado")
     
     # Crear mensaje del usuario
-    user_message = crud.create_message(db, message)
+    if idempotency_key:
+        db_key, created = await crud_async.create_message_idempotent(db, message, idempotency_key)
+        if db_key.ticket_id != message.ticket_id:
+            raise HTTPException(status_code=422, detail="Idempotency-Key ya usada en otro ticket")
+        user_message = db_key.message
+        if not created:
+            response.headers["Idempotent-Replayed"] = "true"
+            if db_key.bot_job_id:
+                response.headers["X-Bot-Job-Id"] = str(db_key.bot_job_id)
+            return user_message
+    else:
+        user_message = await _create_message(db, message)
     
-    # Si el mensaje NO es del bot, generar respuesta automática
-    if not message.is_bot:
+    # Si el mensaje NO es del bot, encolar la respuesta automática
+    if not message.is_bot and generate_reply:
         try:
-            # Obtener historial de mensajes del ticket
-            all_messages = crud.get_messages(db, message.ticket_id)
-            
-            # Convertir a formato OpenAI (excluyendo el mensaje que acabamos de crear)
-            conversation_history = ChatbotService.format_conversation_history(
-                [msg for msg in all_messages if msg.id != user_message.id]
-            )
-            
-            # Generar respuesta con OpenAI
-            bot_response = ChatbotService.generate_response(
-                user_message=message.content,
-                conversation_history=conversation_history,
-                ticket_category=ticket.category,
-                ticket_description=ticket.description
-            )
-            
-            # Guardar respuesta del bot
-            bot_message = schemas.MessageCreate(
-                ticket_id=message.ticket_id,
-                content=bot_response,
-                is_bot=True,
-                sender_name="Asistente Kavak"
-            )
-            crud.create_message(db, bot_message)
-            
-        except Exception as e:
-            print(f"Error al generar respuesta del bot: {e}")
-            # Si falla OpenAI, no hacemos nada - el usuario puede intentar de nuevo
+            job = bot_workers.submit(message.ticket_id, user_message.id)
+            response.headers["X-Bot-Job-Id"] = str(job.id)
+            if idempotency_key:
+                await crud_async.set_idempotency_bot_job(db, idempotency_key, job.id)
+        except QueueFullError as e:
+            print(f"Error al encolar respuesta del bot: {e}")
+            # Si la cola está llena, el usuario puede pedir la respuesta con /bot-response
     
     return user_message
 
 @router.post("/bot-response", response_model=schemas.Message)
 def generate_bot_response(ticket_id: UUID, db: Session = Depends(get_db)):
-    """Endpoint alternativo para generar respuesta del bot manualmente"""
+    """Endpoint alternativo para generar respuesta del bot manualmente
+    
+    Si ya hay una generación en curso (o terminada) para el último mensaje del
+    usuario, se devuelve esa misma respuesta en lugar de llamar otra vez al LLM.
+    """
     ticket = crud.get_ticket(db, ticket_id)
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket no encontrado")
     
-    # Obtener todos los mensajes
-    all_messages = crud.get_messages(db, ticket_id)
+    # Obtener los mensajes recientes (ventana acotada)
+    recent_messages = crud.get_recent_messages(db, ticket_id, HISTORY_WINDOW + 1)
     
-    if not all_messages:
+    if not recent_messages:
         raise HTTPException(status_code=400, detail="No hay mensajes en el ticket")
     
     # Obtener el último mensaje del usuario
-    last_user_message = None
-    for msg in reversed(all_messages):
-        if not msg.is_bot:
-            last_user_message = msg
-            break
+    last_user_message = next((m for m in reversed(recent_messages) if not m.is_bot), None)
     
     if not last_user_message:
         raise HTTPException(status_code=400, detail="No hay mensajes del usuario")
     
-    # Generar respuesta
-    conversation_history = ChatbotService.format_conversation_history(all_messages)
-    
-    bot_response = ChatbotService.generate_response(
-        user_message=last_user_message.content,
-        conversation_history=conversation_history,
-        ticket_category=ticket.category,
-        ticket_description=ticket.description
-    )
-    
-    # Guardar respuesta del bot
-    bot_message = schemas.MessageCreate(
-        ticket_id=ticket_id,
-        content=bot_response,
-        is_bot=True,
-        sender_name="Asistente Kavak"
-    )
+    # Liberar la conexión mientras se llama al LLM
+    db.close()
     
-    return crud.create_message(db, bot_message)
\ No newline at end of file
+    return generate_bot_reply(ticket_id, last_user_message.id)
@@ -1,30 +1,56 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Query, Request, Response
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from uuid import UUID
 
-from .. import crud, schemas
-from ..database import get_db
+from .. import crud, crud_async, schemas
+from ..database import get_db, get_async_db
+from ..services.faq_index import faq_index
+from ..etag import make_etag, etag_matches, not_modified, set_etag
+from ..serialization import json_response, rows_to_dicts
+from ..pagination import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursorError, cursor_error, set_next_cursor
+)
 
 router = APIRouter(prefix="/tickets", tags=["tickets"])
 
 @router.get("/stats", response_model=schemas.TicketStats)
-def get_stats(user_id: Optional[UUID] = None, db: Session = Depends(get_db)):
+async def get_stats(user_id: Optional[UUID] = None, db: AsyncSession = Depends(get_async_db)):
     """Obtener estadísticas de tickets"""
-    return crud.get_ticket_stats(db, user_id)
+    return await crud_async.get_ticket_stats(db, user_id)
 
 @router.get("/", response_model=List[schemas.Ticket])
-def get_tickets(user_id: Optional[UUID] = None, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    """Obtener lista de tickets"""
-    return crud.get_tickets(db, user_id, skip, limit)
+async def get_tickets(
+    response: Response,
+    user_id: Optional[UUID] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Obtener lista de tickets (siguiente página en el header X-Next-Cursor)"""
+    try:
+        tickets, next_cursor = await crud_async.get_tickets(db, user_id, cursor, limit)
+    except InvalidCursorError as e:
+        raise cursor_error(e)
+    set_next_cursor(response, next_cursor)
+    return json_response(rows_to_dicts(tickets), response)
 
 @router.get("/{ticket_id}", response_model=schemas.TicketWithMessages)
-def get_ticket(ticket_id: UUID, db: Session = Depends(get_db)):
-    """Obtener un ticket específico con sus mensajes"""
-    ticket = crud.get_ticket(db, ticket_id)
-    if not ticket:
+async def get_ticket(ticket_id: UUID, request: Request, response: Response,
+                     db: AsyncSession = Depends(get_async_db)):
+    """Obtener un ticket específico con sus mensajes (304 si no cambió desde el ETag del cliente)"""
+    version = await crud_async.get_ticket_version(db, ticket_id)
+    if not version:
+        raise HTTPException(status_code=404, detail="Ticket no encontrado")
+    etag = make_etag("ticket", ticket_id, *version)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    ticket = await crud_async.get_ticket_with_messages(db, ticket_id)
+    if ticket is None:
         raise HTTPException(status_code=404, detail="Ticket no encontrado")
-    return ticket
+    set_etag(response, etag)
+    return json_response(ticket, response)
 
 @router.post("/", response_model=schemas.Ticket)
 def create_ticket(ticket: schemas.TicketCreate, db: Session = Depends(get_db)):
@@ -32,9 +58,15 @@ def create_ticket(ticket: schemas.TicketCreate, db: Session = Depends(get_db)):
     return crud.create_ticket(db, ticket)
 
 @router.patch("/{ticket_id}", response_model=schemas.Ticket)
-def update_ticket(ticket_id: UUID, ticket_update: schemas.TicketUpdate, db: Session = Depends(get_db)):
+def update_ticket(ticket_id: UUID, ticket_update: schemas.TicketUpdate, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     """Actualizar un ticket"""
+    previous = crud.get_ticket(db, ticket_id)
+    previous_status = previous.status if previous else None
     ticket = crud.update_ticket(db, ticket_id, ticket_update)
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket no encontrado")
+    
+    # Al cerrarse, sus respuestas bien calificadas alimentan el índice FAQ
+    if ticket.status in ("resolved", "closed") and previous_status not in ("resolved", "closed"):
+        background_tasks.add_task(faq_index.add_ticket, ticket.id)
     return ticket
\ No newline at end of file
@@ -1,6 +1,6 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Dict, Any
 from uuid import UUID
 
 # User Schemas
@@ -70,6 +70,11 @@ class Message(MessageBase):
     class Config:
         from_attributes = True
 
+class MessageSync(BaseModel):
+    messages: List[Message] = []
+    cursor: Optional[str] = None  # posición del último mensaje entregado; mandarlo en el siguiente sync
+    has_more: bool = False
+
 # TicketWithMessages
 class TicketWithMessages(Ticket):
     messages: List[Message] = []
@@ -77,6 +82,159 @@ class TicketWithMessages(Ticket):
     class Config:
         from_attributes = True
 
+# Bot Job Schemas
+class BotJob(BaseModel):
+    id: UUID
+    ticket_id: UUID
+    user_message_id: UUID
+    status: str  # queued | running | done | failed
+    bot_message: Optional[Message] = None
+    error: Optional[str] = None
+    queue_ms: Optional[float] = None
+    latency_ms: Optional[float] = None
+
+class BotWorkerStats(BaseModel):
+    workers: int
+    max_queue: int
+    queue_depth: int
+    running: int
+    completed: int
+    failed: int
+    rejected: int
+    coalesced: int = 0
+    latency_ms_p50: Optional[float] = None
+    latency_ms_p95: Optional[float] = None
+    queue_wait_ms_p50: Optional[float] = None
+    queue_wait_ms_p95: Optional[float] = None
+
+class MessageWriterStats(BaseModel):
+    enabled: bool
+    buffered: int
+    buffer_size: int
+    max_batch_rows: int
+    max_delay_ms: float
+    rows: int
+    batches: int
+    commits: int
+    failed: int
+    rejected: int
+    retried_rows: int
+    avg_batch_rows: Optional[float] = None
+    ack_ms_p50: Optional[float] = None
+    ack_ms_p95: Optional[float] = None
+
+class ResponseCacheStats(BaseModel):
+    exact_hits: int
+    semantic_hits: int
+    misses: int
+    hit_rate: float
+    exact_entries: int
+    semantic_entries: int
+    semantic_enabled: bool
+    semantic_threshold: float
+
+class LLMClientStats(BaseModel):
+    circuit_state: str  # closed | open | half_open
+    in_flight: int
+    max_concurrency: int
+    calls: int
+    retries: int
+    failures: int
+    rejected: int
+
+class FAQIndexStats(BaseModel):
+    enabled: bool
+    entries: int
+    lookups: int
+    hits: int
+    hit_rate: float
+    threshold: float
+
+class ReplicaStats(BaseModel):
+    configured: bool
+    healthy: bool
+    lag_seconds: Optional[float] = None
+    max_lag_seconds: float
+    replica_reads: int
+    primary_reads: int
+
+class ModelTierStats(BaseModel):
+    model: str
+    max_tokens: int
+    latency_budget_ms: float
+    calls: int
+    failures: int
+    over_budget: int
+    latency_ms_p50: Optional[float] = None
+    latency_ms_p95: Optional[float] = None
+
+# Bulk Regeneration Schemas
+class BulkRegenerateRequest(BaseModel):
+    statuses: Optional[List[str]] = ["open", "in_progress"]
+    category: Optional[str] = None
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+    ticket_ids: Optional[List[UUID]] = None
+    limit: int = Field(500, ge=1, le=5000)
+    concurrency: Optional[int] = Field(None, ge=1, le=32)
+    dry_run: bool = False  # solo previsualizar, sin guardar
+
+class BulkRegenerationJob(BaseModel):
+    id: UUID
+    status: str  # queued | running | done | failed
+    dry_run: bool
+    concurrency: int
+    filters: Dict[str, Any]
+    total: int
+    done: int
+    failed: int
+    skipped: int
+    saved: int
+    elapsed_seconds: Optional[float] = None
+    tickets_per_second: Optional[float] = None
+    error: Optional[str] = None
+    previews: List[Dict[str, Any]] = []
+    created_at: datetime
+
+class MessagePartition(BaseModel):
+    name: str
+    start: Optional[datetime] = None  # None en messages_default
+    end: Optional[datetime] = None
+    estimated_rows: int
+    total_bytes: int
+
+class MessageArchiveResult(BaseModel):
+    partition: str
+    start: datetime
+    end: datetime
+    rows: int
+    open_tickets: int
+    status: str  # archived / skipped / dry_run / failed
+    file: Optional[str] = None
+    dropped: bool
+    error: Optional[str] = None
+
+class BulkImportResult(BaseModel):
+    files: List[str]
+    tickets: int
+    messages: int
+    batches: int
+    metrics_updated: int
+    elapsed_seconds: float
+    rows_per_second: float
+
+class SearchResult(BaseModel):
+    ticket_id: UUID
+    user_id: Optional[UUID] = None
+    title: str
+    category: str
+    status: Optional[str] = None
+    created_at: Optional[datetime] = None
+    rank: float
+    message_hits: int  # mensajes del ticket que coinciden
+    message_id: Optional[UUID] = None  # mensaje del fragmento (None si coincidió el ticket)
+    snippet: str  # coincidencias entre << >>
+
 # Stats Schema
 class TicketStats(BaseModel):
     total: int
@@ -110,6 +268,7 @@ class ChatbotMetric(BaseModel):
     resolution_time_minutes: Optional[int]
     was_escalated: bool
     average_response_time_seconds: Optional[float]
+    response_samples: int = 0
     user_satisfaction_score: Optional[float]
     created_at: datetime
     updated_at: datetime
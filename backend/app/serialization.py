@@ -0,0 +1,73 @@
+"""
+Respuestas JSON rápidas para los listados grandes (mensajes de un ticket,
+ticket con mensajes, listados de tickets).
+
+En lugar de cargar objetos ORM, construir un modelo Pydantic por fila
+(from_attributes) y codificarlo con el encoder por defecto, estas rutas piden
+a la BD solo las columnas del schema como tuplas y las codifican directo con
+orjson. Las columnas van en el mismo orden que los campos del schema, así que
+el JSON es byte a byte el que daría response_model (que se deja en la ruta
+para la documentación OpenAPI). Comparación en benchmarks/serialization.py.
+"""
+import uuid
+from typing import Any, Dict, Iterable, List, Optional
+
+import orjson
+from fastapi import Response
+
+from . import models
+
+# Orden de campos de schemas.Message (MessageBase primero)
+MESSAGE_COLUMNS = (
+    models.Message.content,
+    models.Message.is_bot,
+    models.Message.sender_name,
+    models.Message.id,
+    models.Message.ticket_id,
+    models.Message.created_at,
+)
+
+# Orden de campos de schemas.Ticket (TicketBase primero)
+TICKET_COLUMNS = (
+    models.Ticket.title,
+    models.Ticket.category,
+    models.Ticket.description,
+    models.Ticket.id,
+    models.Ticket.user_id,
+    models.Ticket.status,
+    models.Ticket.created_at,
+    models.Ticket.updated_at,
+)
+
+# Headers del Response inyectado que no se copian a la respuesta final
+SKIPPED_HEADERS = {"content-length", "content-type"}
+
+
+def rows_to_dicts(rows: Iterable[Any]) -> List[Dict[str, Any]]:
+    """Filas de un select de columnas (Row) a dicts con los nombres de columna"""
+    return [row._asdict() for row in rows]
+
+
+def _default(value: Any):
+    # asyncpg devuelve su propia subclase de uuid.UUID, que orjson no reconoce
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    raise TypeError(f"{type(value).__name__} no es serializable a JSON")
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_default)
+
+
+def json_response(content: Any, response: Optional[Response] = None) -> FastJSONResponse:
+    """
+    Respuesta orjson con los headers que la ruta ya puso en `response`
+    (ETag, X-Next-Cursor): al devolver un Response propio FastAPI no los copia.
+    """
+    headers = None
+    if response is not None:
+        headers = {k: v for k, v in response.headers.items() if k not in SKIPPED_HEADERS}
+    return FastJSONResponse(content, headers=headers)
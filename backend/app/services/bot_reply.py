@@ -0,0 +1,139 @@
+import queue
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, Optional, Union
+from uuid import UUID
+
+from .. import crud, schemas
+from ..database import SessionLocal
+from .chatbot import ChatbotService
+from .context import prepare_context, fold_summary
+from .single_flight import generation_flight
+from .message_writer import save_message
+
+logger = logging.getLogger(__name__)
+
+BOT_SENDER_NAME = "Asistente Kavak"
+
+# Tareas posteriores a la respuesta (resumen acumulado)
+_background = ThreadPoolExecutor(max_workers=2, thread_name_prefix="bot-summary")
+
+
+def generate_bot_reply(ticket_id: UUID, user_message_id: UUID) -> schemas.Message:
+    """
+    Genera y guarda la respuesta del bot a un mensaje del usuario.
+
+    Las generaciones concurrentes para el mismo (ticket, mensaje) se coalescen
+    en una sola llamada al LLM, también entre procesos; si la respuesta ya
+    existe se devuelve la guardada.
+    """
+    return generation_flight.run(
+        f"{ticket_id}:{user_message_id}",
+        generate=lambda: _generate(ticket_id, user_message_id),
+        find_existing=lambda: _find_existing_reply(ticket_id, user_message_id),
+    )
+
+
+def stream_bot_reply(ticket_id: UUID, user_message_id: UUID) -> Iterator[Union[str, schemas.Message]]:
+    """
+    Como generate_bot_reply pero entrega los tokens conforme llegan y al final
+    el mensaje guardado. Pasa por el mismo single-flight: si el mensaje ya se
+    está respondiendo (aquí, en otro proceso o por el worker) no se llama otra
+    vez al LLM y solo se entrega el mensaje guardado, sin tokens.
+    """
+    items: "queue.Queue" = queue.Queue()
+
+    def run():
+        try:
+            items.put(generation_flight.run(
+                f"{ticket_id}:{user_message_id}",
+                generate=lambda: _generate(ticket_id, user_message_id, on_token=items.put),
+                find_existing=lambda: _find_existing_reply(ticket_id, user_message_id),
+            ))
+        except Exception as e:
+            items.put(e)
+
+    # En su propio hilo: si el cliente se desconecta la respuesta igual se guarda
+    threading.Thread(target=run, name=f"bot-stream-{user_message_id}", daemon=True).start()
+    while True:
+        item = items.get()
+        if isinstance(item, Exception):
+            raise item
+        yield item
+        if isinstance(item, schemas.Message):
+            return
+
+
+def shutdown(wait: bool = True):
+    _background.shutdown(wait=wait)
+
+
+def _generate(ticket_id: UUID, user_message_id: UUID,
+              on_token: Optional[Callable[[str], None]] = None) -> schemas.Message:
+    # 1) Leer ticket e historial y liberar la conexión antes de llamar al LLM
+    db = SessionLocal()
+    try:
+        found = crud.get_message_with_ticket(db, ticket_id, user_message_id)
+        if not found:
+            raise ValueError("Mensaje del usuario no encontrado en el ticket")
+        user_message, ticket = found
+
+        # Resumen guardado + ventana reciente que cabe en el presupuesto de tokens
+        context = prepare_context(db, ticket_id, before_message=user_message)
+        user_content = user_message.content
+        ticket_category = ticket.category
+        ticket_description = ticket.description
+    finally:
+        db.close()
+
+    # 2) Generar respuesta con OpenAI (sin conexión de BD tomada); en stream
+    #    cada token se entrega a on_token conforme llega
+    if on_token is None:
+        bot_response = ChatbotService.generate_response(
+            user_message=user_content,
+            conversation_history=context.history,
+            ticket_category=ticket_category,
+            ticket_description=ticket_description,
+            conversation_summary=context.summary
+        )
+    else:
+        tokens = []
+        for token in ChatbotService.stream_response(
+            user_message=user_content,
+            conversation_history=context.history,
+            ticket_category=ticket_category,
+            ticket_description=ticket_description,
+            conversation_summary=context.summary
+        ):
+            tokens.append(token)
+            on_token(token)
+        bot_response = "".join(tokens).strip()
+        if not bot_response:
+            raise ValueError("El stream terminó sin respuesta del modelo")
+
+    # 3) Guardar respuesta del bot (una sentencia: INSERT ... RETURNING + métricas)
+    bot_message = save_message(schemas.MessageCreate(
+        ticket_id=ticket_id,
+        content=bot_response,
+        is_bot=True,
+        sender_name=BOT_SENDER_NAME
+    ))
+    saved = schemas.Message.model_validate(bot_message)
+
+    # 4) Integrar turnos antiguos al resumen sin retrasar la respuesta
+    if context.to_fold:
+        try:
+            _background.submit(fold_summary, ticket_id, context)
+        except RuntimeError:
+            logger.warning("⚠️ Executor detenido: resumen no actualizado")
+    return saved
+
+
+def _find_existing_reply(ticket_id: UUID, user_message_id: UUID) -> Optional[schemas.Message]:
+    db = SessionLocal()
+    try:
+        reply = crud.get_bot_reply(db, ticket_id, user_message_id)
+        return schemas.Message.model_validate(reply) if reply else None
+    finally:
+        db.close()
@@ -0,0 +1,186 @@
+import os
+import time
+import uuid
+import threading
+import logging
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Optional, Dict, Any
+from uuid import UUID
+
+from .bot_reply import generate_bot_reply
+from .single_flight import generation_flight
+
+logger = logging.getLogger(__name__)
+
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "4"))
+BOT_QUEUE_SIZE = int(os.getenv("BOT_QUEUE_SIZE", "100"))
+
+# Cuántos jobs terminados se conservan para consulta
+MAX_TRACKED_JOBS = 1000
+# Ventana de latencias para percentiles
+LATENCY_WINDOW = 500
+
+
+class QueueFullError(Exception):
+    """La cola de generación está llena"""
+
+
+class BotJob:
+    """Generación pendiente de la respuesta del bot para un mensaje del usuario"""
+
+    def __init__(self, ticket_id: UUID, user_message_id: UUID):
+        self.id = uuid.uuid4()
+        self.ticket_id = ticket_id
+        self.user_message_id = user_message_id
+        self.status = "queued"
+        self.bot_message = None
+        self.error: Optional[str] = None
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.future: Optional[Future] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def to_dict(self) -> Dict[str, Any]:
+        queue_ms = None
+        latency_ms = None
+        if self.started_at is not None:
+            queue_ms = round((self.started_at - self.enqueued_at) * 1000, 1)
+        if self.finished_at is not None:
+            latency_ms = round((self.finished_at - self.enqueued_at) * 1000, 1)
+        return {
+            "id": self.id,
+            "ticket_id": self.ticket_id,
+            "user_message_id": self.user_message_id,
+            "status": self.status,
+            "bot_message": self.bot_message,
+            "error": self.error,
+            "queue_ms": queue_ms,
+            "latency_ms": latency_ms,
+        }
+
+
+class BotWorkerPool:
+    """
+    Pool acotado de workers que generan las respuestas del bot fuera del request.
+
+    El request solo guarda el mensaje del usuario y encola el job; el worker
+    genera la respuesta con generate_bot_reply (sin conexión de BD tomada
+    durante la llamada al LLM).
+    """
+
+    def __init__(self, max_workers: int = BOT_WORKERS, max_queue: int = BOT_QUEUE_SIZE):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bot-worker")
+        # Lugares disponibles = workers + cola; si no hay lugar el job se rechaza
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[UUID, BotJob]" = OrderedDict()
+        self._pending = 0
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._queue_waits = deque(maxlen=LATENCY_WINDOW)
+
+    def submit(self, ticket_id: UUID, user_message_id: UUID) -> BotJob:
+        """Encolar la generación de la respuesta para un mensaje del usuario"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise QueueFullError("La cola de generación del bot está llena")
+
+        job = BotJob(ticket_id, user_message_id)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._pending += 1
+            self._evict_finished()
+
+        try:
+            job.future = self._executor.submit(self._run, job)
+        except RuntimeError:
+            # El executor ya se apagó
+            with self._lock:
+                self._pending -= 1
+                self._jobs.pop(job.id, None)
+            self._slots.release()
+            raise QueueFullError("El pool de generación está detenido")
+        return job
+
+    def get(self, job_id: UUID) -> Optional[BotJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """Profundidad de cola y latencias de los jobs"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            queue_waits = sorted(self._queue_waits)
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queue_depth": self._pending,
+                "running": self._running,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "coalesced": generation_flight.stats()["coalesced"],
+                "latency_ms_p50": _percentile(latencies, 0.50),
+                "latency_ms_p95": _percentile(latencies, 0.95),
+                "queue_wait_ms_p50": _percentile(queue_waits, 0.50),
+                "queue_wait_ms_p95": _percentile(queue_waits, 0.95),
+            }
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job: BotJob):
+        job.started_at = time.monotonic()
+        with self._lock:
+            self._pending -= 1
+            self._running += 1
+            self._queue_waits.append((job.started_at - job.enqueued_at) * 1000)
+        job.status = "running"
+
+        try:
+            job.bot_message = generate_bot_reply(job.ticket_id, job.user_message_id)
+            job.status = "done"
+        except Exception as e:
+            logger.error(f"❌ Error al generar respuesta del bot (ticket {job.ticket_id}): {e}")
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.monotonic()
+            with self._lock:
+                self._running -= 1
+                if job.status == "done":
+                    self._completed += 1
+                else:
+                    self._failed += 1
+                self._latencies.append((job.finished_at - job.enqueued_at) * 1000)
+            self._slots.release()
+        return job
+
+    def _evict_finished(self):
+        # Llamar con self._lock tomado
+        while len(self._jobs) > MAX_TRACKED_JOBS:
+            oldest_id, oldest = next(iter(self._jobs.items()))
+            if not oldest.done:
+                break
+            self._jobs.pop(oldest_id)
+
+
+def _percentile(values, q: float) -> Optional[float]:
+    if not values:
+        return None
+    index = min(len(values) - 1, int(round(q * (len(values) - 1))))
+    return round(values[index], 1)
+
+
+bot_workers = BotWorkerPool()
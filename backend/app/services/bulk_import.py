@@ -0,0 +1,384 @@
+"""
+Importación masiva de conversaciones a tickets / messages con COPY.
+
+Formatos que ya producimos:
+  conversations  JSONL del workbench (baseline_conversations.jsonl,
+                 proposed_conversations.jsonl): {meta, transcript, outcomes}
+  messages       CSV con id,ticket_id,content,is_bot,sender_name,created_at (m.csv)
+  meta           CSV con conversation_id,context,customer_issue,resolved,summary...
+                 (conversations_meta.csv)
+
+El archivo se lee en streaming y se escribe por lotes: COPY a tablas
+temporales de staging y un upsert hacia las tablas reales, un commit por
+lote. Las tablas de staging se crean dentro de la transacción de cada lote
+(ON COMMIT DROP): detrás del pooler de Supabase en modo transacción
+(DB_PGBOUNCER) cada transacción puede caer en otra conexión del servidor. Los ids son estables (el UUID original o un uuid5 del identificador),
+así que reimportar el mismo archivo actualiza en vez de duplicar. Los mensajes de un ticket que no existe crean un ticket provisional
+que la importación del CSV de meta completa después.
+
+Los contadores del dashboard los mantienen los triggers de sentencia
+(migración 0003); chatbot_metrics se recalcula al final solo para los
+tickets importados.
+
+Uso (desde backend/):
+    python -m app.services.bulk_import "app/conversations_meta (4).csv" app/m.csv --owner-id <uuid>
+    python -m app.services.bulk_import baseline_conversations.jsonl --owner-id <uuid> --batch-size 100000
+"""
+import io
+import os
+import csv
+import json
+import time
+import uuid
+import logging
+import argparse
+from datetime import datetime, timezone
+from typing import Any, Dict, IO, Iterable, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+from .. import crud
+from ..database import engine, SessionLocal
+from .ticket_stats import ticket_stats_cache
+
+logger = logging.getLogger(__name__)
+
+IMPORT_FORMATS = ("conversations", "messages", "meta")
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "50000"))
+# Espacio de nombres de los uuid5: no cambiarlo o se pierde la estabilidad de los ids
+IMPORT_NAMESPACE = UUID("6f1c7a52-9a0e-4c55-8f5b-3d2e7b1a9c40")
+PLACEHOLDER_TITLE = "Conversación importada"
+PLACEHOLDER_CATEGORY = "importado"
+
+TICKET_COLUMNS = ("id", "title", "category", "description", "status", "created_at")
+MESSAGE_COLUMNS = ("id", "ticket_id", "content", "is_bot", "sender_name", "created_at")
+
+# Se crean en la misma transacción que las usa
+STAGING_TICKETS_SQL = """
+    CREATE TEMP TABLE import_tickets (
+        id UUID, title TEXT, category TEXT, description TEXT, status TEXT, created_at TIMESTAMP
+    ) ON COMMIT DROP
+"""
+STAGING_MESSAGES_SQL = """
+    CREATE TEMP TABLE import_messages (
+        id UUID, ticket_id UUID, content TEXT, is_bot BOOLEAN, sender_name TEXT, created_at TIMESTAMP
+    ) ON COMMIT DROP
+"""
+
+# DISTINCT ON: si el lote trae el mismo id dos veces gana la última fila.
+# IS DISTINCT FROM evita reescribir filas idénticas al reimportar.
+# RETURNING: dueños de los tickets escritos (un ticket existente conserva el
+# suyo), para invalidar sus conteos en caché.
+UPSERT_TICKETS_SQL = """
+    INSERT INTO tickets AS t (id, user_id, title, category, description, status, created_at, updated_at)
+    SELECT DISTINCT ON (id) id, %(owner_id)s::uuid, left(title, 255), left(category, 100), description, status,
+           COALESCE(created_at, now()), COALESCE(created_at, now())
+    FROM import_tickets
+    ORDER BY id, ctid DESC
+    ON CONFLICT (id) DO UPDATE SET
+        title = EXCLUDED.title,
+        category = EXCLUDED.category,
+        description = EXCLUDED.description,
+        status = EXCLUDED.status
+    WHERE (t.title, t.category, t.description, t.status)
+          IS DISTINCT FROM (EXCLUDED.title, EXCLUDED.category, EXCLUDED.description, EXCLUDED.status)
+    RETURNING t.user_id
+"""
+
+PLACEHOLDER_TICKETS_SQL = """
+    INSERT INTO tickets (id, user_id, title, category, description, status, created_at, updated_at)
+    SELECT ticket_id, %(owner_id)s::uuid, %(title)s, %(category)s, '', 'open',
+           COALESCE(MIN(created_at), now()), COALESCE(MIN(created_at), now())
+    FROM import_messages
+    GROUP BY ticket_id
+    ON CONFLICT (id) DO NOTHING
+"""
+
+# messages está particionada por created_at (migración 0006) y no tiene un
+# índice único solo sobre id, así que no admite ON CONFLICT (id): se actualizan
+# los ids existentes y se insertan los que faltan. Si un mensaje cambia de
+# created_at, Postgres lo mueve a la partición de su mes.
+UPSERT_MESSAGES_SQL = """
+    WITH incoming AS (
+        SELECT DISTINCT ON (id) id, ticket_id, content, is_bot, left(sender_name, 255) AS sender_name, created_at
+        FROM import_messages
+        ORDER BY id, ctid DESC
+    ),
+    updated AS (
+        UPDATE messages AS m SET
+            ticket_id = i.ticket_id,
+            content = i.content,
+            is_bot = i.is_bot,
+            sender_name = i.sender_name,
+            created_at = COALESCE(i.created_at, m.created_at)
+        FROM incoming i
+        WHERE m.id = i.id
+          AND (m.ticket_id, m.content, m.is_bot, m.sender_name, m.created_at)
+              IS DISTINCT FROM (i.ticket_id, i.content, i.is_bot, i.sender_name, COALESCE(i.created_at, m.created_at))
+    )
+    INSERT INTO messages (id, ticket_id, content, is_bot, sender_name, created_at)
+    SELECT id, ticket_id, content, is_bot, sender_name, COALESCE(created_at, now())
+    FROM incoming i
+    WHERE NOT EXISTS (SELECT 1 FROM messages m WHERE m.id = i.id)
+"""
+
+
+def stable_id(kind: str, value: Any) -> UUID:
+    """El UUID original si lo es; si no, un uuid5 determinista del identificador"""
+    try:
+        return UUID(str(value))
+    except ValueError:
+        return uuid.uuid5(IMPORT_NAMESPACE, f"{kind}:{value}")
+
+
+def _parse_timestamp(value: Any) -> Optional[datetime]:
+    """ISO 8601 / 'YYYY-MM-DD HH:MM:SS' a UTC naive (como guarda la app); None si no se puede"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _parse_bool(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("true", "t", "1", "yes", "si", "sí")
+
+
+def _ticket_status(resolved: Any) -> str:
+    return "resolved" if _parse_bool(resolved) else "open"
+
+
+def read_conversations(lines: Iterable[str]) -> Iterator[Tuple[str, tuple]]:
+    """Tickets y mensajes del JSONL del workbench ({meta, transcript, outcomes})"""
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            conversation = json.loads(line)
+        except json.JSONDecodeError:
+            logger.warning(f"⚠️ Línea {number} no es JSON válido; se omite")
+            continue
+        meta = conversation.get("meta") or {}
+        outcomes = conversation.get("outcomes") or {}
+        transcript = conversation.get("transcript") or []
+        conversation_id = meta.get("conversation_id") or f"line-{number}"
+        ticket_id = stable_id("ticket", conversation_id)
+        issue = meta.get("customer_issue") or ""
+        timestamps = [_parse_timestamp(turn.get("timestamp")) for turn in transcript]
+
+        yield "ticket", (
+            ticket_id,
+            issue or f"Conversación {conversation_id}",
+            meta.get("context") or PLACEHOLDER_CATEGORY,
+            outcomes.get("summary") or issue,
+            _ticket_status(meta.get("resolved", False)),
+            next((ts for ts in timestamps if ts), None),
+        )
+        for index, (turn, created_at) in enumerate(zip(transcript, timestamps), start=1):
+            speaker = turn.get("speaker") or "cliente"
+            yield "message", (
+                stable_id("message", f"{ticket_id}:{turn.get('turn') or index}"),
+                ticket_id,
+                turn.get("text") or "",
+                speaker == "agente",
+                speaker,
+                created_at,
+            )
+
+
+def read_messages_csv(rows: Iterable[Dict[str, str]]) -> Iterator[Tuple[str, tuple]]:
+    """Mensajes del CSV con las columnas de la tabla messages (m.csv)"""
+    for row in rows:
+        ticket_id = stable_id("ticket", row["ticket_id"])
+        yield "message", (
+            stable_id("message", row.get("id") or f"{ticket_id}:{row.get('created_at')}:{row.get('content')}"),
+            ticket_id,
+            row.get("content") or "",
+            _parse_bool(row.get("is_bot")),
+            row.get("sender_name") or None,
+            _parse_timestamp(row.get("created_at")),
+        )
+
+
+def read_meta_csv(rows: Iterable[Dict[str, str]]) -> Iterator[Tuple[str, tuple]]:
+    """Tickets del CSV de metadatos de conversaciones (conversations_meta.csv)"""
+    for row in rows:
+        issue = row.get("customer_issue") or ""
+        yield "ticket", (
+            stable_id("ticket", row["conversation_id"]),
+            issue or f"Conversación {row['conversation_id']}",
+            row.get("context") or PLACEHOLDER_CATEGORY,
+            row.get("summary") or issue,
+            _ticket_status(row.get("resolved")),
+            None,
+        )
+
+
+def detect_format(name: str, first_line: str) -> str:
+    if name.endswith(".jsonl") or first_line.lstrip().startswith("{"):
+        return "conversations"
+    header = {column.strip() for column in first_line.split(",")}
+    if "conversation_id" in header:
+        return "meta"
+    if {"ticket_id", "content"} <= header:
+        return "messages"
+    raise ValueError(f"No se reconoce el formato de {name}")
+
+
+def read_records(stream: IO[str], fmt: str) -> Iterator[Tuple[str, tuple]]:
+    if fmt == "conversations":
+        return read_conversations(stream)
+    reader = csv.DictReader(stream)
+    if fmt == "meta":
+        return read_meta_csv(reader)
+    return read_messages_csv(reader)
+
+
+def _csv_value(value: Any) -> str:
+    """NULL como campo vacío sin comillas; todo lo demás entre comillas (textos vacíos incluidos)"""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def _copy_rows(cursor, table: str, columns: Tuple[str, ...], rows: List[tuple]):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(",".join(_csv_value(value) for value in row))
+        buffer.write("\n")
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+class ImportResult:
+    def __init__(self):
+        self.files: List[str] = []
+        self.tickets = 0
+        self.messages = 0
+        self.batches = 0
+        self.metrics_updated = 0
+        self.elapsed_seconds = 0.0
+        self.ticket_ids = set()
+        self.owner_ids = set()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "files": self.files,
+            "tickets": self.tickets,
+            "messages": self.messages,
+            "batches": self.batches,
+            "metrics_updated": self.metrics_updated,
+            "elapsed_seconds": round(self.elapsed_seconds, 2),
+            "rows_per_second": round((self.tickets + self.messages) / self.elapsed_seconds, 1)
+            if self.elapsed_seconds else 0.0,
+        }
+
+
+class BulkImporter:
+    """Carga uno o más archivos en una sola conexión, un commit por lote"""
+
+    def __init__(self, owner_id: UUID, batch_size: int = IMPORT_BATCH_SIZE):
+        self.owner_id = owner_id
+        self.batch_size = batch_size
+
+    def _flush(self, conn, cursor, tickets: List[tuple], messages: List[tuple], result: ImportResult):
+        params = {"owner_id": str(self.owner_id), "title": PLACEHOLDER_TITLE, "category": PLACEHOLDER_CATEGORY}
+        if tickets:
+            cursor.execute(STAGING_TICKETS_SQL)
+            _copy_rows(cursor, "import_tickets", TICKET_COLUMNS, tickets)
+            cursor.execute(UPSERT_TICKETS_SQL, params)
+            result.owner_ids.update(UUID(str(row[0])) for row in cursor.fetchall())
+        if messages:
+            cursor.execute(STAGING_MESSAGES_SQL)
+            _copy_rows(cursor, "import_messages", MESSAGE_COLUMNS, messages)
+            cursor.execute(PLACEHOLDER_TICKETS_SQL, params)
+            cursor.execute(UPSERT_MESSAGES_SQL, params)
+        conn.commit()
+        result.tickets += len(tickets)
+        result.messages += len(messages)
+        result.batches += 1
+        result.ticket_ids.update(row[0] for row in tickets)
+        result.ticket_ids.update(row[1] for row in messages)
+        logger.info(f"🔵 Importación: {result.tickets} tickets, {result.messages} mensajes")
+
+    def import_streams(self, sources: List[Tuple[str, IO[str], Optional[str]]],
+                       update_metrics: bool = True) -> ImportResult:
+        """
+        Importar (nombre, stream de texto, formato o None para detectarlo).
+        Los tickets de un lote se escriben antes que sus mensajes.
+        """
+        result = ImportResult()
+        started = time.monotonic()
+        conn = engine.raw_connection()
+        try:
+            with conn.cursor() as cursor:
+                for name, stream, fmt in sources:
+                    first_line = stream.readline()
+                    fmt = fmt or detect_format(name, first_line)
+                    stream = _prepend(first_line, stream)
+                    result.files.append(f"{name} ({fmt})")
+                    tickets, messages = [], []
+                    for kind, row in read_records(stream, fmt):
+                        (tickets if kind == "ticket" else messages).append(row)
+                        if len(tickets) + len(messages) >= self.batch_size:
+                            self._flush(conn, cursor, tickets, messages, result)
+                            tickets, messages = [], []
+                    if tickets or messages:
+                        self._flush(conn, cursor, tickets, messages, result)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+            # También si falló a medias: los lotes anteriores ya se confirmaron
+            for owner_id in result.owner_ids | {self.owner_id}:
+                ticket_stats_cache.invalidate(owner_id)
+        if update_metrics and result.ticket_ids:
+            db = SessionLocal()
+            try:
+                result.metrics_updated = crud.backfill_chatbot_metrics(db, list(result.ticket_ids))
+            finally:
+                db.close()
+        result.elapsed_seconds = time.monotonic() - started
+        logger.info(f"✅ Importación terminada: {result.to_dict()}")
+        return result
+
+
+def _prepend(first_line: str, stream: IO[str]) -> Iterator[str]:
+    """El stream con la línea ya leída para detectar el formato de vuelta al inicio"""
+    if first_line:
+        yield first_line
+    yield from stream
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Importar conversaciones a tickets/messages con COPY")
+    parser.add_argument("files", nargs="+", help="Archivos .jsonl / .csv (en este orden)")
+    parser.add_argument("--owner-id", type=UUID, required=True, help="Usuario dueño de los tickets importados")
+    parser.add_argument("--format", choices=IMPORT_FORMATS, help="Forzar el formato (por defecto se detecta)")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    parser.add_argument("--skip-metrics", action="store_true", help="No recalcular chatbot_metrics al final")
+    args = parser.parse_args()
+
+    handles = [open(path, encoding="utf-8-sig", newline="") for path in args.files]
+    try:
+        result = BulkImporter(args.owner_id, args.batch_size).import_streams(
+            [(path, handle, args.format) for path, handle in zip(args.files, handles)],
+            update_metrics=not args.skip_metrics,
+        )
+    finally:
+        for handle in handles:
+            handle.close()
+    print(f"✅ {result.to_dict()}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
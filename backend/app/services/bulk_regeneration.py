@@ -0,0 +1,238 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import List, Optional, Dict, Any, Tuple
+from uuid import UUID
+
+from .. import crud, schemas
+from ..database import SessionLocal
+from .chatbot import ChatbotService, FALLBACK_RESPONSE
+from .context import prepare_context
+from .bot_reply import BOT_SENDER_NAME
+from .single_flight import generation_flight
+
+logger = logging.getLogger(__name__)
+
+BULK_DEFAULT_CONCURRENCY = int(os.getenv("BULK_REGEN_CONCURRENCY", "8"))
+BULK_MAX_CONCURRENCY = 32
+BULK_MAX_TICKETS = 5000
+# Respuestas generadas que se guardan juntas (un UPDATE, un INSERT y un commit)
+BULK_SAVE_BATCH = int(os.getenv("BULK_REGEN_SAVE_BATCH", "50"))
+# Respuestas que se conservan para revisar en modo dry_run
+MAX_PREVIEWS = 200
+MAX_TRACKED_JOBS = 50
+
+
+class BulkRegenerationJob:
+    """Regeneración masiva de respuestas del bot para un conjunto de tickets"""
+
+    def __init__(self, filters: Dict[str, Any], concurrency: int, dry_run: bool):
+        self.id = uuid.uuid4()
+        self.filters = filters
+        self.concurrency = concurrency
+        self.dry_run = dry_run
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+        self.skipped = 0
+        self.saved = 0
+        self.previews: List[Dict[str, Any]] = []
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            elapsed = None
+            throughput = None
+            if self.started_at is not None:
+                elapsed = (self.finished_at or time.monotonic()) - self.started_at
+                processed = self.done + self.failed + self.skipped
+                throughput = round(processed / elapsed, 2) if elapsed > 0 else None
+            return {
+                "id": self.id,
+                "status": self.status,
+                "dry_run": self.dry_run,
+                "concurrency": self.concurrency,
+                "filters": self.filters,
+                "total": self.total,
+                "done": self.done,
+                "failed": self.failed,
+                "skipped": self.skipped,
+                "saved": self.saved,
+                "elapsed_seconds": round(elapsed, 2) if elapsed is not None else None,
+                "tickets_per_second": throughput,
+                "error": self.error,
+                "previews": list(self.previews),
+                "created_at": self.created_at,
+            }
+
+
+class BulkRegenerator:
+    """
+    Regenera (o previsualiza) la respuesta del bot al último mensaje del
+    usuario en muchos tickets a la vez, con concurrencia acotada hacia el LLM.
+    Cada job corre en su propio hilo y su progreso se consulta por id.
+
+    Las respuestas se guardan por lotes de BULK_SAVE_BATCH: la nueva reemplaza
+    a la que ya tenía el turno (o se agrega si no había) con los locks
+    single-flight de todo el lote tomados, los mismos que usa la generación en
+    vivo, así que nunca quedan dos respuestas del bot para un mismo mensaje.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[UUID, BulkRegenerationJob]" = OrderedDict()
+
+    def start(self, request: schemas.BulkRegenerateRequest) -> BulkRegenerationJob:
+        concurrency = max(1, min(request.concurrency or BULK_DEFAULT_CONCURRENCY, BULK_MAX_CONCURRENCY))
+        filters = request.model_dump(exclude={"concurrency", "dry_run"}, mode="json")
+        job = BulkRegenerationJob(filters, concurrency, request.dry_run)
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > MAX_TRACKED_JOBS:
+                oldest_id, oldest = next(iter(self._jobs.items()))
+                if not oldest.finished:
+                    break
+                self._jobs.pop(oldest_id)
+
+        threading.Thread(
+            target=self._run, args=(job, request), name=f"bulk-regen-{job.id}", daemon=True
+        ).start()
+        return job
+
+    def get(self, job_id: UUID) -> Optional[BulkRegenerationJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job: BulkRegenerationJob, request: schemas.BulkRegenerateRequest):
+        job.started_at = time.monotonic()
+        job.status = "running"
+        try:
+            db = SessionLocal()
+            try:
+                tickets = crud.get_tickets_for_regeneration(
+                    db,
+                    statuses=request.statuses,
+                    category=request.category,
+                    created_after=request.created_after,
+                    created_before=request.created_before,
+                    ticket_ids=request.ticket_ids,
+                    limit=min(request.limit, BULK_MAX_TICKETS),
+                )
+            finally:
+                db.close()
+            job.total = len(tickets)
+            logger.info(f"🔵 Regeneración masiva {job.id}: {job.total} tickets, concurrencia {job.concurrency}")
+
+            pending: List[Tuple[Any, schemas.MessageCreate]] = []
+            with ThreadPoolExecutor(max_workers=job.concurrency, thread_name_prefix="bulk-regen") as executor:
+                futures = {executor.submit(_regenerate_one, ticket): ticket for ticket in tickets}
+                for future in as_completed(futures):
+                    ticket = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logger.error(f"❌ Error regenerando ticket {ticket.id}: {e}")
+                        with job._lock:
+                            job.failed += 1
+                        continue
+
+                    with job._lock:
+                        if result is None:
+                            job.skipped += 1
+                            continue
+                        job.done += 1
+                        user_message = result.pop("message")
+                        if job.dry_run:
+                            if len(job.previews) < MAX_PREVIEWS:
+                                job.previews.append(result)
+                            continue
+
+                    pending.append((user_message, schemas.MessageCreate(
+                        ticket_id=ticket.id,
+                        content=result["bot_response"],
+                        is_bot=True,
+                        sender_name=BOT_SENDER_NAME
+                    )))
+                    if len(pending) >= BULK_SAVE_BATCH:
+                        self._save(job, pending)
+                        pending = []
+            self._save(job, pending)
+            job.status = "done"
+        except Exception as e:
+            logger.error(f"❌ Error en la regeneración masiva {job.id}: {e}")
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.monotonic()
+            logger.info(f"✅ Regeneración masiva {job.id}: {job.to_dict()['tickets_per_second']} tickets/s")
+
+    def _save(self, job: BulkRegenerationJob, replies: List[Tuple[Any, schemas.MessageCreate]]):
+        if not replies:
+            return
+        try:
+            # Mismos locks que generate_bot_reply: si algún turno se está
+            # respondiendo en vivo se espera a que termine y se reemplaza esa respuesta
+            with generation_flight.lock_many(f"{reply.ticket_id}:{message.id}" for message, reply in replies):
+                db = SessionLocal()
+                try:
+                    crud.save_bot_replies(db, replies)
+                finally:
+                    db.close()
+        except Exception as e:
+            logger.error(f"❌ Error guardando {len(replies)} respuestas regeneradas: {e}")
+            with job._lock:
+                job.done -= len(replies)
+                job.failed += len(replies)
+            return
+        with job._lock:
+            job.saved += len(replies)
+
+
+def _regenerate_one(ticket) -> Optional[Dict[str, Any]]:
+    """Nueva respuesta al último mensaje del usuario del ticket (None si no hay)"""
+    db = SessionLocal()
+    try:
+        recent = crud.get_recent_messages(db, ticket.id)
+        user_message = next((m for m in reversed(recent) if not m.is_bot), None)
+        if user_message is None:
+            return None
+        context = prepare_context(db, ticket.id, before_message=user_message)
+    finally:
+        db.close()
+
+    # Sin caché ni FAQ (ni se leen ni se escriben): el objetivo es ver la
+    # respuesta del prompt actual
+    bot_response = ChatbotService.generate_response(
+        user_message=user_message.content,
+        conversation_history=context.history,
+        ticket_category=ticket.category,
+        ticket_description=ticket.description,
+        conversation_summary=context.summary,
+        use_cache=False
+    )
+    if bot_response == FALLBACK_RESPONSE:
+        raise RuntimeError("El LLM no respondió (respuesta de respaldo)")
+    return {
+        "ticket_id": str(ticket.id),
+        "user_message_id": str(user_message.id),
+        "user_message": user_message.content,
+        "bot_response": bot_response,
+        "message": user_message,
+    }
+
+
+bulk_regenerator = BulkRegenerator()
@@ -1,11 +1,13 @@
-import os
-from openai import OpenAI
-from typing import List, Dict
-from dotenv import load_dotenv
+import time
+from typing import List, Dict, Iterator
+from .llm_client import llm_client
+from .response_cache import response_cache, RESPONSE_CACHE_ENABLED
+from .faq_index import faq_index
+from .model_routing import route, routing_metrics, TIERS
+from .tokens import count_tokens, pack_history, CONTEXT_TOKEN_BUDGET
 
-load_dotenv()
-
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Respuesta de fallback si OpenAI falla
+FALLBACK_RESPONSE = "Disculpa, estoy teniendo problemas técnicos en este momento. Un agente humano revisará tu caso y te responderá pronto. ¿Hay algo más en lo que pueda ayudarte?"
 
 class ChatbotService:
     """Servicio para manejar conversaciones con OpenAI"""
@@ -43,7 +45,9 @@ IMPORTANTE: Mantén las respuestas breves y al punto. Los clientes valoran la ef
         user_message: str,
         conversation_history: List[Dict[str, str]],
         ticket_category: str = "",
-        ticket_description: str = ""
+        ticket_description: str = "",
+        conversation_summary: str = "",
+        use_cache: bool = True
     ) -> str:
         """
         Genera una respuesta del chatbot usando OpenAI
@@ -53,44 +57,204 @@ IMPORTANTE: Mantén las respuestas breves y al punto. Los clientes valoran la ef
             conversation_history: Historial previo (lista de {"role": "user/assistant", "content": "..."})
             ticket_category: Categoría del ticket
             ticket_description: Descripción inicial del problema
+            conversation_summary: Resumen acumulado de los turnos más antiguos
+            use_cache: Con False siempre se llama al LLM y no se escribe en caché
+                (p. ej. al regenerar tras cambiar el prompt)
         
         Returns:
             Respuesta del chatbot
         """
         try:
-            # Construir el contexto del ticket
-            context = ""
-            if ticket_category and ticket_description:
-                context = f"\n\nContexto del ticket:\nCategoría: {ticket_category}\nDescripción: {ticket_description}"
+            # Buscar en caché (exacto o semántico) antes de llamar al LLM
+            if RESPONSE_CACHE_ENABLED and use_cache:
+                cached = response_cache.get(
+                    ticket_category, user_message, conversation_history, ticket_description, conversation_summary
+                )
+                if cached is not None:
+                    return cached
             
-            # Construir mensajes para OpenAI
-            messages = [
-                {"role": "system", "content": ChatbotService.get_system_prompt() + context}
-            ]
+            # Preguntas frecuentes ya resueltas y bien calificadas: sin LLM
+            if use_cache:
+                faq_answer = faq_index.lookup(ticket_category, user_message, conversation_history)
+                if faq_answer is not None:
+                    return faq_answer
             
-            # Agregar historial de conversación (últimos 10 mensajes para no exceder tokens)
-            messages.extend(conversation_history[-10:])
+            messages = ChatbotService.build_messages(
+                user_message, conversation_history, ticket_category, ticket_description, conversation_summary
+            )
             
-            # Agregar el nuevo mensaje del usuario
-            messages.append({"role": "user", "content": user_message})
+            # Elegir modelo según intent/complejidad del turno
+            tier = route(user_message, conversation_history, ticket_category).tier
             
-            # Llamar a OpenAI
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",  # O "gpt-4" si tienes acceso
-                messages=messages,
-                temperature=0.7,
-                max_tokens=500,
-                top_p=0.9,
-                frequency_penalty=0.5,
-                presence_penalty=0.3
-            )
+            # Llamar a OpenAI (deadline, reintentos y circuit breaker en llm_client)
+            started = time.monotonic()
+            try:
+                bot_response = llm_client.complete(
+                    messages,
+                    model=tier.model,
+                    timeout=tier.timeout_seconds,
+                    temperature=0.7,
+                    max_tokens=tier.max_tokens,
+                    top_p=0.9,
+                    frequency_penalty=0.5,
+                    presence_penalty=0.3
+                )
+            except Exception:
+                routing_metrics.record(tier, time.monotonic() - started, ok=False)
+                raise
+            routing_metrics.record(tier, time.monotonic() - started, ok=True)
+            
+            if RESPONSE_CACHE_ENABLED and use_cache:
+                response_cache.put(
+                    ticket_category, user_message, conversation_history, bot_response,
+                    ticket_description, conversation_summary
+                )
             
-            return response.choices[0].message.content.strip()
+            return bot_response
             
         except Exception as e:
             print(f"Error al generar respuesta con OpenAI: {e}")
             # Respuesta de fallback si OpenAI falla
-            return "Disculpa, estoy teniendo problemas técnicos en este momento. Un agente humano revisará tu caso y te responderá pronto. ¿Hay algo más en lo que pueda ayudarte?"
+            return FALLBACK_RESPONSE
+
+    @staticmethod
+    def stream_response(
+        user_message: str,
+        conversation_history: List[Dict[str, str]],
+        ticket_category: str = "",
+        ticket_description: str = "",
+        conversation_summary: str = ""
+    ) -> Iterator[str]:
+        """
+        Genera la respuesta del chatbot token por token (stream de OpenAI)
+        
+        Args:
+            user_message: Mensaje del usuario
+            conversation_history: Historial previo (lista de {"role": "user/assistant", "content": "..."})
+            ticket_category: Categoría del ticket
+            ticket_description: Descripción inicial del problema
+            conversation_summary: Resumen acumulado de los turnos más antiguos
+        
+        Yields:
+            Fragmentos de texto conforme el modelo los produce
+        
+        Raises:
+            La excepción de OpenAI si el stream falla (antes o a mitad de la respuesta)
+        """
+        if RESPONSE_CACHE_ENABLED:
+            cached = response_cache.get(
+                ticket_category, user_message, conversation_history, ticket_description, conversation_summary
+            )
+            if cached is not None:
+                yield cached
+                return
+        
+        faq_answer = faq_index.lookup(ticket_category, user_message, conversation_history)
+        if faq_answer is not None:
+            yield faq_answer
+            return
+        
+        messages = ChatbotService.build_messages(
+            user_message, conversation_history, ticket_category, ticket_description, conversation_summary
+        )
+        
+        tier = route(user_message, conversation_history, ticket_category).tier
+        started = time.monotonic()
+        
+        tokens = []
+        try:
+            for token in llm_client.stream(
+                messages,
+                model=tier.model,
+                timeout=tier.timeout_seconds,
+                temperature=0.7,
+                max_tokens=tier.max_tokens,
+                top_p=0.9,
+                frequency_penalty=0.5,
+                presence_penalty=0.3
+            ):
+                tokens.append(token)
+                yield token
+        except Exception as e:
+            print(f"Error en stream con OpenAI: {e}")
+            routing_metrics.record(tier, time.monotonic() - started, ok=False)
+            # Sin fallback: el llamador avisa del error y no guarda nada
+            raise
+        
+        routing_metrics.record(tier, time.monotonic() - started, ok=True)
+        
+        if RESPONSE_CACHE_ENABLED and tokens:
+            response_cache.put(
+                ticket_category, user_message, conversation_history, "".join(tokens).strip(),
+                ticket_description, conversation_summary
+            )
+
+    @staticmethod
+    def build_messages(
+        user_message: str,
+        conversation_history: List[Dict[str, str]],
+        ticket_category: str = "",
+        ticket_description: str = "",
+        conversation_summary: str = ""
+    ) -> List[Dict[str, str]]:
+        """
+        Construye la lista de mensajes (system + historial + usuario) para OpenAI
+        """
+        # Construir el contexto del ticket
+        context = ""
+        if ticket_category and ticket_description:
+            context = f"\n\nContexto del ticket:\nCategoría: {ticket_category}\nDescripción: {ticket_description}"
+        if conversation_summary:
+            context += f"\n\nResumen de la conversación previa:\n{conversation_summary}"
+        
+        # Construir mensajes para OpenAI
+        messages = [
+            {"role": "system", "content": ChatbotService.get_system_prompt() + context}
+        ]
+        
+        # Agregar historial de conversación (los más recientes que caben en el presupuesto de tokens)
+        _, packed_history = pack_history(
+            conversation_history, CONTEXT_TOKEN_BUDGET - count_tokens(conversation_summary)
+        )
+        messages.extend(packed_history)
+        
+        # Agregar el nuevo mensaje del usuario
+        messages.append({"role": "user", "content": user_message})
+        
+        return messages
+
+    @staticmethod
+    def summarize_conversation(previous_summary: str, conversation: List[Dict[str, str]]) -> str:
+        """
+        Integra turnos antiguos al resumen acumulado del ticket
+        
+        Args:
+            previous_summary: Resumen guardado hasta ahora (puede estar vacío)
+            conversation: Turnos a integrar en formato OpenAI
+        
+        Returns:
+            Resumen actualizado
+        """
+        transcript = "\n".join(
+            f"{'Asistente' if m['role'] == 'assistant' else 'Cliente'}: {m['content']}"
+            for m in conversation
+        )
+        prompt = f"""Actualiza el resumen de una conversación de soporte de Kavak.
+
+Resumen actual:
+{previous_summary or "(vacío)"}
+
+Nuevos turnos:
+{transcript}
+
+Escribe el resumen actualizado en español, en máximo 8 viñetas breves. Conserva SIEMPRE los datos concretos: placas, folios, números de orden, montos, fechas, modelos de auto, nombres y acuerdos o pendientes."""
+        
+        return llm_client.complete(
+            [{"role": "user", "content": prompt}],
+            model=TIERS["simple"].model,
+            temperature=0.2,
+            max_tokens=300
+        )
 
     @staticmethod
     def format_conversation_history(messages: List) -> List[Dict[str, str]]:
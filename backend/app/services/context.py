@@ -0,0 +1,91 @@
+import os
+import logging
+from typing import List, Dict, NamedTuple
+from uuid import UUID
+from sqlalchemy.orm import Session
+
+from .. import crud
+from ..database import SessionLocal
+from .chatbot import ChatbotService
+from .history import HistoryMessage, HISTORY_WINDOW
+from .tokens import count_tokens, pack_history, CONTEXT_TOKEN_BUDGET
+
+logger = logging.getLogger(__name__)
+
+# Al resumir se deja el historial en esta fracción del presupuesto, para no
+# tener que resumir de nuevo en cada turno
+SUMMARY_FOLD_TARGET = float(os.getenv("SUMMARY_FOLD_TARGET", "0.6"))
+# Máximo de mensajes anteriores a la ventana que se resumen en un turno; el
+# resto se integra en los turnos siguientes
+SUMMARY_FOLD_MAX_MESSAGES = int(os.getenv("SUMMARY_FOLD_MAX_MESSAGES", "200"))
+
+
+class ConversationContext(NamedTuple):
+    history: List[Dict[str, str]]      # turnos que caben en el presupuesto (formato OpenAI)
+    summary: str                       # resumen acumulado guardado
+    to_fold: List[HistoryMessage]      # turnos que se deben integrar al resumen
+
+
+def prepare_context(db: Session, ticket_id: UUID, before_message=None) -> ConversationContext:
+    """
+    Arma el contexto de un turno dentro del presupuesto de tokens:
+    resumen guardado + los turnos más recientes aún no resumidos.
+    Se integran al resumen los turnos que desbordan el presupuesto y los que
+    quedaron antes de la ventana de HISTORY_WINDOW mensajes sin resumirse.
+    """
+    messages = crud.get_message_history(db, ticket_id, before_message)
+    summary_row = crud.get_ticket_summary(db, ticket_id)
+    summary = summary_row.summary if summary_row else ""
+    summarized_until = summary_row.summarized_until if summary_row else None
+
+    # Ventana llena sin llegar a lo ya resumido: hay mensajes anteriores a la
+    # ventana que nunca entraron al resumen
+    gap = []
+    if len(messages) >= HISTORY_WINDOW and (
+        summarized_until is None or messages[0].created_at > summarized_until
+    ):
+        gap = crud.get_messages_between(
+            db, ticket_id, summarized_until, messages[0].created_at, SUMMARY_FOLD_MAX_MESSAGES
+        )
+
+    if summarized_until:
+        messages = [m for m in messages if m.created_at > summarized_until]
+
+    history = ChatbotService.format_conversation_history(messages)
+    budget = max(0, CONTEXT_TOKEN_BUDGET - count_tokens(summary))
+    overflow, kept = pack_history(history, budget)
+
+    if len(gap) >= SUMMARY_FOLD_MAX_MESSAGES:
+        # Quedan más mensajes viejos: se resumen primero, en orden
+        to_fold = gap
+    else:
+        to_fold = list(gap)
+        if overflow:
+            overflow, _ = pack_history(history, int(budget * SUMMARY_FOLD_TARGET))
+            to_fold += messages[:len(overflow)]
+
+    return ConversationContext(kept, summary, to_fold)
+
+
+def fold_summary(ticket_id: UUID, context: ConversationContext):
+    """Integrar los turnos desbordados al resumen del ticket y guardarlo"""
+    if not context.to_fold:
+        return
+    try:
+        new_summary = ChatbotService.summarize_conversation(
+            context.summary,
+            ChatbotService.format_conversation_history(context.to_fold)
+        )
+    except Exception as e:
+        logger.error(f"❌ Error al resumir la conversación (ticket {ticket_id}): {e}")
+        return
+
+    db = SessionLocal()
+    try:
+        crud.upsert_ticket_summary(
+            db, ticket_id, new_summary,
+            summarized_until=context.to_fold[-1].created_at,
+            folded_messages=len(context.to_fold)
+        )
+    finally:
+        db.close()
@@ -0,0 +1,67 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import List
+from openai import OpenAI
+from dotenv import load_dotenv
+
+try:
+    import numpy as np
+except ImportError:  # numpy viene con faiss-cpu
+    np = None
+
+load_dotenv()
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+
+# Memo de embeddings recientes (la misma pregunta se busca y luego se guarda)
+EMBEDDING_MEMO_SIZE = 512
+
+# Timeout corto: el embedding está en el camino de la respuesta
+_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), timeout=5.0, max_retries=1)
+_memo: "OrderedDict[str, object]" = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def embed_texts(texts: List[str]):
+    """
+    Obtiene embeddings normalizados (norma L2 = 1) para usar similitud coseno
+    con índices de producto interno de faiss.
+    
+    Returns:
+        np.ndarray float32 de forma (len(texts), dim)
+    """
+    if np is None:
+        raise RuntimeError("numpy no está instalado")
+    
+    vectors = [None] * len(texts)
+    missing = []
+    with _memo_lock:
+        for i, text in enumerate(texts):
+            cached = _memo.get(text)
+            if cached is not None:
+                _memo.move_to_end(text)
+                vectors[i] = cached
+            else:
+                missing.append(i)
+    
+    if missing:
+        response = _client.embeddings.create(
+            model=EMBEDDING_MODEL,
+            input=[texts[i] for i in missing]
+        )
+        with _memo_lock:
+            for i, item in zip(missing, response.data):
+                vector = np.asarray(item.embedding, dtype="float32")
+                vector /= (np.linalg.norm(vector) or 1.0)
+                vectors[i] = vector
+                _memo[texts[i]] = vector
+                while len(_memo) > EMBEDDING_MEMO_SIZE:
+                    _memo.popitem(last=False)
+    
+    return np.vstack(vectors).astype("float32")
+
+
+def embed_text(text: str):
+    """Embedding normalizado de un solo texto, forma (1, dim)"""
+    return embed_texts([text])
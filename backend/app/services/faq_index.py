@@ -0,0 +1,385 @@
+"""
+Índice de respuestas (FAQ) construido a partir de conversaciones resueltas y
+bien calificadas. Si un mensaje nuevo se parece lo suficiente a una pregunta
+indexada, ChatbotService responde desde el índice sin llamar al LLM.
+
+La respuesta se le da a otro cliente, así que se guarda una versión canónica:
+sin el nombre del saludo, y las que traen datos personales (correos,
+teléfonos, folios, el nombre del cliente, ligas con parámetros) no se indexan.
+
+Cada guardado escribe índice y entradas en un directorio de versión nuevo y
+después cambia de golpe el puntero CURRENT, así que ningún proceso lee un
+índice de una versión con las entradas de otra.
+
+Reconstrucción offline (desde backend/):
+    python -m app.services.faq_index --rebuild
+    python -m app.services.faq_index --rebuild --csv app/m.csv --meta "app/conversations_meta (4).csv"
+"""
+import os
+import re
+import csv
+import shutil
+import json
+import time
+import hashlib
+import logging
+import argparse
+import threading
+from pathlib import Path
+from typing import List, Dict, Optional, Any
+from uuid import UUID
+
+from .embeddings import embed_text, embed_texts
+from .response_cache import normalize_text
+
+try:
+    import faiss
+    import numpy as np
+except ImportError:
+    faiss = None
+    np = None
+
+logger = logging.getLogger(__name__)
+
+FAQ_ENABLED = os.getenv("FAQ_ENABLED", "1") == "1"
+FAQ_INDEX_DIR = Path(os.getenv("FAQ_INDEX_DIR", Path(__file__).resolve().parents[2] / "data" / "faq_index"))
+FAQ_THRESHOLD = float(os.getenv("FAQ_THRESHOLD", "0.93"))
+FAQ_MIN_RATING = int(os.getenv("FAQ_MIN_RATING", "4"))
+# Solo se responde desde el índice al inicio de la conversación
+FAQ_MAX_HISTORY = int(os.getenv("FAQ_MAX_HISTORY", "2"))
+# Cada cuánto se revisa si otro proceso guardó una versión nueva del índice
+FAQ_RELOAD_SECONDS = 30
+
+EMBED_BATCH_SIZE = 256
+SEARCH_K = 10
+# Versiones anteriores que se conservan (un lector puede estar cargando la previa)
+FAQ_KEEP_VERSIONS = 2
+
+# Saludo al inicio de la respuesta; le sigue el nombre del cliente ("Hola María, ...")
+GREETING_PATTERN = r"^(\W*(?:hola|buen[oa]s(?:\s+(?:d[ií]as|tardes|noches))?|estimad[oa]))"
+# Datos de un cliente en particular: la respuesta no se reutiliza
+PERSONAL_DATA_RE = re.compile(
+    r"[\w.+-]+@[\w-]+\.[\w.]+"            # correo
+    r"|\+?\d[\d\s().-]{7,}\d"             # teléfono / cuenta
+    r"|\b(?=[A-Z0-9]*\d)[A-Z0-9]{6,}\b"   # folios, placas, VIN
+    r"|https?://\S+\?\S+",                # ligas con parámetros (tokens)
+)
+
+
+class FAQIndex:
+    """Índice faiss (producto interno sobre embeddings normalizados) de pares pregunta/respuesta"""
+
+    def __init__(self, index_dir: Path = FAQ_INDEX_DIR, threshold: float = FAQ_THRESHOLD):
+        self.index_dir = Path(index_dir)
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._index = None
+        self._entries: List[Dict[str, Any]] = []
+        self._keys = set()
+        self._loaded_version = None
+        self._checked_at = None
+        self._lookups = 0
+        self._hits = 0
+
+    @property
+    def enabled(self) -> bool:
+        return FAQ_ENABLED and faiss is not None
+
+    # ------------------------------------------------------------------
+    # Consulta
+    # ------------------------------------------------------------------
+    def lookup(self, category: str, user_message: str, conversation_history: List[Dict[str, str]]) -> Optional[str]:
+        """Respuesta indexada para el mensaje, o None si no hay una con suficiente confianza"""
+        if not self.enabled or len(conversation_history) > FAQ_MAX_HISTORY:
+            return None
+        self._maybe_reload()
+
+        with self._lock:
+            if self._index is None or not self._entries:
+                return None
+            self._lookups += 1
+
+        try:
+            vector = embed_text(normalize_text(user_message))
+        except Exception as e:
+            logger.warning(f"⚠️ Error obteniendo embedding para FAQ: {e}")
+            return None
+
+        category_key = normalize_text(category)
+        with self._lock:
+            scores, ids = self._index.search(vector, min(SEARCH_K, len(self._entries)))
+            for score, idx in zip(scores[0], ids[0]):
+                if idx < 0 or score < self.threshold:
+                    break
+                entry = self._entries[idx]
+                # Entradas de la categoría del ticket o globales (sin categoría)
+                if entry["category"] in ("", category_key):
+                    self._hits += 1
+                    return entry["answer"]
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "lookups": self._lookups,
+                "hits": self._hits,
+                "hit_rate": round(self._hits / self._lookups, 4) if self._lookups else 0.0,
+                "threshold": self.threshold,
+            }
+
+    # ------------------------------------------------------------------
+    # Construcción
+    # ------------------------------------------------------------------
+    def rebuild(self, pairs: List[Dict[str, Any]]):
+        """Reemplazar el índice completo con los pares dados y guardarlo"""
+        if faiss is None:
+            raise RuntimeError("faiss no está instalado")
+        entries, keys = [], set()
+        for entry in _make_entries(pairs):
+            if entry["key"] not in keys:
+                keys.add(entry["key"])
+                entries.append(entry)
+
+        index = None
+        for start in range(0, len(entries), EMBED_BATCH_SIZE):
+            batch = entries[start:start + EMBED_BATCH_SIZE]
+            vectors = embed_texts([e["question_norm"] for e in batch])
+            if index is None:
+                index = faiss.IndexFlatIP(vectors.shape[1])
+            index.add(vectors)
+
+        if index is None:
+            logger.warning("⚠️ No hay pares para indexar; el índice FAQ no cambió")
+            return
+
+        with self._lock:
+            self._index = index
+            self._entries = entries
+            self._keys = keys
+            self._save()
+        logger.info(f"✅ Índice FAQ reconstruido: {len(entries)} pares")
+
+    def add_pairs(self, pairs: List[Dict[str, Any]]) -> int:
+        """Agregar pares nuevos (p. ej. de un ticket recién resuelto); devuelve cuántos se agregaron"""
+        if faiss is None:
+            return 0
+        self._maybe_reload(force=True)
+        with self._lock:
+            new_entries = [e for e in _make_entries(pairs) if e["key"] not in self._keys]
+        if not new_entries:
+            return 0
+
+        vectors = embed_texts([e["question_norm"] for e in new_entries])
+        with self._lock:
+            if self._index is None:
+                self._index = faiss.IndexFlatIP(vectors.shape[1])
+            for entry in new_entries:
+                self._keys.add(entry["key"])
+            self._index.add(vectors)
+            self._entries.extend(new_entries)
+            self._save()
+        return len(new_entries)
+
+    def add_ticket(self, ticket_id: UUID) -> int:
+        """Indexar los pares bien calificados de un ticket (al cerrarse o al calificar una respuesta)"""
+        if not self.enabled:
+            return 0
+        from .. import crud
+        from ..database import SessionLocal
+
+        db = SessionLocal()
+        try:
+            pairs = crud.get_faq_candidates(db, FAQ_MIN_RATING, ticket_id=ticket_id)
+        finally:
+            db.close()
+        try:
+            added = self.add_pairs(pairs)
+        except Exception as e:
+            logger.error(f"❌ Error indexando ticket {ticket_id} en FAQ: {e}")
+            return 0
+        if added:
+            logger.info(f"✅ FAQ: {added} pares agregados del ticket {ticket_id}")
+        return added
+
+    # ------------------------------------------------------------------
+    # Persistencia
+    # ------------------------------------------------------------------
+    def _save(self):
+        # Llamar con self._lock tomado
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        version = f"v{time.time_ns()}-{os.getpid()}"
+        version_dir = self.index_dir / version
+        version_dir.mkdir()
+        faiss.write_index(self._index, str(version_dir / "index.faiss"))
+        (version_dir / "entries.json").write_text(json.dumps(self._entries, ensure_ascii=False), encoding="utf-8")
+        tmp_pointer = self.index_dir / f"CURRENT.{os.getpid()}.tmp"
+        tmp_pointer.write_text(version, encoding="utf-8")
+        os.replace(tmp_pointer, self.index_dir / "CURRENT")
+        self._loaded_version = version
+        self._prune_versions(version)
+
+    def _prune_versions(self, current: str):
+        versions = sorted(
+            (p for p in self.index_dir.glob("v*") if p.is_dir() and p.name != current),
+            key=lambda p: p.stat().st_mtime,
+        )
+        for old in versions[:-FAQ_KEEP_VERSIONS] if FAQ_KEEP_VERSIONS else versions:
+            shutil.rmtree(old, ignore_errors=True)
+
+    def _current_version(self) -> Optional[str]:
+        try:
+            return (self.index_dir / "CURRENT").read_text(encoding="utf-8").strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _maybe_reload(self, force: bool = False):
+        now = time.monotonic()
+        if not force and self._checked_at is not None and now - self._checked_at < FAQ_RELOAD_SECONDS:
+            return
+        self._checked_at = now
+        if faiss is None:
+            return
+        version = self._current_version()
+        if version is None or version == self._loaded_version:
+            return
+        version_dir = self.index_dir / version
+        try:
+            index = faiss.read_index(str(version_dir / "index.faiss"))
+            entries = json.loads((version_dir / "entries.json").read_text(encoding="utf-8"))
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo cargar el índice FAQ {version}: {e}")
+            return
+        if index.ntotal != len(entries):
+            logger.warning(f"⚠️ Índice FAQ {version} inconsistente: {index.ntotal} vectores y {len(entries)} entradas")
+            return
+        with self._lock:
+            self._index = index
+            self._entries = entries
+            self._keys = {e["key"] for e in entries}
+            self._loaded_version = version
+
+
+def _strip_greeting_name(answer: str, customer_name: Optional[str]) -> str:
+    """Quita del saludo el nombre registrado del cliente; sin coincidencia no se toca"""
+    names = (customer_name or "").split()
+    if not names:
+        return answer
+    name_re = r"(?:\s+(?:" + "|".join(re.escape(n) for n in names) + r"))+"
+    match = re.match(GREETING_PATTERN + r",?" + name_re + r"\b", answer, re.IGNORECASE)
+    if not match:
+        return answer
+    return match.group(1) + answer[match.end():]
+
+
+def canonical_answer(answer: str, customer_name: Optional[str] = None) -> Optional[str]:
+    """
+    Respuesta reutilizable para otros clientes: sin el nombre del saludo.
+    None si trae datos de un cliente en particular.
+    """
+    answer = _strip_greeting_name((answer or "").strip(), customer_name).strip()
+    if not answer or PERSONAL_DATA_RE.search(answer):
+        return None
+    if customer_name:
+        names = [n for n in normalize_text(customer_name).split() if len(n) >= 3]
+        words = set(normalize_text(answer).split())
+        if any(n in words for n in names):
+            return None
+    return answer
+
+
+def _make_entry(pair: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    answer = canonical_answer(pair["answer"], pair.get("customer_name"))
+    if answer is None:
+        return None
+    question_norm = normalize_text(pair["question"])
+    return {
+        "key": hashlib.sha256(f"{question_norm}\x1f{answer}".encode()).hexdigest(),
+        "question": pair["question"],
+        "question_norm": question_norm,
+        "answer": answer,
+        "category": normalize_text(pair.get("category") or ""),
+        "ticket_id": str(pair.get("ticket_id") or ""),
+    }
+
+
+def _make_entries(pairs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Entradas canónicas de los pares (se descartan las que traen datos personales)"""
+    entries = [e for e in (_make_entry(p) for p in pairs) if e is not None]
+    if len(entries) < len(pairs):
+        logger.info(f"🔵 FAQ: {len(pairs) - len(entries)} respuestas con datos personales no se indexan")
+    return entries
+
+
+def pairs_from_csv(messages_csv: str, meta_csv: str, min_csat: int = FAQ_MIN_RATING) -> List[Dict[str, Any]]:
+    """
+    Pares pregunta/respuesta de los CSV exportados (m.csv + conversations_meta).
+    Solo conversaciones resueltas con CSAT estimado >= min_csat; quedan sin
+    categoría (globales) porque el CSV no trae la del ticket.
+    """
+    good = set()
+    with open(meta_csv, encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            try:
+                csat = float(row.get("csat_estimated_1_5") or 0)
+            except ValueError:
+                csat = 0
+            if row.get("resolved") == "True" and csat >= min_csat:
+                good.add(row["conversation_id"])
+
+    by_ticket: Dict[str, List[Dict[str, str]]] = {}
+    with open(messages_csv, encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            if row["ticket_id"] in good:
+                by_ticket.setdefault(row["ticket_id"], []).append(row)
+
+    pairs = []
+    for ticket_id, rows in by_ticket.items():
+        # El CSV viene en orden de la conversación (algunas filas sin created_at)
+        for previous, current in zip(rows, rows[1:]):
+            if previous["is_bot"] != "True" and current["is_bot"] == "True":
+                pairs.append({
+                    "question": previous["content"],
+                    "answer": current["content"],
+                    "category": "",
+                    "ticket_id": ticket_id,
+                })
+    return pairs
+
+
+faq_index = FAQIndex()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconstruir el índice FAQ")
+    parser.add_argument("--rebuild", action="store_true", help="Reconstruir desde la BD (y CSV opcionales)")
+    parser.add_argument("--csv", help="CSV de mensajes (formato m.csv)")
+    parser.add_argument("--meta", help="CSV de metadatos de conversaciones")
+    parser.add_argument("--no-db", action="store_true", help="No leer tickets de la BD")
+    args = parser.parse_args()
+
+    if not args.rebuild:
+        parser.print_help()
+        return
+
+    pairs = []
+    if not args.no_db:
+        from .. import crud
+        from ..database import SessionLocal
+        db = SessionLocal()
+        try:
+            pairs.extend(crud.get_faq_candidates(db, FAQ_MIN_RATING))
+        finally:
+            db.close()
+    if args.csv and args.meta:
+        pairs.extend(pairs_from_csv(args.csv, args.meta))
+
+    print(f"🔵 Indexando {len(pairs)} pares...")
+    faq_index.rebuild(pairs)
+    print(f"✅ Índice guardado en {faq_index.index_dir}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
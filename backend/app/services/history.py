@@ -0,0 +1,133 @@
+import os
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import List, Optional, NamedTuple
+from uuid import UUID
+from sqlalchemy.orm import Session
+
+from .. import models
+
+HISTORY_WINDOW = int(os.getenv("HISTORY_WINDOW", "30"))
+# Máximo de tickets con buffer en memoria
+HISTORY_MAX_TICKETS = int(os.getenv("HISTORY_MAX_TICKETS", "5000"))
+
+
+class HistoryMessage(NamedTuple):
+    """Copia ligera de un mensaje (no depende de la sesión de SQLAlchemy)"""
+    id: UUID
+    content: str
+    is_bot: bool
+    created_at: datetime
+
+
+def _snapshot(message) -> HistoryMessage:
+    return HistoryMessage(message.id, message.content, bool(message.is_bot), message.created_at)
+
+
+class HistoryProvider:
+    """
+    Historial reciente por ticket: últimos N mensajes.
+
+    Mantiene un ring buffer por ticket que se actualiza en cada escritura.
+    Antes de usarlo se compara con el id del último mensaje en BD (una
+    consulta indexada de una fila), así el buffer sigue siendo correcto aunque
+    otro proceso haya escrito en el ticket; si no coincide se recarga con
+    ORDER BY created_at DESC LIMIT N.
+    """
+
+    def __init__(self, window: int = HISTORY_WINDOW, max_tickets: int = HISTORY_MAX_TICKETS):
+        self.window = window
+        # Un lugar extra para poder excluir el mensaje que se está respondiendo
+        self._capacity = window + 1
+        self.max_tickets = max_tickets
+        self._lock = threading.Lock()
+        self._buffers: "OrderedDict[UUID, deque]" = OrderedDict()
+
+    def record(self, message):
+        """Agregar un mensaje recién guardado al buffer de su ticket"""
+        with self._lock:
+            buffer = self._buffers.get(message.ticket_id)
+            if buffer is None:
+                # Sin buffer no sabemos qué hay antes; se carga en la próxima lectura
+                return
+            if buffer and buffer[-1].created_at > message.created_at:
+                # Llegó fuera de orden: mejor recargar desde la BD
+                del self._buffers[message.ticket_id]
+                return
+            buffer.append(_snapshot(message))
+            self._buffers.move_to_end(message.ticket_id)
+
+    def get_recent(self, db: Session, ticket_id: UUID, limit: Optional[int] = None) -> List[HistoryMessage]:
+        """Últimos `limit` mensajes del ticket en orden cronológico"""
+        limit = limit or self.window
+        if limit <= self._capacity:
+            with self._lock:
+                buffer = self._buffers.get(ticket_id)
+                cached = list(buffer) if buffer is not None else None
+            if cached is not None and self._is_current(db, ticket_id, cached):
+                return cached[-limit:]
+
+        messages = self._load(db, ticket_id, max(limit, self._capacity))
+        with self._lock:
+            self._buffers[ticket_id] = deque(messages[-self._capacity:], maxlen=self._capacity)
+            self._buffers.move_to_end(ticket_id)
+            while len(self._buffers) > self.max_tickets:
+                self._buffers.popitem(last=False)
+        return messages[-limit:]
+
+    def get_history(self, db: Session, ticket_id: UUID, before_message=None,
+                    limit: Optional[int] = None) -> List[HistoryMessage]:
+        """Últimos `limit` mensajes previos a before_message (sin incluirlo)"""
+        limit = limit or self.window
+        if before_message is None:
+            return self.get_recent(db, ticket_id, limit)
+
+        messages = self.get_recent(db, ticket_id, limit + 1)
+        ids = [m.id for m in messages]
+        if before_message.id in ids:
+            return messages[:ids.index(before_message.id)][-limit:]
+
+        # El mensaje ya salió de la ventana reciente: consultar lo anterior a él
+        return self._load(db, ticket_id, limit, before=before_message.created_at)
+
+    def get_range(self, db: Session, ticket_id: UUID, after: Optional[datetime], before: datetime,
+                  limit: int) -> List[HistoryMessage]:
+        """Primeros `limit` mensajes con after < created_at < before, en orden cronológico"""
+        query = db.query(
+            models.Message.id,
+            models.Message.content,
+            models.Message.is_bot,
+            models.Message.created_at,
+        ).filter(models.Message.ticket_id == ticket_id, models.Message.created_at < before)
+        if after is not None:
+            query = query.filter(models.Message.created_at > after)
+        rows = query.order_by(models.Message.created_at.asc()).limit(limit).all()
+        return [HistoryMessage(r.id, r.content, bool(r.is_bot), r.created_at) for r in rows]
+
+    def invalidate(self, ticket_id: UUID):
+        with self._lock:
+            self._buffers.pop(ticket_id, None)
+
+    def _is_current(self, db: Session, ticket_id: UUID, cached: List[HistoryMessage]) -> bool:
+        latest = db.query(models.Message.id).filter(
+            models.Message.ticket_id == ticket_id
+        ).order_by(models.Message.created_at.desc()).limit(1).scalar()
+        if not cached:
+            return latest is None
+        return latest == cached[-1].id
+
+    def _load(self, db: Session, ticket_id: UUID, limit: int, before: Optional[datetime] = None) -> List[HistoryMessage]:
+        query = db.query(
+            models.Message.id,
+            models.Message.content,
+            models.Message.is_bot,
+            models.Message.created_at,
+        ).filter(models.Message.ticket_id == ticket_id)
+        if before is not None:
+            query = query.filter(models.Message.created_at < before)
+        rows = query.order_by(models.Message.created_at.desc()).limit(limit).all()
+        return [HistoryMessage(r.id, r.content, bool(r.is_bot), r.created_at) for r in reversed(rows)]
+
+
+message_history = HistoryProvider()
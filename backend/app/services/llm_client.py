@@ -0,0 +1,352 @@
+import os
+import time
+import queue
+import random
+import asyncio
+import logging
+import threading
+from typing import List, Dict, Optional, Iterator, Any
+
+import httpx
+from openai import AsyncOpenAI, APIStatusError, APITimeoutError, APIConnectionError
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "20"))
+# En stream: máximo sin recibir un fragmento (el stream completo puede durar más)
+LLM_STREAM_IDLE_SECONDS = float(os.getenv("LLM_STREAM_IDLE_SECONDS", "10"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+# Backoff exponencial con jitter entre reintentos
+RETRY_BASE_SECONDS = 0.5
+RETRY_MAX_SECONDS = 8.0
+
+
+class CircuitOpenError(Exception):
+    """El proveedor está degradado: se falla rápido sin llamarlo"""
+
+
+class LLMDeadlineError(Exception):
+    """Se agotó el tiempo total de la llamada (incluyendo reintentos)"""
+
+
+class CircuitBreaker:
+    """
+    Cortocircuito clásico: tras N fallas seguidas se abre y rechaza llamadas
+    durante `reset_seconds`; luego deja pasar una llamada de prueba
+    (half-open) y se cierra si sale bien.
+    """
+
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURES, reset_seconds: float = LLM_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == "closed":
+                return True
+            if self._state == "open" and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self._state = "half_open"
+                self._probe_in_flight = False
+            if self._state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = "closed"
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def abandon(self):
+        """La llamada se canceló sin resultado: liberar la prueba de half-open"""
+        with self._lock:
+            if self._state == "half_open":
+                self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == "half_open" or self._failures >= self.failure_threshold:
+                if self._state != "open":
+                    logger.warning("⚠️ Circuit breaker del LLM abierto")
+                self._state = "open"
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+
+def _is_retryable(error: Exception) -> bool:
+    """Solo se reintentan 429 y 5xx"""
+    return isinstance(error, APIStatusError) and (error.status_code == 429 or error.status_code >= 500)
+
+
+def _is_provider_failure(error: Exception) -> bool:
+    """Fallas que indican degradación del proveedor (abren el circuito)"""
+    return _is_retryable(error) or isinstance(error, (APITimeoutError, APIConnectionError, LLMDeadlineError))
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    retry_after = None
+    response = getattr(error, "response", None)
+    if response is not None:
+        try:
+            retry_after = float(response.headers.get("retry-after"))
+        except (TypeError, ValueError):
+            retry_after = None
+    if retry_after is not None:
+        return min(retry_after, RETRY_MAX_SECONDS)
+    # Full jitter
+    return random.uniform(0, min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * (2 ** attempt)))
+
+
+class LLMClient:
+    """
+    Cliente asíncrono de OpenAI con pool de conexiones (httpx), deadline por
+    llamada, reintentos con jitter solo para 429/5xx, límite de concurrencia y
+    circuit breaker.
+
+    Corre en su propio event loop (hilo dedicado) para poder usarse tanto
+    desde código sync (workers, handlers def) como async.
+    """
+
+    def __init__(
+        self,
+        timeout: float = LLM_TIMEOUT_SECONDS,
+        max_retries: int = LLM_MAX_RETRIES,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+    ):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self.breaker = CircuitBreaker()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._client: Optional[AsyncOpenAI] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._in_flight = 0
+        self._calls = 0
+        self._retries = 0
+        self._failures = 0
+        self._rejected = 0
+
+    # ------------------------------------------------------------------
+    # API pública
+    # ------------------------------------------------------------------
+    def complete(self, messages: List[Dict[str, str]], model: str, timeout: Optional[float] = None, **params) -> str:
+        """Completion (sync): texto de la respuesta"""
+        future = asyncio.run_coroutine_threadsafe(
+            self._complete(messages, model, timeout or self.timeout, **params), self._ensure_loop()
+        )
+        return future.result()
+
+    async def acomplete(self, messages: List[Dict[str, str]], model: str, timeout: Optional[float] = None, **params) -> str:
+        """Completion (async), usable desde cualquier event loop"""
+        future = asyncio.run_coroutine_threadsafe(
+            self._complete(messages, model, timeout or self.timeout, **params), self._ensure_loop()
+        )
+        return await asyncio.wrap_future(future)
+
+    def stream(self, messages: List[Dict[str, str]], model: str, timeout: Optional[float] = None,
+               idle_timeout: float = LLM_STREAM_IDLE_SECONDS, **params) -> Iterator[str]:
+        """
+        Completion en stream (sync): itera los tokens conforme llegan.
+
+        `timeout` acota la espera del primer fragmento (con reintentos) e
+        `idle_timeout` la de cada fragmento siguiente. Si el consumidor deja de
+        iterar (p. ej. el cliente se desconectó) se cancela la llamada.
+        """
+        timeout = timeout or self.timeout
+        tokens: "queue.Queue" = queue.Queue()
+        done = object()
+        future = asyncio.run_coroutine_threadsafe(
+            self._stream(messages, model, timeout, idle_timeout, tokens, done, **params), self._ensure_loop()
+        )
+        wait = timeout
+        try:
+            while True:
+                try:
+                    item = tokens.get(timeout=wait)
+                except queue.Empty:
+                    raise LLMDeadlineError("El stream dejó de enviar fragmentos")
+                if item is done:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                wait = idle_timeout
+                yield item
+        finally:
+            future.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "circuit_state": self.breaker.state,
+                "in_flight": self._in_flight,
+                "max_concurrency": self.max_concurrency,
+                "calls": self._calls,
+                "retries": self._retries,
+                "failures": self._failures,
+                "rejected": self._rejected,
+            }
+
+    def close(self):
+        if self._loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._client.close(), self._loop).result(timeout=5)
+        except Exception as e:
+            logger.warning(f"⚠️ Error cerrando cliente LLM: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    # ------------------------------------------------------------------
+    # Internos (corren en el loop del cliente)
+    # ------------------------------------------------------------------
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is not None:
+            return self._loop
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                self._client = AsyncOpenAI(
+                    api_key=os.getenv("OPENAI_API_KEY"),
+                    max_retries=0,  # los reintentos los maneja este cliente
+                    timeout=self.timeout,
+                    http_client=httpx.AsyncClient(
+                        limits=httpx.Limits(
+                            max_connections=self.max_concurrency,
+                            max_keepalive_connections=self.max_concurrency,
+                        ),
+                        timeout=self.timeout,
+                    ),
+                )
+                self._semaphore = asyncio.Semaphore(self.max_concurrency)
+                self._thread = threading.Thread(target=loop.run_forever, name="llm-client", daemon=True)
+                self._thread.start()
+                self._loop = loop
+        return self._loop
+
+    async def _complete(self, messages, model, timeout, **params) -> str:
+        response = await self._call(
+            lambda remaining: self._client.chat.completions.create(
+                model=model, messages=messages, timeout=remaining, **params
+            ),
+            timeout,
+        )
+        return response.choices[0].message.content.strip()
+
+    async def _stream(self, messages, model, timeout, idle_timeout, tokens: "queue.Queue", done, **params):
+        async def consume(stream):
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(stream.__anext__(), timeout=idle_timeout)
+                    except StopAsyncIteration:
+                        return
+                    except asyncio.TimeoutError:
+                        raise LLMDeadlineError("El stream dejó de enviar fragmentos")
+                    if not chunk.choices:
+                        continue
+                    token = chunk.choices[0].delta.content
+                    if token:
+                        tokens.put(token)
+            finally:
+                await stream.close()
+
+        try:
+            await self._call(
+                lambda remaining: self._client.chat.completions.create(
+                    model=model, messages=messages, timeout=remaining, stream=True, **params
+                ),
+                timeout,
+                consume=consume,
+            )
+            tokens.put(done)
+        except Exception as e:
+            tokens.put(e)
+
+    async def _call(self, make_request, timeout: float, consume=None):
+        """
+        make_request(remaining) hace la llamada; en stream, consume(respuesta)
+        la lee completa con el lugar del semáforo tomado y el éxito se registra
+        al terminarla. Un stream que falla a la mitad no se reintenta (el
+        consumidor ya recibió parte de la respuesta).
+        """
+        if not self.breaker.allow():
+            with self._stats_lock:
+                self._rejected += 1
+            raise CircuitOpenError("El proveedor LLM está degradado; intenta más tarde")
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        attempt = 0
+
+        while True:
+            remaining = deadline - loop.time()
+            streaming = False
+            try:
+                if remaining <= 0:
+                    raise LLMDeadlineError("Se agotó el tiempo de la llamada al LLM")
+                try:
+                    await asyncio.wait_for(self._semaphore.acquire(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    raise LLMDeadlineError("Se agotó el tiempo esperando turno para el LLM")
+
+                with self._stats_lock:
+                    self._in_flight += 1
+                    self._calls += 1
+                try:
+                    response = await make_request(max(0.1, deadline - loop.time()))
+                    if consume is not None:
+                        streaming = True
+                        response = await consume(response)
+                finally:
+                    self._semaphore.release()
+                    with self._stats_lock:
+                        self._in_flight -= 1
+
+                self.breaker.record_success()
+                return response
+
+            except asyncio.CancelledError:
+                self.breaker.abandon()
+                raise
+            except Exception as e:
+                delay = _retry_delay(e, attempt) if _is_retryable(e) and not streaming else None
+                if delay is not None and attempt < self.max_retries and loop.time() + delay < deadline:
+                    attempt += 1
+                    with self._stats_lock:
+                        self._retries += 1
+                    logger.warning(f"⚠️ LLM respondió {getattr(e, 'status_code', '?')}, reintento {attempt} en {delay:.2f}s")
+                    await asyncio.sleep(delay)
+                    continue
+
+                with self._stats_lock:
+                    self._failures += 1
+                if _is_provider_failure(e):
+                    self.breaker.record_failure()
+                else:
+                    # Error del request (4xx): el proveedor responde bien
+                    self.breaker.record_success()
+                raise
+
+
+llm_client = LLMClient()
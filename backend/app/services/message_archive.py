@@ -0,0 +1,229 @@
+"""
+Archivado de meses viejos de messages a Parquet (particiones de la migración 0006).
+
+Un mes se archiva cuando terminó hace más de MESSAGE_ARCHIVE_AFTER_DAYS días
+y todos sus mensajes son de tickets cerrados (MESSAGE_ARCHIVE_STATUSES) sin
+cambios desde antes de ese corte. Por cada mes, en una sola transacción:
+  1. se bloquea la partición contra escrituras (SHARE) y se exporta, con los
+     datos de su ticket, a <dir>/messages_YYYY_MM.parquet (zstd) en streaming
+  2. se verifica que el archivo tenga tantas filas como la partición
+  3. se descuentan sus mensajes del rollup del dashboard, se borran las llaves
+     de idempotencia que apuntan a ellos y se desprende la partición (DETACH);
+     con drop además se borra la tabla desprendida
+Si algo falla la transacción se revierte y el mes queda como estaba. Los meses
+con tickets que no se pueden archivar se saltan y se reportan (open_tickets).
+
+Los tickets, sus métricas y ratings se quedan en la BD; solo salen los mensajes.
+
+Uso (desde backend/):
+    python -m app.services.message_archive --dry-run
+    python -m app.services.message_archive --older-than-days 365 --output-dir /data/archive --drop
+"""
+import os
+import re
+import logging
+import argparse
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+
+from ..database import engine
+from .message_partitions import ensure_partitions, list_partitions
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_ARCHIVE_AFTER_DAYS = int(os.getenv("MESSAGE_ARCHIVE_AFTER_DAYS", "365"))
+MESSAGE_ARCHIVE_DIR = os.getenv("MESSAGE_ARCHIVE_DIR", "archive/messages")
+MESSAGE_ARCHIVE_STATUSES = [
+    s.strip() for s in os.getenv("MESSAGE_ARCHIVE_STATUSES", "closed").split(",") if s.strip()
+]
+# DETACH toma un lock exclusivo sobre messages: mejor fallar que encolar el tráfico detrás
+MESSAGE_ARCHIVE_LOCK_TIMEOUT = os.getenv("MESSAGE_ARCHIVE_LOCK_TIMEOUT", "5s")
+ARCHIVE_BATCH_ROWS = 50_000
+
+# Solo particiones mensuales (nunca messages_default)
+MONTH_PARTITION_RE = re.compile(r"^messages_\d{4}_\d{2}$")
+
+BLOCKING_TICKETS_SQL = """
+    SELECT COUNT(DISTINCT m.ticket_id)
+    FROM {partition} m
+    JOIN tickets t ON t.id = m.ticket_id
+    WHERE NOT (COALESCE(t.status, '') = ANY(:statuses)
+               AND COALESCE(t.updated_at, t.created_at) < :cutoff)
+"""
+
+COUNT_SQL = "SELECT COUNT(*) AS total, COUNT(*) FILTER (WHERE is_bot) AS bot FROM {partition}"
+
+EXPORT_SQL = """
+    SELECT m.id::text, m.ticket_id::text, m.content, m.is_bot, m.sender_name, m.created_at,
+           t.user_id::text, t.title, t.category, t.status
+    FROM {partition} m
+    LEFT JOIN tickets t ON t.id = m.ticket_id
+    ORDER BY m.ticket_id, m.created_at, m.id
+"""
+
+# Los triggers del rollup no ven un DETACH: se descuenta a mano (en el shard 0;
+# las lecturas suman todos los shards)
+ROLLUP_SQL = text("""
+    INSERT INTO dashboard_rollup AS r (metric, bucket, shard, count, total)
+    VALUES ('messages', 'all', 0, -CAST(:total AS bigint), 0), ('messages', 'bot', 0, -CAST(:bot AS bigint), 0)
+    ON CONFLICT (metric, bucket, shard) DO UPDATE
+    SET count = r.count + EXCLUDED.count,
+        updated_at = now()
+""")
+
+
+def _archive_schema():
+    import pyarrow as pa
+    return pa.schema([
+        ("id", pa.string()),
+        ("ticket_id", pa.string()),
+        ("content", pa.string()),
+        ("is_bot", pa.bool_()),
+        ("sender_name", pa.string()),
+        ("created_at", pa.timestamp("us")),
+        ("user_id", pa.string()),
+        ("ticket_title", pa.string()),
+        ("ticket_category", pa.string()),
+        ("ticket_status", pa.string()),
+    ])
+
+
+def export_partition(conn, partition: str, path: Path) -> int:
+    """Escribir la partición a Parquet por lotes; devuelve las filas escritas"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _archive_schema()
+    tmp = path.with_name(path.name + ".tmp")
+    rows = 0
+    result = conn.execute(
+        text(EXPORT_SQL.format(partition=partition)).execution_options(stream_results=True)
+    )
+    with pq.ParquetWriter(tmp, schema, compression="zstd") as writer:
+        for chunk in result.partitions(ARCHIVE_BATCH_ROWS):
+            columns = list(zip(*chunk))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema,
+            ))
+            rows += len(chunk)
+    written = pq.ParquetFile(tmp).metadata.num_rows
+    if written != rows:
+        tmp.unlink(missing_ok=True)
+        raise RuntimeError(f"{path.name}: el archivo tiene {written} filas y se exportaron {rows}")
+    tmp.replace(path)
+    return rows
+
+
+def archive_messages(older_than_days: int = MESSAGE_ARCHIVE_AFTER_DAYS,
+                     output_dir: str = MESSAGE_ARCHIVE_DIR,
+                     statuses: Optional[List[str]] = None,
+                     drop: bool = False, dry_run: bool = False) -> List[Dict[str, Any]]:
+    """Archivar los meses que terminaron antes del corte; un resultado por mes candidato"""
+    statuses = statuses or MESSAGE_ARCHIVE_STATUSES
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    directory = Path(output_dir)
+    if not dry_run:
+        directory.mkdir(parents=True, exist_ok=True)
+
+    with engine.connect() as conn:
+        candidates = [
+            p for p in list_partitions(conn)
+            if MONTH_PARTITION_RE.match(p["name"]) and p["end"] is not None and p["end"] <= cutoff
+        ]
+
+    results = []
+    for partition in candidates:
+        result = {
+            "partition": partition["name"],
+            "start": partition["start"],
+            "end": partition["end"],
+            "rows": 0,
+            "open_tickets": 0,
+            "status": "skipped",
+            "file": None,
+            "dropped": False,
+            "error": None,
+        }
+        try:
+            _archive_partition(partition["name"], directory, statuses, cutoff, drop, dry_run, result)
+        except Exception as e:
+            logger.error(f"❌ No se pudo archivar {partition['name']}: {e}")
+            result["status"] = "failed"
+            result["error"] = str(e)
+        results.append(result)
+    return results
+
+
+def _archive_partition(name: str, directory: Path, statuses: List[str], cutoff: datetime,
+                       drop: bool, dry_run: bool, result: Dict[str, Any]):
+    partition = f'"{name}"'
+    path = directory / f"{name}.parquet"
+    with engine.connect() as conn:
+        with conn.begin():
+            conn.execute(text("SELECT set_config('lock_timeout', :timeout, true)"),
+                         {"timeout": MESSAGE_ARCHIVE_LOCK_TIMEOUT})
+            if not dry_run:
+                # Nada entra ni cambia en el mes mientras se exporta
+                conn.execute(text(f"LOCK TABLE {partition} IN SHARE MODE"))
+            result["open_tickets"] = conn.execute(
+                text(BLOCKING_TICKETS_SQL.format(partition=partition)),
+                {"statuses": statuses, "cutoff": cutoff}
+            ).scalar()
+            counts = conn.execute(text(COUNT_SQL.format(partition=partition))).one()
+            result["rows"] = counts.total
+            if result["open_tickets"]:
+                logger.info(f"⚠️ {name}: {result['open_tickets']} tickets sin cerrar; no se archiva")
+                return
+            if dry_run:
+                result["status"] = "dry_run"
+                return
+
+            try:
+                exported = export_partition(conn, partition, path)
+                if exported != counts.total:
+                    raise RuntimeError(f"se exportaron {exported} de {counts.total} mensajes")
+                conn.execute(ROLLUP_SQL, {"total": counts.total, "bot": counts.bot})
+                conn.execute(text(
+                    f"DELETE FROM idempotency_keys k USING {partition} m WHERE k.message_id = m.id"
+                ))
+                conn.execute(text(f"ALTER TABLE messages DETACH PARTITION {partition}"))
+                if drop:
+                    conn.execute(text(f"DROP TABLE {partition}"))
+            except Exception:
+                path.unlink(missing_ok=True)
+                raise
+
+    result["status"] = "archived"
+    result["file"] = str(path)
+    result["dropped"] = drop
+    logger.info(f"✅ {name}: {counts.total} mensajes archivados en {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archivar meses viejos de messages a Parquet")
+    parser.add_argument("--older-than-days", type=int, default=MESSAGE_ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--output-dir", default=MESSAGE_ARCHIVE_DIR)
+    parser.add_argument("--status", action="append", dest="statuses",
+                        help="Estados de ticket archivables (repetible; por defecto MESSAGE_ARCHIVE_STATUSES)")
+    parser.add_argument("--drop", action="store_true", help="Borrar las particiones después de desprenderlas")
+    parser.add_argument("--dry-run", action="store_true", help="Solo reportar qué meses se archivarían")
+    args = parser.parse_args()
+
+    # Corriendo desde cron, de paso se crean los meses que vienen
+    ensure_partitions()
+    results = archive_messages(args.older_than_days, args.output_dir, args.statuses, args.drop, args.dry_run)
+    if not results:
+        print("✅ No hay meses anteriores al corte")
+    for result in results:
+        print(f"{result['partition']}: {result['status']} filas={result['rows']} "
+              f"tickets_abiertos={result['open_tickets']} archivo={result['file']}"
+              + (f" error={result['error']}" if result["error"] else ""))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
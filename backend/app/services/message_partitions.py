@@ -0,0 +1,117 @@
+"""
+Particiones mensuales de messages (migración 0006).
+
+ensure_messages_partitions() en la BD crea los meses que faltan hasta
+MESSAGE_PARTITION_MONTHS_AHEAD adelante; aquí se llama al arrancar el backend
+y después cada MESSAGE_PARTITION_CHECK_HOURS desde un hilo. Si igual llega una
+fila sin partición (el hilo no corrió, fechas de importación viejas) cae en
+messages_default y se mueve a su mes cuando éste se crea.
+"""
+import os
+import re
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from ..database import engine
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_PARTITION_MONTHS_AHEAD = int(os.getenv("MESSAGE_PARTITION_MONTHS_AHEAD", "3"))
+MESSAGE_PARTITION_CHECK_HOURS = float(os.getenv("MESSAGE_PARTITION_CHECK_HOURS", "24"))
+
+DEFAULT_PARTITION = "messages_default"
+
+PARTITIONS_SQL = text("""
+    SELECT c.relname AS name, pg_get_expr(c.relpartbound, c.oid) AS bound,
+           GREATEST(c.reltuples, 0)::bigint AS estimated_rows,
+           pg_total_relation_size(c.oid) AS total_bytes
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = to_regclass('messages')
+    ORDER BY c.relname
+""")
+
+BOUND_RE = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def ensure_partitions(months_ahead: int = MESSAGE_PARTITION_MONTHS_AHEAD, months_back: int = 0) -> int:
+    """Crear las particiones mensuales que falten; devuelve cuántas se crearon"""
+    with engine.begin() as conn:
+        created = conn.execute(
+            text("SELECT ensure_messages_partitions(:ahead, :back)"),
+            {"ahead": months_ahead, "back": months_back}
+        ).scalar()
+    if created:
+        logger.info(f"✅ {created} particiones nuevas de messages")
+    return created
+
+
+def list_partitions(conn) -> List[Dict[str, Any]]:
+    """Particiones adjuntas a messages con su rango (None en la DEFAULT)"""
+    partitions = []
+    for row in conn.execute(PARTITIONS_SQL).mappings():
+        match = BOUND_RE.search(row["bound"] or "")
+        partitions.append({
+            "name": row["name"],
+            "start": datetime.fromisoformat(match.group(1)) if match else None,
+            "end": datetime.fromisoformat(match.group(2)) if match else None,
+            "estimated_rows": row["estimated_rows"],
+            "total_bytes": row["total_bytes"],
+        })
+    return partitions
+
+
+class PartitionMaintainer:
+    """
+    Hilo que corre ensure_partitions al arrancar y luego periódicamente; de
+    paso borra las Idempotency-Key vencidas.
+    """
+
+    def __init__(self, interval_hours: float = MESSAGE_PARTITION_CHECK_HOURS):
+        self.interval = interval_hours * 3600
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="message-partitions", daemon=True)
+        self._thread.start()
+
+    def shutdown(self):
+        self._stopping.set()
+
+    def _run(self):
+        while True:
+            try:
+                ensure_partitions()
+            except SQLAlchemyError as e:
+                # Sin la migración 0006 la función no existe: no es fatal
+                logger.warning(f"⚠️ No se pudieron crear las particiones de messages: {e}")
+            try:
+                _purge_idempotency_keys()
+            except SQLAlchemyError as e:
+                logger.warning(f"⚠️ No se pudieron borrar las Idempotency-Key vencidas: {e}")
+            if self._stopping.wait(self.interval):
+                return
+
+
+def _purge_idempotency_keys():
+    from .. import crud
+    from ..database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        deleted = crud.purge_idempotency_keys(db)
+    finally:
+        db.close()
+    if deleted:
+        logger.info(f"✅ {deleted} Idempotency-Key vencidas borradas")
+
+
+partition_maintainer = PartitionMaintainer()
@@ -0,0 +1,242 @@
+import os
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+from .. import crud, schemas
+from ..database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Apagado por defecto: cada mensaje es su propia transacción
+MESSAGE_WRITE_BEHIND = os.getenv("MESSAGE_WRITE_BEHIND", "0") == "1"
+MESSAGE_BATCH_ROWS = int(os.getenv("MESSAGE_BATCH_ROWS", "200"))
+MESSAGE_BATCH_DELAY_MS = float(os.getenv("MESSAGE_BATCH_DELAY_MS", "5"))
+MESSAGE_BUFFER_SIZE = int(os.getenv("MESSAGE_BUFFER_SIZE", "5000"))
+# Cuánto espera un request la confirmación de su lote
+MESSAGE_ACK_TIMEOUT = float(os.getenv("MESSAGE_ACK_TIMEOUT", "10"))
+
+# Ventana de tamaños / latencias de lote para las estadísticas
+BATCH_WINDOW = 500
+
+
+class BufferFullError(Exception):
+    """El buffer de escritura está lleno o detenido"""
+
+
+class _PendingWrite:
+    __slots__ = ("message", "future", "enqueued_at")
+
+    def __init__(self, message: schemas.MessageCreate):
+        self.message = message
+        self.future: Future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+class MessageWriter:
+    """
+    Write-behind de mensajes para picos de carga.
+
+    Los requests dejan el mensaje en un buffer acotado y un hilo lo escribe
+    junto con los demás cada MESSAGE_BATCH_DELAY_MS o al juntar
+    MESSAGE_BATCH_ROWS filas: una sentencia y un COMMIT por lote
+    (crud.MessageUnitOfWork) en lugar de uno por mensaje.
+
+    Confirmación: el Future de cada mensaje se resuelve con el mensaje
+    guardado solo después del COMMIT de su lote, así que nada se le confirma
+    al cliente antes de ser durable. Si el lote falla se reintenta fila por
+    fila para que un mensaje inválido no tumbe a los demás.
+    """
+
+    def __init__(self, enabled: bool = MESSAGE_WRITE_BEHIND, max_rows: int = MESSAGE_BATCH_ROWS,
+                 max_delay_ms: float = MESSAGE_BATCH_DELAY_MS, buffer_size: int = MESSAGE_BUFFER_SIZE):
+        self.enabled = enabled
+        self.max_rows = max_rows
+        self.max_delay = max_delay_ms / 1000
+        self.buffer_size = buffer_size
+        self._queue: "queue.Queue[_PendingWrite]" = queue.Queue(maxsize=buffer_size)
+        self._stopping = threading.Event()
+        self._start_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._rows = 0
+        self._batches = 0
+        self._commits = 0
+        self._failed = 0
+        self._rejected = 0
+        self._retried_rows = 0
+        self._batch_sizes = deque(maxlen=BATCH_WINDOW)
+        self._ack_ms = deque(maxlen=BATCH_WINDOW)
+
+    def submit(self, message: schemas.MessageCreate) -> Future:
+        """Encolar un mensaje; el Future da el models.Message ya confirmado"""
+        if self._stopping.is_set():
+            raise BufferFullError("El escritor de mensajes está detenido")
+        self._ensure_started()
+        pending = _PendingWrite(message)
+        try:
+            self._queue.put_nowait(pending)
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            raise BufferFullError("El buffer de mensajes está lleno")
+        return pending.future
+
+    def write(self, message: schemas.MessageCreate, timeout: float = MESSAGE_ACK_TIMEOUT):
+        """Encolar y esperar la confirmación (mismo resultado que crud.create_message)"""
+        return self.submit(message).result(timeout=timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sizes = list(self._batch_sizes)
+            acks = sorted(self._ack_ms)
+            return {
+                "enabled": self.enabled,
+                "buffered": self._queue.qsize(),
+                "buffer_size": self.buffer_size,
+                "max_batch_rows": self.max_rows,
+                "max_delay_ms": self.max_delay * 1000,
+                "rows": self._rows,
+                "batches": self._batches,
+                "commits": self._commits,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "retried_rows": self._retried_rows,
+                "avg_batch_rows": round(sum(sizes) / len(sizes), 1) if sizes else None,
+                "ack_ms_p50": _percentile(acks, 0.50),
+                "ack_ms_p95": _percentile(acks, 0.95),
+            }
+
+    def shutdown(self, timeout: float = 30):
+        """Dejar de aceptar mensajes y escribir lo que quede en el buffer"""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                logger.warning(f"⚠️ Quedaron {self._queue.qsize()} mensajes sin escribir al apagar")
+                return
+        # Lo que llegó mientras el hilo terminaba
+        leftover = []
+        while True:
+            try:
+                leftover.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if leftover:
+            self._flush(leftover)
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="message-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            try:
+                first = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            batch = [first]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_rows:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._flush(batch)
+        logger.info("✅ Escritor de mensajes detenido; buffer vacío")
+
+    def _flush(self, batch: List[_PendingWrite]):
+        # Los que se cancelaron antes de escribirse (cliente desconectado) no se
+        # escriben: nunca se confirmaron
+        batch = [pending for pending in batch if pending.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        db = SessionLocal()
+        try:
+            unit = crud.MessageUnitOfWork()
+            for pending in batch:
+                unit.add(pending.message)
+            saved = unit.commit(db)
+        except Exception as e:
+            db.rollback()
+            if len(batch) == 1:
+                logger.error(f"❌ Error al escribir mensaje (ticket {batch[0].message.ticket_id}): {e}")
+                with self._lock:
+                    self._failed += 1
+                batch[0].future.set_exception(e)
+                return
+            logger.warning(f"⚠️ Lote de {len(batch)} mensajes falló ({e}); reintentando fila por fila")
+            with self._lock:
+                self._retried_rows += len(batch)
+            for pending in batch:
+                self._flush_one(pending)
+            return
+        finally:
+            db.close()
+
+        acked_at = time.monotonic()
+        with self._lock:
+            self._rows += len(batch)
+            self._batches += 1
+            self._commits += 1
+            self._batch_sizes.append(len(batch))
+            for pending in batch:
+                self._ack_ms.append((acked_at - pending.enqueued_at) * 1000)
+        for pending, db_message in zip(batch, saved):
+            pending.future.set_result(db_message)
+
+    def _flush_one(self, pending: _PendingWrite):
+        """Reintento individual de un mensaje de un lote fallido (su Future ya está en curso)"""
+        db = SessionLocal()
+        try:
+            db_message = crud.create_message(db, pending.message)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"❌ Error al escribir mensaje (ticket {pending.message.ticket_id}): {e}")
+            with self._lock:
+                self._failed += 1
+            pending.future.set_exception(e)
+            return
+        finally:
+            db.close()
+        with self._lock:
+            self._rows += 1
+            self._commits += 1
+            self._ack_ms.append((time.monotonic() - pending.enqueued_at) * 1000)
+        pending.future.set_result(db_message)
+
+
+def _percentile(values, q: float) -> Optional[float]:
+    if not values:
+        return None
+    index = min(len(values) - 1, int(round(q * (len(values) - 1))))
+    return round(values[index], 1)
+
+
+message_writer = MessageWriter()
+
+
+def save_message(message: schemas.MessageCreate):
+    """
+    crud.create_message con sesión propia; pasa por el buffer si el
+    write-behind está activo (y escribe directo si el buffer está lleno).
+    """
+    if message_writer.enabled:
+        try:
+            return message_writer.write(message)
+        except BufferFullError:
+            pass
+    db = SessionLocal()
+    try:
+        return crud.create_message(db, message)
+    finally:
+        db.close()
@@ -0,0 +1,40 @@
+"""
+Backfill de chatbot_metrics: recalcula los contadores de todos los tickets
+desde messages / message_ratings. Es un job de una vez para los tickets
+anteriores a los contadores incrementales (crud.ticket_metrics_stmt);
+conviene correrlo con poco tráfico, porque los mensajes que lleguen durante
+el recálculo pueden quedar fuera de los conteos.
+
+Uso (desde backend/):
+    python -m app.services.metrics_backfill
+"""
+import time
+import logging
+
+from .. import crud
+from ..database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+def run_backfill() -> int:
+    """Recalcular chatbot_metrics; devuelve cuántos tickets se escribieron"""
+    started = time.monotonic()
+    db = SessionLocal()
+    try:
+        written = crud.backfill_chatbot_metrics(db)
+    finally:
+        db.close()
+    logger.info(f"✅ Backfill de métricas: {written} tickets en {time.monotonic() - started:.1f}s")
+    return written
+
+
+def main():
+    print("🔵 Recalculando chatbot_metrics...")
+    written = run_backfill()
+    print(f"✅ {written} tickets actualizados")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
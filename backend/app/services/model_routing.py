@@ -0,0 +1,133 @@
+import os
+import re
+import threading
+from collections import deque
+from typing import List, Dict, Optional, Any, NamedTuple
+
+# Mismos patrones que el workbench (streamlit/app.py INTENT_PATTERNS) + saludo
+INTENT_PATTERNS = {
+    "greeting": [r"^\s*(hola|buen(os|as)\s+(d[ií]as|tardes|noches)|hey|qu[eé] tal)\b[\s!¡.,]*$"],
+    "offer_24h": [r"oferta.*24", r"offer.*24"],
+    "status_eval": [r"evaluaci[oó]n mec[aá]nica", r"status.*(eval|inspection)", r"estado.*inspecci[oó]n"],
+    "payment_status": [r"pago(s)?", r"transferencia", r"deposit(o|ó)"],
+    "reschedule_inspection": [r"reprogram(ar|aci[oó]n).*(inspecci[oó]n|visita)", r"cambiar.*cita"],
+    "credit_prequal": [r"cr[eé]dito", r"tasa(s)?", r"financ(i|)amiento", r"pre(-| )?aprobaci[oó]n"],
+    "warranty_claim": [r"garant[ií]a", r"falla el[eé]ctrica"],
+    "kyc_docs": [r"document(o|os|aci[oó]n)", r"KYC", r"identificaci[oó]n", r"comprobante"],
+    "appointment": [r"(cita|agendar|programar)"],
+}
+_COMPILED_PATTERNS = {
+    intent: [re.compile(p, re.IGNORECASE) for p in pats] for intent, pats in INTENT_PATTERNS.items()
+}
+
+SIMPLE_INTENTS = {"greeting", "appointment", "kyc_docs", "reschedule_inspection"}
+COMPLEX_INTENTS = {"credit_prequal", "warranty_claim"}
+
+# Mensajes sin intent detectado y más cortos que esto van al tier simple
+SIMPLE_MAX_CHARS = int(os.getenv("ROUTING_SIMPLE_MAX_CHARS", "160"))
+
+LATENCY_WINDOW = 500
+
+
+class ModelTier(NamedTuple):
+    name: str
+    model: str
+    max_tokens: int
+    timeout_seconds: float  # presupuesto de latencia (deadline de la llamada)
+
+
+TIERS = {
+    "simple": ModelTier(
+        "simple",
+        os.getenv("LLM_SIMPLE_MODEL", "gpt-4o-mini"),
+        int(os.getenv("LLM_SIMPLE_MAX_TOKENS", "250")),
+        float(os.getenv("LLM_SIMPLE_TIMEOUT_SECONDS", "8")),
+    ),
+    "complex": ModelTier(
+        "complex",
+        os.getenv("LLM_COMPLEX_MODEL", "gpt-4o"),
+        int(os.getenv("LLM_COMPLEX_MAX_TOKENS", "500")),
+        float(os.getenv("LLM_COMPLEX_TIMEOUT_SECONDS", "20")),
+    ),
+}
+
+
+class RouteDecision(NamedTuple):
+    tier: ModelTier
+    intents: List[str]
+
+
+def detect_intents(text: str) -> List[str]:
+    return sorted(
+        intent for intent, patterns in _COMPILED_PATTERNS.items()
+        if any(p.search(text or "") for p in patterns)
+    )
+
+
+def route(user_message: str, conversation_history: List[Dict[str, str]], ticket_category: str = "") -> RouteDecision:
+    """
+    Clasificador local (regex, sin llamadas externas) del turno:
+    crédito y garantías van al modelo grande; saludos, citas y documentos
+    al modelo rápido.
+    """
+    intents = detect_intents(user_message)
+    category_intents = detect_intents(ticket_category)
+
+    if COMPLEX_INTENTS.intersection(intents) or COMPLEX_INTENTS.intersection(category_intents):
+        tier = "complex"
+    elif intents and set(intents) <= SIMPLE_INTENTS:
+        tier = "simple"
+    elif not intents and len(user_message) <= SIMPLE_MAX_CHARS:
+        tier = "simple"
+    else:
+        tier = "complex"
+    return RouteDecision(TIERS[tier], intents)
+
+
+class RoutingMetrics:
+    """Llamadas, fallas y latencia por tier"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tiers = {
+            name: {"calls": 0, "failures": 0, "over_budget": 0, "latencies": deque(maxlen=LATENCY_WINDOW)}
+            for name in TIERS
+        }
+
+    def record(self, tier: ModelTier, latency_seconds: float, ok: bool):
+        with self._lock:
+            stats = self._tiers[tier.name]
+            stats["calls"] += 1
+            if not ok:
+                stats["failures"] += 1
+            if latency_seconds > tier.timeout_seconds:
+                stats["over_budget"] += 1
+            stats["latencies"].append(latency_seconds * 1000)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            result = {}
+            for name, stats in self._tiers.items():
+                latencies = sorted(stats["latencies"])
+                tier = TIERS[name]
+                result[name] = {
+                    "model": tier.model,
+                    "max_tokens": tier.max_tokens,
+                    "latency_budget_ms": tier.timeout_seconds * 1000,
+                    "calls": stats["calls"],
+                    "failures": stats["failures"],
+                    "over_budget": stats["over_budget"],
+                    "latency_ms_p50": _percentile(latencies, 0.50),
+                    "latency_ms_p95": _percentile(latencies, 0.95),
+                }
+            return result
+
+
+def _percentile(values, q: float) -> Optional[float]:
+    if not values:
+        return None
+    index = min(len(values) - 1, int(round(q * (len(values) - 1))))
+    return round(values[index], 1)
+
+
+routing_metrics = RoutingMetrics()
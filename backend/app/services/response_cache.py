@@ -0,0 +1,240 @@
+import os
+import re
+import time
+import json
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import List, Dict, Optional, Any
+
+from .embeddings import embed_text
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2048"))
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+RESPONSE_CACHE_SEMANTIC = os.getenv("RESPONSE_CACHE_SEMANTIC", "1") == "1"
+RESPONSE_CACHE_SEMANTIC_THRESHOLD = float(os.getenv("RESPONSE_CACHE_SEMANTIC_THRESHOLD", "0.92"))
+RESPONSE_CACHE_SEMANTIC_MAX_PER_CATEGORY = int(os.getenv("RESPONSE_CACHE_SEMANTIC_MAX_PER_CATEGORY", "1000"))
+# Índices semánticos (categoría + contexto del ticket) que se mantienen, LRU
+RESPONSE_CACHE_SEMANTIC_MAX_BUCKETS = int(os.getenv("RESPONSE_CACHE_SEMANTIC_MAX_BUCKETS", "256"))
+
+
+def normalize_text(text: str) -> str:
+    """Minúsculas, sin acentos, sin signos de puntuación y espacios colapsados"""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def history_hash(conversation_history: List[Dict[str, str]]) -> str:
+    """Hash estable del historial normalizado"""
+    normalized = [(m.get("role"), normalize_text(m.get("content", ""))) for m in conversation_history]
+    return hashlib.sha256(json.dumps(normalized, ensure_ascii=False).encode()).hexdigest()
+
+
+def context_hash(ticket_description: str = "", conversation_summary: str = "") -> str:
+    """Hash del contexto del ticket que va en el prompt de sistema"""
+    raw = "\x1f".join([normalize_text(ticket_description), normalize_text(conversation_summary)])
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class _SemanticBucket:
+    """Índice faiss de preguntas de primer contacto de una categoría"""
+
+    def __init__(self, dim: int):
+        self.index = faiss.IndexFlatIP(dim)
+        self.entries: List[tuple] = []  # (respuesta, timestamp)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class ResponseCache:
+    """
+    Caché de respuestas del chatbot en dos niveles:
+
+    - Exacto: LRU + TTL por (categoría, mensaje normalizado, hash del historial,
+      hash de la descripción del ticket y el resumen)
+    - Semántico: similitud coseno (faiss) sobre mensajes de primer contacto,
+      separado por categoría y descripción del ticket, con umbral configurable
+    """
+
+    def __init__(
+        self,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        ttl_seconds: int = RESPONSE_CACHE_TTL_SECONDS,
+        semantic_enabled: bool = RESPONSE_CACHE_SEMANTIC,
+        semantic_threshold: float = RESPONSE_CACHE_SEMANTIC_THRESHOLD,
+        semantic_max_per_category: int = RESPONSE_CACHE_SEMANTIC_MAX_PER_CATEGORY,
+        semantic_max_buckets: int = RESPONSE_CACHE_SEMANTIC_MAX_BUCKETS,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.semantic_enabled = semantic_enabled and faiss is not None
+        self.semantic_threshold = semantic_threshold
+        self.semantic_max_per_category = semantic_max_per_category
+        self.semantic_max_buckets = semantic_max_buckets
+        self._lock = threading.Lock()
+        self._exact: "OrderedDict[str, tuple]" = OrderedDict()
+        self._semantic: "OrderedDict[str, _SemanticBucket]" = OrderedDict()
+        self._exact_hits = 0
+        self._semantic_hits = 0
+        self._misses = 0
+
+        if semantic_enabled and faiss is None:
+            logger.warning("⚠️ faiss no está instalado: caché semántico deshabilitado")
+
+    def get(self, category: str, user_message: str, conversation_history: List[Dict[str, str]],
+            ticket_description: str = "", conversation_summary: str = "") -> Optional[str]:
+        """Buscar una respuesta en caché; None si no hay hit"""
+        context = context_hash(ticket_description, conversation_summary)
+        key = self._key(category, user_message, conversation_history, context)
+        now = time.time()
+
+        with self._lock:
+            entry = self._exact.get(key)
+            if entry is not None:
+                response, stored_at = entry
+                if now - stored_at <= self.ttl_seconds:
+                    self._exact.move_to_end(key)
+                    self._exact_hits += 1
+                    return response
+                del self._exact[key]
+
+        response = self._semantic_get(category, context, user_message, conversation_history, now)
+        with self._lock:
+            if response is not None:
+                self._semantic_hits += 1
+            else:
+                self._misses += 1
+        return response
+
+    def put(self, category: str, user_message: str, conversation_history: List[Dict[str, str]], response: str,
+            ticket_description: str = "", conversation_summary: str = ""):
+        """Guardar una respuesta generada por el LLM"""
+        context = context_hash(ticket_description, conversation_summary)
+        key = self._key(category, user_message, conversation_history, context)
+        now = time.time()
+
+        with self._lock:
+            self._exact[key] = (response, now)
+            self._exact.move_to_end(key)
+            while len(self._exact) > self.max_entries:
+                self._exact.popitem(last=False)
+
+        self._semantic_put(category, context, user_message, conversation_history, response, now)
+
+    def clear(self):
+        with self._lock:
+            self._exact.clear()
+            self._semantic.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._exact_hits + self._semantic_hits + self._misses
+            hits = self._exact_hits + self._semantic_hits
+            return {
+                "exact_hits": self._exact_hits,
+                "semantic_hits": self._semantic_hits,
+                "misses": self._misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "exact_entries": len(self._exact),
+                "semantic_entries": sum(len(b) for b in self._semantic.values()),
+                "semantic_enabled": self.semantic_enabled,
+                "semantic_threshold": self.semantic_threshold,
+            }
+
+    def _key(self, category: str, user_message: str, conversation_history: List[Dict[str, str]],
+             context: str) -> str:
+        raw = "\x1f".join([
+            normalize_text(category),
+            normalize_text(user_message),
+            history_hash(conversation_history),
+            context,
+        ])
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def _semantic_applies(self, conversation_history: List[Dict[str, str]]) -> bool:
+        # Solo primer contacto: con historial la respuesta depende del contexto
+        return self.semantic_enabled and not conversation_history
+
+    @staticmethod
+    def _bucket_key(category: str, context: str) -> str:
+        # Misma pregunta con otra descripción de ticket no es la misma respuesta
+        return f"{normalize_text(category)}\x1f{context}"
+
+    def _semantic_get(self, category, context, user_message, conversation_history, now) -> Optional[str]:
+        if not self._semantic_applies(conversation_history):
+            return None
+        bucket_key = self._bucket_key(category, context)
+        with self._lock:
+            if not self._semantic.get(bucket_key):
+                return None
+
+        try:
+            vector = embed_text(normalize_text(user_message))
+        except Exception as e:
+            logger.warning(f"⚠️ Error obteniendo embedding para caché: {e}")
+            return None
+
+        with self._lock:
+            bucket = self._semantic.get(bucket_key)
+            if not bucket:
+                return None
+            scores, ids = bucket.index.search(vector, min(5, len(bucket)))
+            for score, idx in zip(scores[0], ids[0]):
+                if idx < 0 or score < self.semantic_threshold:
+                    break
+                response, stored_at = bucket.entries[idx]
+                if now - stored_at <= self.ttl_seconds:
+                    return response
+        return None
+
+    def _semantic_put(self, category, context, user_message, conversation_history, response, now):
+        if not self._semantic_applies(conversation_history):
+            return
+        try:
+            vector = embed_text(normalize_text(user_message))
+        except Exception as e:
+            logger.warning(f"⚠️ Error obteniendo embedding para caché: {e}")
+            return
+
+        bucket_key = self._bucket_key(category, context)
+        with self._lock:
+            bucket = self._semantic.get(bucket_key)
+            if bucket is None:
+                bucket = self._semantic[bucket_key] = _SemanticBucket(vector.shape[1])
+                while len(self._semantic) > self.semantic_max_buckets:
+                    self._semantic.popitem(last=False)
+            self._semantic.move_to_end(bucket_key)
+            bucket.index.add(vector)
+            bucket.entries.append((response, now))
+            if len(bucket) > self.semantic_max_per_category:
+                self._compact(bucket_key, bucket, now)
+
+    def _compact(self, bucket_key: str, bucket: _SemanticBucket, now: float):
+        """Reconstruir el índice sin entradas vencidas y con la mitad más reciente"""
+        # Llamar con self._lock tomado
+        keep = [
+            i for i, (_, stored_at) in enumerate(bucket.entries)
+            if now - stored_at <= self.ttl_seconds
+        ][-(self.semantic_max_per_category // 2):]
+        vectors = bucket.index.reconstruct_n(0, bucket.index.ntotal)
+        new_bucket = _SemanticBucket(bucket.index.d)
+        if keep:
+            new_bucket.index.add(vectors[keep])
+            new_bucket.entries = [bucket.entries[i] for i in keep]
+        self._semantic[bucket_key] = new_bucket
+
+
+response_cache = ResponseCache()
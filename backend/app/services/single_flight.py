@@ -0,0 +1,138 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Optional, TypeVar
+from sqlalchemy import text
+
+from ..database import lock_engine
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+SINGLE_FLIGHT_TIMEOUT_SECONDS = float(os.getenv("SINGLE_FLIGHT_TIMEOUT_SECONDS", "60"))
+SINGLE_FLIGHT_POLL_SECONDS = 0.5
+
+
+def advisory_lock_id(key: str) -> int:
+    """Id int64 (con signo) estable para pg_advisory_lock"""
+    return int.from_bytes(hashlib.sha256(key.encode()).digest()[:8], "big", signed=True)
+
+
+class SingleFlight:
+    """
+    Coalescencia de generaciones por ticket y estado del historial.
+
+    - Dentro del proceso: las llamadas concurrentes con la misma llave esperan
+      el mismo Future.
+    - Entre procesos (varios workers de uvicorn): el líder toma un advisory
+      lock de Postgres; los demás no llaman al LLM, esperan a que aparezca el
+      resultado guardado. Si el líder muere, Postgres libera el lock y otro
+      proceso lo toma.
+    """
+
+    def __init__(self, timeout: float = SINGLE_FLIGHT_TIMEOUT_SECONDS):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, Future] = {}
+        self._coalesced = 0
+
+    def run(self, key: str, generate: Callable[[], T], find_existing: Callable[[], Optional[T]]) -> T:
+        """
+        Args:
+            key: llave de la generación (ticket + estado del historial)
+            generate: produce y guarda el resultado (solo lo ejecuta el líder)
+            find_existing: busca un resultado ya guardado (reintentos / otro proceso)
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+            else:
+                self._coalesced += 1
+
+        if not leader:
+            return future.result(timeout=self.timeout)
+
+        try:
+            result = self._run_locked(key, generate, find_existing)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    @contextmanager
+    def lock_many(self, keys: Iterable[str]):
+        """
+        Tomar los advisory locks de varias llaves a la vez (escrituras por lote).
+        Espera a que terminen las generaciones en curso con esas llaves, hasta
+        `timeout`; mientras se tienen, las nuevas esperan el resultado guardado.
+        Los ids van ordenados para que dos lotes no se bloqueen mutuamente.
+        """
+        lock_ids = sorted({advisory_lock_id(key) for key in keys})
+        with lock_engine.connect() as conn:
+            conn.execute(text("SELECT set_config('lock_timeout', :timeout, true)"),
+                         {"timeout": f"{int(self.timeout * 1000)}ms"})
+            try:
+                conn.execute(text("SELECT pg_advisory_lock(id) FROM unnest(CAST(:ids AS bigint[])) AS id"),
+                             {"ids": lock_ids})
+            except Exception:
+                # Los locks de sesión no se sueltan con el rollback: no devolver
+                # al pool una conexión con parte del lote tomado
+                conn.rollback()
+                conn.execute(text("SELECT pg_advisory_unlock_all()"))
+                conn.commit()
+                raise
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(id) FROM unnest(CAST(:ids AS bigint[])) AS id"),
+                             {"ids": lock_ids})
+                conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"in_flight": len(self._in_flight), "coalesced": self._coalesced}
+
+    def _run_locked(self, key: str, generate, find_existing):
+        existing = find_existing()
+        if existing is not None:
+            return existing
+
+        lock_id = advisory_lock_id(key)
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with lock_engine.connect() as conn:
+                acquired = conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": lock_id}).scalar()
+                if acquired:
+                    try:
+                        # Otro proceso pudo terminar justo antes de soltar el lock
+                        existing = find_existing()
+                        if existing is not None:
+                            return existing
+                        return generate()
+                    finally:
+                        conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": lock_id})
+                        conn.commit()
+
+            # Otro proceso está generando: esperar su resultado sin llamar al LLM
+            if time.monotonic() >= deadline:
+                raise TimeoutError("Se agotó el tiempo esperando la generación en curso")
+            time.sleep(SINGLE_FLIGHT_POLL_SECONDS)
+            existing = find_existing()
+            if existing is not None:
+                with self._lock:
+                    self._coalesced += 1
+                return existing
+
+
+generation_flight = SingleFlight()
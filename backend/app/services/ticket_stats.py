@@ -0,0 +1,69 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+from uuid import UUID
+
+TICKET_STATS_TTL_SECONDS = float(os.getenv("TICKET_STATS_TTL_SECONDS", "30"))
+TICKET_STATS_MAX_USERS = int(os.getenv("TICKET_STATS_MAX_USERS", "10000"))
+
+
+class TicketStatsCache:
+    """
+    Conteo de tickets por estado, por usuario (None = todos), en memoria.
+
+    Las escrituras de este proceso ajustan el conteo en su lugar
+    (create_ticket / update_ticket); el TTL acota qué tan atrasado puede
+    quedar si otro proceso escribió en los tickets del usuario.
+    """
+
+    def __init__(self, ttl_seconds: float = TICKET_STATS_TTL_SECONDS, max_users: int = TICKET_STATS_MAX_USERS):
+        self.ttl_seconds = ttl_seconds
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Optional[UUID], tuple]" = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, user_id: Optional[UUID]) -> Optional[Dict[str, int]]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or time.monotonic() - entry[0] > self.ttl_seconds:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self._hits += 1
+            return dict(entry[1])
+
+    def put(self, user_id: Optional[UUID], counts: Dict[str, int]):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic(), dict(counts))
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+    def adjust(self, user_id: Optional[UUID], old_status: Optional[str], new_status: Optional[str]):
+        """Mover un ticket de old_status a new_status (None = ticket nuevo) en el usuario y en el global"""
+        with self._lock:
+            for key in (user_id, None):
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                counts = entry[1]
+                if old_status is not None:
+                    counts[old_status] = counts.get(old_status, 0) - 1
+                if new_status is not None:
+                    counts[new_status] = counts.get(new_status, 0) + 1
+
+    def invalidate(self, user_id: Optional[UUID] = None):
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._entries.pop(None, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self._hits, "misses": self._misses}
+
+
+ticket_stats_cache = TicketStatsCache()
@@ -0,0 +1,52 @@
+import os
+from typing import List, Dict, Tuple
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+# Tokens extra por mensaje en el formato de chat (rol, separadores)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_encoding = None
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            # Sin tiktoken se usa la aproximación de ~4 caracteres por token
+            _encoding = False
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Número de tokens de un texto (tiktoken si está disponible)"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+def message_tokens(message: Dict[str, str]) -> int:
+    return count_tokens(message.get("content", "")) + MESSAGE_OVERHEAD_TOKENS
+
+
+def pack_history(conversation_history: List[Dict[str, str]], budget: int) -> Tuple[List[Dict[str, str]], List[Dict[str, str]]]:
+    """
+    Llena el presupuesto de tokens con los mensajes más recientes.
+    
+    Returns:
+        (mensajes que no cupieron - los más antiguos, mensajes que sí caben)
+    """
+    used = 0
+    start = len(conversation_history)
+    for i in range(len(conversation_history) - 1, -1, -1):
+        cost = message_tokens(conversation_history[i])
+        if used + cost > budget:
+            break
+        used += cost
+        start = i
+    return conversation_history[:start], conversation_history[start:]
@@ -0,0 +1,51 @@
+"""
+Cuenta las consultas SQL que hace crud.get_all_users según el tamaño de página.
+
+Con el GROUP BY la cuenta debe ser 1 para cualquier página (antes eran
+1 + 3 por usuario).
+
+Uso (desde backend/):
+    python benchmarks/admin_users_queries.py
+    python benchmarks/admin_users_queries.py --sizes 10 100 500 --min-open 3
+"""
+import sys
+import time
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy import event
+
+from app import crud
+from app.database import engine, SessionLocal
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Consultas por página en /admin/users")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 100, 500])
+    parser.add_argument("--sort-by", default="open_tickets")
+    parser.add_argument("--min-open", type=int, default=None)
+    args = parser.parse_args()
+
+    statements = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    db = SessionLocal()
+    try:
+        print(f"{'page_size':>10} {'users':>6} {'queries':>8} {'ms':>8}")
+        for size in args.sizes:
+            statements.clear()
+            started = time.perf_counter()
+            users, _ = crud.get_all_users(db, None, size, sort_by=args.sort_by, min_open_tickets=args.min_open)
+            elapsed = (time.perf_counter() - started) * 1000
+            print(f"{size:>10} {len(users):>6} {len(statements):>8} {elapsed:>8.1f}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
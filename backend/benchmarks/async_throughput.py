@@ -0,0 +1,116 @@
+"""
+Throughput del polling de mensajes con la capa sync vs la async.
+
+Dos modos:
+  db    compara crud.get_messages en un pool de hilos (como corre FastAPI las
+        rutas `def`) contra crud_async.get_messages con asyncio.gather, ambos
+        contra la BD configurada en DATABASE_URL / ASYNC_DATABASE_URL.
+  http  lanza N clientes concurrentes contra un servidor ya levantado
+        (GET /messages/{ticket_id}); sirve para comparar una versión sync
+        del backend contra la async en la misma máquina.
+
+Uso (desde backend/):
+    python benchmarks/async_throughput.py db --ticket-id <uuid>
+    python benchmarks/async_throughput.py http --base-url http://localhost:8000 \\
+        --ticket-id <uuid> --clients 50 200 1000
+"""
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+from pathlib import Path
+from uuid import UUID
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+SYNC_THREADS = 40  # hilos por defecto del threadpool de Starlette
+
+
+def report(label: str, clients: int, latencies, elapsed: float, errors: int = 0):
+    p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+    print(
+        f"{label:<6} clientes={clients:<5} req/s={len(latencies) / elapsed:8.1f} "
+        f"p50={statistics.median(latencies) * 1000:7.1f}ms p95={p95 * 1000:7.1f}ms errores={errors}"
+    )
+
+
+def run_sync(ticket_id: UUID, clients: int, rounds: int):
+    from app import crud
+    from app.database import SessionLocal
+
+    def one():
+        start = time.perf_counter()
+        db = SessionLocal()
+        try:
+            crud.get_messages(db, ticket_id)
+        finally:
+            db.close()
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=SYNC_THREADS) as pool:
+        start = time.perf_counter()
+        latencies = list(pool.map(lambda _: one(), range(clients * rounds)))
+        report("sync", clients, latencies, time.perf_counter() - start)
+
+
+async def run_async(ticket_id: UUID, clients: int, rounds: int):
+    from app import crud_async
+    from app.database import AsyncSessionLocal, async_engine
+
+    async def one():
+        start = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            await crud_async.get_messages(db, ticket_id)
+        return time.perf_counter() - start
+
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(rounds):
+        latencies += await asyncio.gather(*(one() for _ in range(clients)))
+    report("async", clients, latencies, time.perf_counter() - start)
+    # Las conexiones quedan ligadas a este event loop; cada asyncio.run usa uno nuevo
+    await async_engine.dispose()
+
+
+async def run_http(base_url: str, ticket_id: UUID, clients: int, rounds: int):
+    import httpx
+
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        async def one():
+            start = time.perf_counter()
+            response = await client.get(f"/messages/{ticket_id}")
+            return time.perf_counter() - start, response.status_code >= 400
+
+        results = []
+        start = time.perf_counter()
+        for _ in range(rounds):
+            results += await asyncio.gather(*(one() for _ in range(clients)), return_exceptions=True)
+        elapsed = time.perf_counter() - start
+
+    ok = [r for r in results if isinstance(r, tuple)]
+    errors = len(results) - len(ok) + sum(1 for _, failed in ok if failed)
+    report("http", clients, [latency for latency, _ in ok] or [0.0], elapsed, errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput sync vs async del polling de mensajes")
+    parser.add_argument("mode", choices=["db", "http"])
+    parser.add_argument("--ticket-id", type=UUID, required=True)
+    parser.add_argument("--clients", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    args = parser.parse_args()
+
+    for clients in args.clients:
+        if args.mode == "db":
+            run_sync(args.ticket_id, clients, args.rounds)
+            asyncio.run(run_async(args.ticket_id, clients, args.rounds))
+        else:
+            asyncio.run(run_http(args.base_url, args.ticket_id, clients, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Latencia de la búsqueda de texto completo (crud.search_tickets, migración 0007)
+y verificación de que usa los índices GIN en lugar de recorrer messages.
+
+Solo lee: se puede correr contra una copia con datos reales.
+
+Uso (desde backend/):
+    python benchmarks/full_text_search.py
+    python benchmarks/full_text_search.py --terms "garantía" "falla eléctrica" --rounds 20
+"""
+import sys
+import json
+import time
+import argparse
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy import text
+
+from app import crud
+from app.database import SessionLocal
+
+DEFAULT_TERMS = ["garantía", "falla eléctrica", "\"cambio de aceite\"", "crédito -rechazado", "documentos or factura"]
+
+
+def index_names(plan, found=None):
+    """Índices usados en el árbol del plan (incluidas las particiones de messages)"""
+    found = set() if found is None else found
+    if "Index Name" in plan:
+        found.add(plan["Index Name"])
+    for child in plan.get("Plans", []):
+        index_names(child, found)
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latencia de GET /admin/search")
+    parser.add_argument("--terms", nargs="+", default=DEFAULT_TERMS)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    failures = 0
+    try:
+        for term in args.terms:
+            latencies = []
+            for _ in range(args.rounds):
+                start = time.perf_counter()
+                results, next_cursor = crud.search_tickets(db, term, limit=args.limit)
+                latencies.append(time.perf_counter() - start)
+            # Segunda página para medir el keyset
+            if next_cursor:
+                start = time.perf_counter()
+                crud.search_tickets(db, term, next_cursor, args.limit)
+                page_two = f"{(time.perf_counter() - start) * 1000:.1f}ms"
+            else:
+                page_two = "-"
+
+            plan = db.execute(text(f"EXPLAIN (FORMAT JSON) {crud.SEARCH_SQL}"), {
+                "query": term, "status": None, "category": None, "created_from": None, "created_to": None,
+                "after_rank": None, "after_id": None, "ticket_weight": crud.SEARCH_TICKET_WEIGHT,
+                "headline_options": crud.SEARCH_HEADLINE_OPTIONS, "limit": args.limit + 1,
+            }).scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            # Las particiones heredan el nombre del índice con sufijo (messages_2025_01_search_vector_idx)
+            used = {name for name in index_names(plan[0]["Plan"]) if "search" in name}
+            ok = bool(used)
+            failures += not ok
+            print(
+                f"{'✅' if ok else '❌'} {term!r:<26} resultados={len(results):<4} "
+                f"p50={statistics.median(latencies) * 1000:7.1f}ms max={max(latencies) * 1000:7.1f}ms "
+                f"página 2={page_two} índices={', '.join(sorted(used)) or 'ninguno'}"
+            )
+    finally:
+        db.close()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
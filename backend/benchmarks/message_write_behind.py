@@ -0,0 +1,87 @@
+"""
+Throughput y número de commits al guardar mensajes: una transacción por
+mensaje (crud.create_message) contra el write-behind por lotes
+(services.message_writer), con los mismos hilos concurrentes.
+
+Escribe mensajes de verdad en el ticket indicado: usar una BD de pruebas.
+
+Uso (desde backend/):
+    python benchmarks/message_write_behind.py --ticket-id <uuid>
+    python benchmarks/message_write_behind.py --ticket-id <uuid> --messages 20000 --threads 64 \\
+        --batch-rows 500 --delay-ms 10
+"""
+import sys
+import time
+import argparse
+import statistics
+from pathlib import Path
+from uuid import UUID
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy import event
+
+from app import crud, schemas
+from app.database import engine, SessionLocal
+from app.services.message_writer import MessageWriter
+
+
+class CommitCounter:
+    def __init__(self):
+        self.commits = 0
+
+    def __call__(self, conn):
+        self.commits += 1
+
+
+def run(label: str, write, ticket_id: UUID, messages: int, threads: int, counter: CommitCounter):
+    def one(n: int):
+        start = time.perf_counter()
+        write(schemas.MessageCreate(
+            ticket_id=ticket_id, content=f"benchmark {label} {n}", is_bot=n % 2 == 1, sender_name="benchmark"
+        ))
+        return time.perf_counter() - start
+
+    commits_before = counter.commits
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        start = time.perf_counter()
+        latencies = sorted(pool.map(one, range(messages)))
+        elapsed = time.perf_counter() - start
+    commits = counter.commits - commits_before
+    print(
+        f"{label:<13} mensajes={messages} msg/s={messages / elapsed:9.1f} commits={commits:<6} "
+        f"msg/commit={messages / max(commits, 1):6.1f} p50={statistics.median(latencies) * 1000:6.1f}ms "
+        f"p95={latencies[int(0.95 * (len(latencies) - 1))] * 1000:6.1f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mensajes por commit: por fila vs write-behind")
+    parser.add_argument("--ticket-id", type=UUID, required=True)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--batch-rows", type=int, default=200)
+    parser.add_argument("--delay-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    counter = CommitCounter()
+    event.listen(engine, "commit", counter)
+
+    def per_row(message):
+        db = SessionLocal()
+        try:
+            return crud.create_message(db, message)
+        finally:
+            db.close()
+
+    writer = MessageWriter(enabled=True, max_rows=args.batch_rows, max_delay_ms=args.delay_ms,
+                           buffer_size=args.messages)
+    run("por fila", per_row, args.ticket_id, args.messages, args.threads, counter)
+    run("write-behind", writer.write, args.ticket_id, args.messages, args.threads, counter)
+    writer.shutdown()
+    print(writer.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Tiempo de serialización por cada 1.000 mensajes: el camino por defecto de
+FastAPI (objeto ORM -> modelo Pydantic con from_attributes -> json.dumps de
+JSONResponse) contra app.serialization (Row de columnas -> dict -> orjson).
+
+No consulta la BD: arma en memoria mensajes sintéticos con el tamaño de los
+reales y verifica que ambos caminos produzcan exactamente los mismos bytes.
+
+Uso (desde backend/):
+    python benchmarks/serialization.py
+    python benchmarks/serialization.py --messages 1000 10000 50000 --rounds 5
+"""
+import sys
+import json
+import time
+import uuid
+import argparse
+import statistics
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from pydantic import TypeAdapter
+from sqlalchemy.engine.result import result_tuple
+
+from app import models, schemas
+from app.serialization import MESSAGE_COLUMNS, TICKET_COLUMNS, FastJSONResponse, rows_to_dicts
+
+CONTENT = (
+    "Hola, compré un auto con garantía extendida y desde la semana pasada el tablero marca una falla "
+    "eléctrica intermitente. ¿Qué documentos necesito para agendar la revisión en el centro de servicio?"
+)
+
+
+def build(count: int):
+    """(ticket ORM con mensajes ORM, fila de ticket, filas de mensajes) con los mismos valores"""
+    ticket_id, user_id, start = uuid.uuid4(), uuid.uuid4(), datetime(2025, 3, 1, 9, 30, 0, 123456)
+    ticket_values = {
+        "title": "Falla eléctrica en el tablero", "category": "garantia", "description": CONTENT,
+        "id": ticket_id, "user_id": user_id, "status": "in_progress",
+        "created_at": start, "updated_at": start + timedelta(days=2),
+    }
+    message_values = [
+        {
+            "content": CONTENT if n % 2 == 0 else f"Respuesta {n}: " + CONTENT[::-1],
+            "is_bot": n % 2 == 1,
+            "sender_name": "Asistente Kavak" if n % 2 else "Usuario",
+            "id": uuid.uuid4(),
+            "ticket_id": ticket_id,
+            "created_at": start + timedelta(seconds=37 * n, microseconds=n),
+        }
+        for n in range(count)
+    ]
+
+    ticket = models.Ticket(**ticket_values)
+    ticket.messages = [models.Message(**values) for values in message_values]
+
+    make_ticket_row = result_tuple([c.key for c in TICKET_COLUMNS])
+    make_message_row = result_tuple([c.key for c in MESSAGE_COLUMNS])
+    ticket_row = make_ticket_row(tuple(ticket_values[c.key] for c in TICKET_COLUMNS))
+    message_rows = [make_message_row(tuple(v[c.key] for c in MESSAGE_COLUMNS)) for v in message_values]
+    return ticket, ticket_row, message_rows
+
+
+def default_path(adapter: TypeAdapter, value) -> bytes:
+    """Lo que hace FastAPI con response_model: validar, volcar en modo json y json.dumps"""
+    validated = adapter.validate_python(value, from_attributes=True)
+    content = adapter.dump_python(validated, mode="json")
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode()
+
+
+def timed(fn, rounds: int) -> float:
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serialización Pydantic + json vs columnas + orjson")
+    parser.add_argument("--messages", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--rounds", type=int, default=7)
+    args = parser.parse_args()
+
+    messages_adapter = TypeAdapter(List[schemas.Message])
+    ticket_adapter = TypeAdapter(schemas.TicketWithMessages)
+    response = FastJSONResponse(None)
+    failures = 0
+
+    for count in args.messages:
+        ticket, ticket_row, message_rows = build(count)
+        cases = [
+            ("GET /messages/{id}",
+             lambda: default_path(messages_adapter, ticket.messages),
+             lambda: response.render(rows_to_dicts(message_rows))),
+            ("GET /tickets/{id}",
+             lambda: default_path(ticket_adapter, ticket),
+             lambda: response.render({**ticket_row._asdict(), "messages": rows_to_dicts(message_rows)})),
+        ]
+        for label, slow, fast in cases:
+            identical = slow() == fast()
+            failures += not identical
+            slow_s, fast_s = timed(slow, args.rounds), timed(fast, args.rounds)
+            per_k = 1000 / count
+            print(
+                f"{'✅' if identical else '❌'} {label:<19} mensajes={count:<6} "
+                f"pydantic+json={slow_s * 1000 * per_k:7.2f}ms/1000 orjson={fast_s * 1000 * per_k:6.2f}ms/1000 "
+                f"x{slow_s / fast_s:5.1f} bytes_iguales={identical}"
+            )
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
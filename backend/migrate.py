@@ -0,0 +1,106 @@
+"""
+Aplica las migraciones SQL versionadas de backend/migrations en orden.
+
+Cada archivo NNNN_descripcion.sql se ejecuta una sola vez y queda registrado
+en la tabla schema_migrations.
+
+Los archivos que empiezan con `-- migrate:no-transaction` (p. ej. CREATE INDEX
+CONCURRENTLY) se ejecutan sentencia por sentencia en autocommit; deben ser
+idempotentes (IF NOT EXISTS) por si se interrumpen a la mitad.
+
+Uso:
+    python migrate.py            # aplicar pendientes
+    python migrate.py --status   # ver aplicadas / pendientes
+"""
+import os
+import re
+import sys
+from pathlib import Path
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, text
+
+load_dotenv()
+
+MIGRATIONS_DIR = Path(__file__).parent / "migrations"
+NO_TRANSACTION_MARKER = "-- migrate:no-transaction"
+
+
+def get_migrations():
+    return sorted(p for p in MIGRATIONS_DIR.glob("*.sql") if p.name[:4].isdigit())
+
+
+def get_applied(conn):
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version VARCHAR(255) PRIMARY KEY,
+            applied_at TIMESTAMP NOT NULL DEFAULT now()
+        )
+    """))
+    return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def split_statements(sql):
+    """Sentencias separadas por ';' al final de línea (sin bloques de solo comentarios)"""
+    statements = []
+    for chunk in re.split(r";[ \t]*$", sql, flags=re.MULTILINE):
+        code = "\n".join(l for l in chunk.splitlines() if not l.strip().startswith("--")).strip()
+        if code:
+            statements.append(chunk.strip())
+    return statements
+
+
+def apply_without_transaction(engine, sql):
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        with conn.connection.cursor() as cursor:
+            for statement in split_statements(sql):
+                cursor.execute(statement)
+
+
+def apply_migration(engine, path):
+    sql = path.read_text(encoding="utf-8")
+    if sql.startswith(NO_TRANSACTION_MARKER):
+        apply_without_transaction(engine, sql)
+    with engine.begin() as conn:
+        if not sql.startswith(NO_TRANSACTION_MARKER):
+            # Cursor DBAPI directo: el archivo puede traer varias sentencias
+            with conn.connection.cursor() as cursor:
+                cursor.execute(sql)
+        conn.execute(
+            text("INSERT INTO schema_migrations (version) VALUES (:version)"),
+            {"version": path.stem}
+        )
+
+
+def apply_pending(engine):
+    """Aplicar en orden las migraciones que faltan; devuelve las aplicadas"""
+    with engine.begin() as conn:
+        applied = get_applied(conn)
+    pending = [p for p in get_migrations() if p.stem not in applied]
+    for path in pending:
+        print(f"🔵 Aplicando {path.name}...")
+        apply_migration(engine, path)
+        print(f"✅ {path.name} aplicada")
+    return pending
+
+
+def main():
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        raise ValueError("❌ DATABASE_URL no está definida")
+
+    engine = create_engine(database_url)
+
+    if "--status" in sys.argv:
+        with engine.begin() as conn:
+            applied = get_applied(conn)
+        for path in get_migrations():
+            mark = "✅" if path.stem in applied else "⏳"
+            print(f"{mark} {path.stem}")
+        return
+
+    if not apply_pending(engine):
+        print("✅ No hay migraciones pendientes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+-- Resumen acumulado por ticket de los turnos que ya no caben en el presupuesto de tokens
+CREATE TABLE IF NOT EXISTS ticket_summaries (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    ticket_id UUID NOT NULL UNIQUE REFERENCES tickets(id) ON DELETE CASCADE,
+    summary TEXT NOT NULL DEFAULT '',
+    summarized_until TIMESTAMP,
+    summarized_messages INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT now(),
+    updated_at TIMESTAMP DEFAULT now()
+);
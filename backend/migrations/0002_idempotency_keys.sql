@@ -0,0 +1,8 @@
+-- Llaves de idempotencia de POST /messages (reintentos devuelven el mensaje guardado)
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key VARCHAR(255) PRIMARY KEY,
+    ticket_id UUID NOT NULL REFERENCES tickets(id) ON DELETE CASCADE,
+    message_id UUID NOT NULL REFERENCES messages(id) ON DELETE CASCADE,
+    bot_job_id UUID,
+    created_at TIMESTAMP DEFAULT now()
+);
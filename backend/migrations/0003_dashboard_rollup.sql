@@ -0,0 +1,169 @@
+-- Contadores del dashboard de admin mantenidos por triggers de sentencia.
+-- Cada fila es (métrica, bucket) con un conteo y una suma, así
+-- /admin/dashboard lee unas decenas de filas sin importar el tamaño de las tablas.
+--
+-- Para que las escrituras concurrentes no queden en fila detrás de la misma
+-- fila ('messages', 'all'), cada (metric, bucket) se reparte en 16 shards según
+-- la conexión (pg_backend_pid): transacciones de conexiones distintas casi
+-- nunca se bloquean y una misma conexión siempre toma sus filas en el mismo
+-- orden. Las lecturas suman los shards.
+CREATE TABLE IF NOT EXISTS dashboard_rollup (
+    metric VARCHAR(50) NOT NULL,
+    bucket VARCHAR(255) NOT NULL DEFAULT '',
+    shard SMALLINT NOT NULL DEFAULT 0,
+    count BIGINT NOT NULL DEFAULT 0,
+    total DOUBLE PRECISION NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (metric, bucket, shard)
+);
+
+-- Filas afectadas por la sentencia con su signo (+1 nuevas, -1 anteriores).
+-- Las tablas de transición se llaman new_rows / old_rows en todos los triggers.
+CREATE OR REPLACE FUNCTION rollup_changed_rows(op TEXT) RETURNS TEXT
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT CASE op
+        WHEN 'INSERT' THEN 'SELECT n.*, 1 AS s FROM new_rows n'
+        WHEN 'DELETE' THEN 'SELECT o.*, -1 AS s FROM old_rows o'
+        ELSE 'SELECT n.*, 1 AS s FROM new_rows n UNION ALL SELECT o.*, -1 AS s FROM old_rows o'
+    END
+$$;
+
+-- Sentencia que aplica los deltas (metric, bucket, n, total) de la sentencia
+-- que disparó el trigger. Se agregan antes de escribir (una fila por bucket por
+-- sentencia, no por fila insertada) y se ordenan para que sentencias
+-- concurrentes tomen los locks en el mismo orden. Solo arma el texto: las
+-- tablas de transición solo son visibles en la función del trigger, así que
+-- cada trigger la ejecuta con EXECUTE.
+CREATE OR REPLACE FUNCTION rollup_sql(op TEXT, deltas TEXT) RETURNS TEXT
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT format($q$
+        INSERT INTO dashboard_rollup AS r (metric, bucket, shard, count, total)
+        SELECT d.metric, d.bucket, (pg_backend_pid() %% 16)::smallint, SUM(d.n), SUM(d.total)
+        FROM (%s) t
+        CROSS JOIN LATERAL (VALUES %s) AS d(metric, bucket, n, total)
+        GROUP BY d.metric, d.bucket
+        HAVING SUM(d.n) <> 0 OR SUM(d.total) <> 0
+        ORDER BY d.metric, d.bucket
+        ON CONFLICT (metric, bucket, shard) DO UPDATE
+        SET count = r.count + EXCLUDED.count,
+            total = r.total + EXCLUDED.total,
+            updated_at = now()
+    $q$, rollup_changed_rows(op), deltas)
+$$;
+
+CREATE OR REPLACE FUNCTION rollup_users() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    EXECUTE rollup_sql(TG_OP, $v$
+        ('users', COALESCE(t.role, 'user'), t.s, 0::float8)
+    $v$);
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION rollup_tickets() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    EXECUTE rollup_sql(TG_OP, $v$
+        ('tickets_status', COALESCE(t.status, ''), t.s, 0::float8),
+        ('tickets_category', COALESCE(t.category, ''), t.s, 0::float8)
+    $v$);
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION rollup_messages() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    EXECUTE rollup_sql(TG_OP, $v$
+        ('messages', 'all', t.s, 0::float8),
+        ('messages', 'bot', CASE WHEN t.is_bot THEN t.s ELSE 0 END, 0::float8)
+    $v$);
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION rollup_chatbot_metrics() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    EXECUTE rollup_sql(TG_OP, $v$
+        ('metric_escalated', '', CASE WHEN t.was_escalated THEN t.s ELSE 0 END, 0::float8),
+        ('metric_resolution_time', '',
+            CASE WHEN t.resolution_time_minutes IS NOT NULL THEN t.s ELSE 0 END,
+            COALESCE(t.resolution_time_minutes, 0)::float8 * t.s),
+        ('metric_satisfaction', '',
+            CASE WHEN t.user_satisfaction_score IS NOT NULL THEN t.s ELSE 0 END,
+            COALESCE(t.user_satisfaction_score, 0)::float8 * t.s)
+    $v$);
+    RETURN NULL;
+END;
+$$;
+
+-- Recalcular todo desde cero (backfill inicial o tras cargas con TRUNCATE)
+CREATE OR REPLACE FUNCTION refresh_dashboard_rollup() RETURNS void
+LANGUAGE plpgsql AS $$
+BEGIN
+    LOCK TABLE users, tickets, messages, chatbot_metrics IN SHARE MODE;
+    DELETE FROM dashboard_rollup;
+    INSERT INTO dashboard_rollup (metric, bucket, count, total)
+    SELECT 'users', COALESCE(role, 'user'), COUNT(*), 0 FROM users GROUP BY 2
+    UNION ALL
+    SELECT 'tickets_status', COALESCE(status, ''), COUNT(*), 0 FROM tickets GROUP BY 2
+    UNION ALL
+    SELECT 'tickets_category', COALESCE(category, ''), COUNT(*), 0 FROM tickets GROUP BY 2
+    UNION ALL
+    SELECT 'messages', 'all', COUNT(*), 0 FROM messages
+    UNION ALL
+    SELECT 'messages', 'bot', COUNT(*) FILTER (WHERE is_bot), 0 FROM messages
+    UNION ALL
+    SELECT 'metric_escalated', '', COUNT(*) FILTER (WHERE was_escalated), 0 FROM chatbot_metrics
+    UNION ALL
+    SELECT 'metric_resolution_time', '', COUNT(resolution_time_minutes),
+           COALESCE(SUM(resolution_time_minutes), 0) FROM chatbot_metrics
+    UNION ALL
+    SELECT 'metric_satisfaction', '', COUNT(user_satisfaction_score),
+           COALESCE(SUM(user_satisfaction_score), 0) FROM chatbot_metrics;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS users_rollup_insert ON users;
+DROP TRIGGER IF EXISTS users_rollup_update ON users;
+DROP TRIGGER IF EXISTS users_rollup_delete ON users;
+CREATE TRIGGER users_rollup_insert AFTER INSERT ON users
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION rollup_users();
+CREATE TRIGGER users_rollup_update AFTER UPDATE ON users
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION rollup_users();
+CREATE TRIGGER users_rollup_delete AFTER DELETE ON users
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION rollup_users();
+
+DROP TRIGGER IF EXISTS tickets_rollup_insert ON tickets;
+DROP TRIGGER IF EXISTS tickets_rollup_update ON tickets;
+DROP TRIGGER IF EXISTS tickets_rollup_delete ON tickets;
+CREATE TRIGGER tickets_rollup_insert AFTER INSERT ON tickets
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION rollup_tickets();
+CREATE TRIGGER tickets_rollup_update AFTER UPDATE ON tickets
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION rollup_tickets();
+CREATE TRIGGER tickets_rollup_delete AFTER DELETE ON tickets
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION rollup_tickets();
+
+DROP TRIGGER IF EXISTS messages_rollup_insert ON messages;
+DROP TRIGGER IF EXISTS messages_rollup_update ON messages;
+DROP TRIGGER IF EXISTS messages_rollup_delete ON messages;
+CREATE TRIGGER messages_rollup_insert AFTER INSERT ON messages
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION rollup_messages();
+CREATE TRIGGER messages_rollup_update AFTER UPDATE ON messages
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION rollup_messages();
+CREATE TRIGGER messages_rollup_delete AFTER DELETE ON messages
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION rollup_messages();
+
+DROP TRIGGER IF EXISTS chatbot_metrics_rollup_insert ON chatbot_metrics;
+DROP TRIGGER IF EXISTS chatbot_metrics_rollup_update ON chatbot_metrics;
+DROP TRIGGER IF EXISTS chatbot_metrics_rollup_delete ON chatbot_metrics;
+CREATE TRIGGER chatbot_metrics_rollup_insert AFTER INSERT ON chatbot_metrics
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION rollup_chatbot_metrics();
+CREATE TRIGGER chatbot_metrics_rollup_update AFTER UPDATE ON chatbot_metrics
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION rollup_chatbot_metrics();
+CREATE TRIGGER chatbot_metrics_rollup_delete AFTER DELETE ON chatbot_metrics
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION rollup_chatbot_metrics();
+
+SELECT refresh_dashboard_rollup();
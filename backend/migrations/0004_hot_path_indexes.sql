@@ -0,0 +1,39 @@
+-- migrate:no-transaction
+-- Índices para las consultas frecuentes de crud.py, kavak_metrics.py y
+-- streamlit/pages/2_tools.py. CONCURRENTLY para no bloquear escrituras en
+-- producción (por eso esta migración corre fuera de transacción).
+-- Deben coincidir con los Index declarados en app/models.py.
+
+-- Historial / listado paginado de mensajes de un ticket, último mensaje,
+-- respuesta del bot a un mensaje y conversación completa (kavak_metrics)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_messages_ticket_created
+    ON messages (ticket_id, created_at, id);
+
+-- Conteos y cortes por rango de fechas (kavak_metrics, 2_tools.py);
+-- INCLUDE permite contestar COUNT / COUNT(DISTINCT ticket_id) / FILTER is_bot
+-- sin leer la tabla
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_messages_created
+    ON messages (created_at) INCLUDE (ticket_id, is_bot);
+
+-- Tickets de un usuario (más recientes primero, cursor por (created_at, id))
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tickets_user_created
+    ON tickets (user_id, created_at DESC, id DESC);
+
+-- Listado general de tickets y actividad reciente del dashboard
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tickets_created
+    ON tickets (created_at DESC, id DESC);
+
+-- Filtros por estado ordenados por fecha (2_tools.py, regeneración masiva)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tickets_status_created
+    ON tickets (status, created_at DESC);
+
+-- Ratings por ticket (satisfacción) y por mensaje (índice FAQ)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_message_ratings_ticket
+    ON message_ratings (ticket_id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_message_ratings_message
+    ON message_ratings (message_id);
+
+-- Borrado en cascada desde tickets y búsqueda de llaves por ticket
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_idempotency_keys_ticket
+    ON idempotency_keys (ticket_id);
@@ -0,0 +1,4 @@
+-- Estado para mantener chatbot_metrics de forma incremental en cada mensaje:
+-- cuántas latencias lleva el promedio y desde cuándo espera respuesta el usuario
+ALTER TABLE chatbot_metrics ADD COLUMN IF NOT EXISTS response_samples INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE chatbot_metrics ADD COLUMN IF NOT EXISTS pending_user_message_at TIMESTAMP;
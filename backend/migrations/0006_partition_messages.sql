@@ -0,0 +1,140 @@
+-- messages particionada por mes (RANGE sobre created_at).
+-- kavak_metrics.py y streamlit/pages/2_tools.py filtran por created_at, así
+-- que esas consultas solo leen las particiones del rango; el archivado
+-- (app/services/message_archive.py) exporta y desprende meses completos.
+--
+-- Reescribe la tabla completa dentro de una transacción con ACCESS EXCLUSIVE:
+-- correrla en una ventana de mantenimiento.
+--
+-- La llave primaria pasa a ser (id, created_at): en una tabla particionada
+-- toda restricción única debe incluir la columna de partición. Por eso las FK
+-- message_ratings.message_id e idempotency_keys.message_id se eliminan (los
+-- ids siguen siendo uuid4 únicos); ambas tablas siguen colgando de tickets
+-- con ON DELETE CASCADE.
+
+LOCK TABLE messages IN ACCESS EXCLUSIVE MODE;
+
+DO $$
+DECLARE
+    fk RECORD;
+BEGIN
+    FOR fk IN
+        SELECT conrelid::regclass AS tbl, conname
+        FROM pg_constraint
+        WHERE contype = 'f' AND confrelid = 'messages'::regclass
+    LOOP
+        EXECUTE format('ALTER TABLE %s DROP CONSTRAINT %I', fk.tbl, fk.conname);
+    END LOOP;
+END;
+$$;
+
+ALTER TABLE messages RENAME TO messages_unpartitioned;
+ALTER INDEX IF EXISTS messages_pkey RENAME TO messages_unpartitioned_pkey;
+
+CREATE TABLE messages (
+    LIKE messages_unpartitioned INCLUDING DEFAULTS
+) PARTITION BY RANGE (created_at);
+ALTER TABLE messages ALTER COLUMN created_at SET NOT NULL;
+
+-- Red de seguridad: filas fuera de las particiones mensuales (importaciones
+-- de fechas viejas, meses ya archivados). create_messages_partition las mueve
+-- a su mes cuando se crea la partición.
+CREATE TABLE messages_default PARTITION OF messages DEFAULT;
+
+CREATE OR REPLACE FUNCTION messages_partition_name(month DATE) RETURNS TEXT
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT 'messages_' || to_char(month, 'YYYY_MM')
+$$;
+
+-- Crea la partición del mes de `month` si no existe; devuelve true si la creó
+CREATE OR REPLACE FUNCTION create_messages_partition(month DATE) RETURNS boolean
+LANGUAGE plpgsql AS $$
+DECLARE
+    start_at TIMESTAMP := date_trunc('month', month);
+    end_at TIMESTAMP := date_trunc('month', month) + interval '1 month';
+    name TEXT := messages_partition_name(date_trunc('month', month)::date);
+BEGIN
+    -- Un mes archivado sin borrar conserva su tabla desprendida: no se recrea
+    IF to_regclass(name) IS NOT NULL THEN
+        RETURN false;
+    END IF;
+    EXECUTE format('CREATE TABLE %I (LIKE messages INCLUDING DEFAULTS)', name);
+    -- Se borra de la partición DEFAULT directamente (no de messages): los
+    -- triggers de sentencia del rollup no ven este movimiento
+    EXECUTE format($q$
+        WITH moved AS (
+            DELETE FROM messages_default WHERE created_at >= %L AND created_at < %L RETURNING *
+        )
+        INSERT INTO %I SELECT * FROM moved
+    $q$, start_at, end_at, name);
+    -- ATTACH crea los índices, la PK y la FK a tickets de la partición
+    EXECUTE format('ALTER TABLE messages ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                   name, start_at, end_at);
+    RETURN true;
+END;
+$$;
+
+-- Particiones desde hace months_back meses hasta months_ahead meses adelante
+-- (UTC, como guarda la app created_at). La llaman el backend al arrancar y
+-- una vez al día (app/services/message_partitions.py) y el job de archivado.
+CREATE OR REPLACE FUNCTION ensure_messages_partitions(months_ahead INT DEFAULT 3, months_back INT DEFAULT 0)
+RETURNS INT
+LANGUAGE plpgsql AS $$
+DECLARE
+    current_month DATE := date_trunc('month', now() AT TIME ZONE 'utc')::date;
+    month DATE;
+    created INT := 0;
+BEGIN
+    -- Varias instancias arrancando a la vez
+    PERFORM pg_advisory_xact_lock(hashtext('ensure_messages_partitions'));
+    FOR month IN
+        SELECT generate_series(current_month - make_interval(months => months_back),
+                               current_month + make_interval(months => months_ahead),
+                               interval '1 month')::date
+    LOOP
+        IF create_messages_partition(month) THEN
+            created := created + 1;
+        END IF;
+    END LOOP;
+    RETURN created;
+END;
+$$;
+
+-- Un mes por cada mes con datos, más los próximos tres
+SELECT ensure_messages_partitions(
+    3,
+    COALESCE((
+        SELECT (extract(year FROM age(date_trunc('month', now() AT TIME ZONE 'utc'),
+                                      date_trunc('month', MIN(created_at)))) * 12
+              + extract(month FROM age(date_trunc('month', now() AT TIME ZONE 'utc'),
+                                       date_trunc('month', MIN(created_at)))))::int
+        FROM messages_unpartitioned
+    ), 0)
+);
+
+-- Sin triggers todavía en la tabla nueva: las filas se mueven, el rollup no cambia
+INSERT INTO messages (id, ticket_id, content, is_bot, sender_name, created_at)
+SELECT id, ticket_id, content, is_bot, sender_name, COALESCE(created_at, now() AT TIME ZONE 'utc')
+FROM messages_unpartitioned;
+
+DROP TABLE messages_unpartitioned;
+
+-- Índices después de la copia (más rápido que mantenerlos fila por fila).
+-- Mismos nombres que la migración 0004 / app/models.py.
+ALTER TABLE messages ADD CONSTRAINT messages_pkey PRIMARY KEY (id, created_at);
+ALTER TABLE messages ADD CONSTRAINT messages_ticket_id_fkey
+    FOREIGN KEY (ticket_id) REFERENCES tickets(id) ON DELETE CASCADE;
+CREATE INDEX IF NOT EXISTS ix_messages_ticket_created ON messages (ticket_id, created_at, id);
+CREATE INDEX IF NOT EXISTS ix_messages_created ON messages (created_at) INCLUDE (ticket_id, is_bot);
+-- Búsqueda por id sin created_at (get_message, llaves de idempotencia, ratings)
+CREATE INDEX IF NOT EXISTS ix_messages_id ON messages (id);
+
+-- Triggers del rollup (migración 0003). En una tabla particionada los
+-- triggers de sentencia con tablas de transición se definen en la tabla
+-- padre y ven las filas de todas las particiones.
+CREATE TRIGGER messages_rollup_insert AFTER INSERT ON messages
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION rollup_messages();
+CREATE TRIGGER messages_rollup_update AFTER UPDATE ON messages
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION rollup_messages();
+CREATE TRIGGER messages_rollup_delete AFTER DELETE ON messages
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION rollup_messages();
@@ -0,0 +1,63 @@
+-- Búsqueda de texto completo sobre mensajes y tickets (GET /admin/search).
+-- Configuración en español que además quita acentos: "garantia" encuentra
+-- "garantía" y "eléctricas" encuentra "falla eléctrica".
+--
+-- Las columnas search_vector son generadas (las mantiene Postgres en cada
+-- INSERT / UPDATE) y no están en app/models.py: solo las lee la consulta de
+-- crud.search_tickets. Agregarlas reescribe messages y tickets, y los índices
+-- GIN no se pueden crear CONCURRENTLY sobre una tabla particionada: correr
+-- en una ventana de mantenimiento.
+
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'spanish_unaccent') THEN
+        CREATE TEXT SEARCH CONFIGURATION spanish_unaccent (COPY = spanish);
+        ALTER TEXT SEARCH CONFIGURATION spanish_unaccent
+            ALTER MAPPING FOR hword, hword_part, word WITH unaccent, spanish_stem;
+    END IF;
+END;
+$$;
+
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (to_tsvector('spanish_unaccent'::regconfig, COALESCE(content, ''))) STORED;
+
+-- El título pesa más que la descripción, y ésta más que la categoría
+ALTER TABLE tickets ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('spanish_unaccent'::regconfig, COALESCE(title, '')), 'A') ||
+        setweight(to_tsvector('spanish_unaccent'::regconfig, COALESCE(description, '')), 'B') ||
+        setweight(to_tsvector('spanish_unaccent'::regconfig, COALESCE(category, '')), 'C')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS ix_messages_search ON messages USING gin (search_vector);
+CREATE INDEX IF NOT EXISTS ix_tickets_search ON tickets USING gin (search_vector);
+
+-- Igual que en 0006, pero la partición nueva copia la columna generada
+-- (INCLUDING GENERATED) y las filas se mueven sin ella: una columna generada
+-- no acepta valores explícitos.
+CREATE OR REPLACE FUNCTION create_messages_partition(month DATE) RETURNS boolean
+LANGUAGE plpgsql AS $$
+DECLARE
+    start_at TIMESTAMP := date_trunc('month', month);
+    end_at TIMESTAMP := date_trunc('month', month) + interval '1 month';
+    name TEXT := messages_partition_name(date_trunc('month', month)::date);
+BEGIN
+    IF to_regclass(name) IS NOT NULL THEN
+        RETURN false;
+    END IF;
+    EXECUTE format('CREATE TABLE %I (LIKE messages INCLUDING DEFAULTS INCLUDING GENERATED)', name);
+    EXECUTE format($q$
+        WITH moved AS (
+            DELETE FROM messages_default WHERE created_at >= %L AND created_at < %L
+            RETURNING id, ticket_id, content, is_bot, sender_name, created_at
+        )
+        INSERT INTO %I (id, ticket_id, content, is_bot, sender_name, created_at)
+        SELECT id, ticket_id, content, is_bot, sender_name, created_at FROM moved
+    $q$, start_at, end_at, name);
+    EXECUTE format('ALTER TABLE messages ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                   name, start_at, end_at);
+    RETURN true;
+END;
+$$;
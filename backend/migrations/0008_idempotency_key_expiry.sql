@@ -0,0 +1,5 @@
+-- migrate:no-transaction
+-- Las Idempotency-Key vencen a las IDEMPOTENCY_KEY_TTL_HOURS: el backend
+-- borra periódicamente las vencidas por created_at. CONCURRENTLY para no
+-- bloquear los POST /messages (por eso corre fuera de transacción).
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_idempotency_keys_created_at ON idempotency_keys (created_at);
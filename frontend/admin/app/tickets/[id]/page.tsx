@@ -82,18 +82,19 @@ export default function TicketChatPage() {
                 prev.map(msg => msg.id === tempMessage.id ? userMessage : msg)
             );
 
-            // El backend ahora responde automáticamente con OpenAI
-            // Esperamos un poco y recargamos los mensajes para obtener la respuesta del bot
-            setTimeout(async () => {
-                try {
-                    const updatedMessages = await api.getMessages(ticketId);
-                    setMessages(updatedMessages);
-                } catch (err) {
-                    console.error('Error al obtener mensajes actualizados:', err);
-                } finally {
-                    setIsTyping(false);
-                }
-            }, 2000); // Esperar 2 segundos para dar tiempo a OpenAI
+            // El backend responde en segundo plano: se espera su job y,
+            // si no está disponible, se sondean los mensajes nuevos
+            try {
+                const newMessages = await api.waitForBotReply(ticketId, userMessage.id, userMessage.bot_job_id);
+                setMessages((prev) => [
+                    ...prev,
+                    ...newMessages.filter(m => !prev.some(p => p.id === m.id)),
+                ]);
+            } catch (err) {
+                console.error('Error al obtener mensajes actualizados:', err);
+            } finally {
+                setIsTyping(false);
+            }
 
         } catch (err) {
             console.error('Error al enviar mensaje:', err);
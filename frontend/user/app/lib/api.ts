@@ -1,5 +1,9 @@
 const API_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
 
+// Sondeo de la respuesta del bot cuando no se puede consultar su job
+const BOT_REPLY_POLL_MS = 1500;
+const BOT_REPLY_TIMEOUT_MS = 60000;
+
 // Tipos
 export interface User {
   id: string;
@@ -35,6 +39,12 @@ export interface Message {
   created_at: string;
 }
 
+export interface MessageSync {
+  messages: Message[];
+  cursor: string | null;
+  has_more: boolean;
+}
+
 export interface TicketStats {
   total: number;
   open: number;
@@ -47,6 +57,19 @@ export interface TicketWithMessages extends Ticket {
   messages: Message[];
 }
 
+export interface SentMessage extends Message {
+  bot_job_id?: string;
+}
+
+export interface BotJob {
+  id: string;
+  ticket_id: string;
+  user_message_id: string;
+  status: 'queued' | 'running' | 'done' | 'failed';
+  bot_message?: Message | null;
+  error?: string | null;
+}
+
 // API Functions
 export const api = {
   // Auth
@@ -130,9 +153,32 @@ export const api = {
 
   // Messages
   async getMessages(ticketId: string): Promise<Message[]> {
-    const response = await fetch(`${API_URL}/messages/${ticketId}`);
-    if (!response.ok) throw new Error('Error al obtener mensajes');
-    return response.json();
+    // El backend pagina por cursor: se siguen las páginas hasta la última
+    const messages: Message[] = [];
+    let cursor: string | null = null;
+    do {
+      const query: string = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+      const response = await fetch(`${API_URL}/messages/${ticketId}${query}`);
+      if (!response.ok) throw new Error('Error al obtener mensajes');
+      messages.push(...(await response.json()));
+      cursor = response.headers.get('X-Next-Cursor');
+    } while (cursor);
+    return messages;
+  },
+
+  // Solo los mensajes posteriores a afterId (el último que ya tiene el cliente)
+  async syncMessages(ticketId: string, afterId: string): Promise<Message[]> {
+    const messages: Message[] = [];
+    let query = `after_id=${afterId}`;
+    let sync: MessageSync;
+    do {
+      const response = await fetch(`${API_URL}/messages/${ticketId}/sync?${query}`);
+      if (!response.ok) throw new Error('Error al sincronizar mensajes');
+      sync = await response.json();
+      messages.push(...sync.messages);
+      query = `cursor=${encodeURIComponent(sync.cursor || '')}`;
+    } while (sync.has_more);
+    return messages;
   },
 
   async sendMessage(message: {
@@ -140,13 +186,50 @@ export const api = {
     content: string;
     is_bot?: boolean;
     sender_name?: string;
-  }): Promise<Message> {
+  }, idempotencyKey?: string): Promise<SentMessage> {
+    const headers: Record<string, string> = { 'Content-Type': 'application/json' };
+    // Los reintentos con la misma llave no duplican el mensaje ni la respuesta del bot
+    if (idempotencyKey) headers['Idempotency-Key'] = idempotencyKey;
     const response = await fetch(`${API_URL}/messages/`, {
       method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
+      headers,
       body: JSON.stringify(message),
     });
     if (!response.ok) throw new Error('Error al enviar mensaje');
+    const sent: SentMessage = await response.json();
+    // La respuesta del bot se genera en segundo plano
+    const jobId = response.headers.get('X-Bot-Job-Id');
+    if (jobId) sent.bot_job_id = jobId;
+    return sent;
+  },
+
+  async waitForBotJob(jobId: string, waitSeconds = 25): Promise<BotJob> {
+    const response = await fetch(`${API_URL}/messages/jobs/${jobId}?wait=${waitSeconds}`);
+    if (!response.ok) throw new Error('Error al obtener respuesta del bot');
     return response.json();
   },
+
+  // Mensajes nuevos después del del usuario, una vez que llegó la respuesta del bot.
+  // El job vive en memoria del worker que recibió el POST: con varios workers
+  // la consulta puede caer en otro y dar 404; entonces se sondea /sync.
+  async waitForBotReply(ticketId: string, userMessageId: string, jobId?: string): Promise<Message[]> {
+    if (jobId) {
+      try {
+        let job = await api.waitForBotJob(jobId);
+        while (job.status === 'queued' || job.status === 'running') {
+          job = await api.waitForBotJob(jobId);
+        }
+        return await api.syncMessages(ticketId, userMessageId);
+      } catch (err) {
+        console.warn('Job del bot no disponible, se sondean los mensajes:', err);
+      }
+    }
+    const deadline = Date.now() + BOT_REPLY_TIMEOUT_MS;
+    let messages = await api.syncMessages(ticketId, userMessageId);
+    while (!messages.some(m => m.is_bot) && Date.now() < deadline) {
+      await new Promise(resolve => setTimeout(resolve, BOT_REPLY_POLL_MS));
+      messages = await api.syncMessages(ticketId, userMessageId);
+    }
+    return messages;
+  },
 };
\ No newline at end of file
@@ -6,6 +6,9 @@ import Navbar from '@/app/components/Navbar';
 import { api, TicketWithMessages, Message } from '@/app/lib/api';
 import { useAuth } from '@/app/lib/AuthContext';
 
+// Mensaje en pantalla: los pendientes guardan su Idempotency-Key para reintentar
+type ChatMessage = Message & { idempotencyKey?: string; failed?: boolean };
+
 export default function TicketChatPage() {
     const params = useParams();
     const router = useRouter();
@@ -13,7 +16,7 @@ export default function TicketChatPage() {
     const { user, loading: authLoading } = useAuth();
 
     const [ticket, setTicket] = useState<TicketWithMessages | null>(null);
-    const [messages, setMessages] = useState<Message[]>([]);
+    const [messages, setMessages] = useState<ChatMessage[]>([]);
     const [inputMessage, setInputMessage] = useState('');
     const [isTyping, setIsTyping] = useState(false);
     const [loading, setLoading] = useState(true);
@@ -51,58 +54,72 @@ export default function TicketChatPage() {
         messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
     };
 
-    const handleSendMessage = async (e: React.FormEvent) => {
-        e.preventDefault();
-        if (!inputMessage.trim() || !ticket) return;
-
-        const tempMessage: Message = {
-            id: `temp-${Date.now()}`,
-            ticket_id: ticketId,
-            content: inputMessage,
-            is_bot: false,
-            sender_name: 'Tú',
-            created_at: new Date().toISOString(),
-        };
-
-        setMessages((prev) => [...prev, tempMessage]);
-        setInputMessage('');
+    const deliverMessage = async (pending: ChatMessage) => {
+        setMessages((prev) =>
+            prev.map(msg => msg.id === pending.id ? { ...msg, failed: false } : msg)
+        );
         setIsTyping(true);
 
         try {
-            // Enviar mensaje del usuario
+            // Enviar mensaje del usuario; la misma llave en cada reintento
+            // evita duplicarlo si el primer envío sí llegó
             const userMessage = await api.sendMessage({
                 ticket_id: ticketId,
-                content: inputMessage,
+                content: pending.content,
                 is_bot: false,
                 sender_name: user?.name || 'Usuario',
-            });
+            }, pending.idempotencyKey);
 
             // Reemplazar mensaje temporal con el real
             setMessages((prev) =>
-                prev.map(msg => msg.id === tempMessage.id ? userMessage : msg)
+                prev.map(msg => msg.id === pending.id ? userMessage : msg)
             );
 
-            // El backend ahora responde automáticamente con OpenAI
-            // Esperamos un poco y recargamos los mensajes para obtener la respuesta del bot
-            setTimeout(async () => {
-                try {
-                    const updatedMessages = await api.getMessages(ticketId);
-                    setMessages(updatedMessages);
-                } catch (err) {
-                    console.error('Error al obtener mensajes actualizados:', err);
-                } finally {
-                    setIsTyping(false);
-                }
-            }, 2000); // Esperar 2 segundos para dar tiempo a OpenAI
+            // El backend genera la respuesta del bot en segundo plano;
+            // esperamos el job (o sondeamos si no está disponible) y traemos
+            // solo los mensajes nuevos
+            try {
+                const newMessages = await api.waitForBotReply(ticketId, userMessage.id, userMessage.bot_job_id);
+                setMessages((prev) => [
+                    ...prev,
+                    ...newMessages.filter(m => !prev.some(p => p.id === m.id)),
+                ]);
+            } catch (err) {
+                console.error('Error al obtener mensajes actualizados:', err);
+            } finally {
+                setIsTyping(false);
+            }
 
         } catch (err) {
             console.error('Error al enviar mensaje:', err);
-            setMessages((prev) => prev.filter(msg => msg.id !== tempMessage.id));
-            alert('Error al enviar el mensaje. Por favor intenta de nuevo.');
+            // Se conserva el mensaje (y su llave) para reintentarlo
+            setMessages((prev) =>
+                prev.map(msg => msg.id === pending.id ? { ...msg, failed: true } : msg)
+            );
             setIsTyping(false);
         }
     };
 
+    const handleSendMessage = async (e: React.FormEvent) => {
+        e.preventDefault();
+        if (!inputMessage.trim() || !ticket) return;
+
+        const idempotencyKey = crypto.randomUUID();
+        const tempMessage: ChatMessage = {
+            id: `temp-${idempotencyKey}`,
+            ticket_id: ticketId,
+            content: inputMessage,
+            is_bot: false,
+            sender_name: 'Tú',
+            created_at: new Date().toISOString(),
+            idempotencyKey,
+        };
+
+        setMessages((prev) => [...prev, tempMessage]);
+        setInputMessage('');
+        await deliverMessage(tempMessage);
+    };
+
     const handleResolveTicket = async () => {
         if (!ticket || !confirm('¿Estás seguro de que quieres marcar este ticket como resuelto?')) {
             return;
@@ -289,6 +306,16 @@ export default function TicketChatPage() {
                                             minute: '2-digit',
                                         })}
                                     </p>
+                                    {message.failed && (
+                                        <button
+                                            type="button"
+                                            onClick={() => deliverMessage(message)}
+                                            disabled={isTyping}
+                                            className="text-xs mt-1 font-semibold underline text-white disabled:opacity-50"
+                                        >
+                                            No se envió. Reintentar
+                                        </button>
+                                    )}
                                 </div>
                             </div>
                         ))}
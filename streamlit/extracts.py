@@ -0,0 +1,39 @@
+"""
+Consultas de extracción de la página de herramientas (pages/2_tools.py).
+
+Aparte de la página para poder importarlas sin levantar Streamlit: el
+chequeo de planes de backend/benchmarks/query_plans.py corre EXPLAIN sobre
+esta misma consulta.
+"""
+
+# Mensajes de los tickets más recientes (limit_tickets) con filtros opcionales
+MESSAGES_EXTRACT_SQL = """
+    WITH ticket_scope AS (
+      SELECT id
+      FROM public.tickets
+      WHERE (:status IS NULL OR status = :status)
+        AND (:category IS NULL OR category = :category)
+      ORDER BY created_at DESC
+      LIMIT :limit_tickets
+    )
+    SELECT m.ticket_id::text AS ticket_id,
+           m.content::text    AS content,
+           m.created_at       AS created_at,
+           m.is_bot           AS is_bot,
+           m.sender_name      AS sender_name
+    FROM public.messages m
+    JOIN ticket_scope s ON s.id = m.ticket_id
+    WHERE (:since IS NULL OR m.created_at >= :since)
+      AND (:until IS NULL OR m.created_at <  :until)
+    ORDER BY m.ticket_id, m.created_at
+"""
+
+
+def messages_extract_params(status=None, category=None, since=None, until=None, limit_tickets=500):
+    return {
+        "status": status if status else None,
+        "category": category if category else None,
+        "since": since if since else None,      # e.g. "2025-10-01"
+        "until": until if until else None,      # e.g. "2025-11-01"
+        "limit_tickets": int(limit_tickets),
+    }
@@ -45,28 +45,65 @@ import pandas as pd
 import streamlit as st
 from sqlalchemy import create_engine, text
 from sqlalchemy.pool import NullPool
-
-def _get_db_url() -> str:
-    # Prioriza secrets; fallback a env si estás en local
+from extracts import MESSAGES_EXTRACT_SQL, messages_extract_params
+
+# Los extracts solo leen: van a la réplica (DATABASE_REPLICA_URL) si existe,
+# responde y su atraso no pasa de REPLICA_MAX_LAG_SECONDS; si no, al primario
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "10"))
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "5"))
+
+# Misma consulta de atraso que backend/app/database.py (REPLICA_LAG_SQL)
+REPLICA_LAG_SQL = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+def _get_setting(key: str) -> str | None:
+    # Prioriza secrets; fallback a env si estás en local.
     try:
-        if "DATABASE_URL" in st.secrets and st.secrets["DATABASE_URL"]:
-            return st.secrets["DATABASE_URL"]
+        if key in st.secrets and st.secrets[key]:
+            return st.secrets[key]
     except Exception:
         pass
-    env_url = os.getenv("DATABASE_URL")
-    if env_url:
-        return env_url
-    raise RuntimeError("Falta DATABASE_URL en .streamlit/secrets.toml o como variable de entorno.")
+    return os.getenv(key) or None
+
+def _get_db_url() -> str:
+    url = _get_setting("DATABASE_URL")
+    if not url:
+        raise RuntimeError("Falta DATABASE_URL en .streamlit/secrets.toml o como variable de entorno.")
+    return url
 
 @st.cache_resource(show_spinner=False)
-def make_engine():
-    url = _get_db_url()
+def _engine_for(url: str):
     return create_engine(
         url,
         poolclass=NullPool,                           # evita agotar el pool del pooler
         connect_args={"sslmode": "require", "connect_timeout": 10},
     )
 
+@st.cache_data(ttl=REPLICA_CHECK_INTERVAL, show_spinner=False)
+def _replica_usable(url: str) -> bool:
+    """La réplica responde y va al día (se revisa como mucho cada REPLICA_CHECK_INTERVAL s)"""
+    try:
+        with _engine_for(url).connect() as conn:
+            lag = float(conn.execute(REPLICA_LAG_SQL).scalar())
+    except Exception as e:
+        print(f"⚠️ Réplica no disponible ({e}); extracts al primario")
+        return False
+    if lag > REPLICA_MAX_LAG_SECONDS:
+        print(f"⚠️ Réplica con {lag:.1f}s de atraso; extracts al primario")
+        return False
+    return True
+
+def make_engine():
+    replica_url = _get_setting("DATABASE_REPLICA_URL")
+    if replica_url and _replica_usable(replica_url):
+        return _engine_for(replica_url)
+    return _engine_for(_get_db_url())
+
 def fetch_messages_df(
     status: str | None = None,
     category: str | None = None,
@@ -79,34 +116,8 @@ def fetch_messages_df(
     Toma los mensajes de tickets recientes (limitados por limit_tickets) y aplica filtros opcionales.
     """
     engine = make_engine()
-    sql = text("""
-        WITH ticket_scope AS (
-          SELECT id
-          FROM public.tickets
-          WHERE (:status IS NULL OR status = :status)
-            AND (:category IS NULL OR category = :category)
-          ORDER BY created_at DESC
-          LIMIT :limit_tickets
-        )
-        SELECT m.ticket_id::text AS ticket_id,
-               m.content::text    AS content,
-               m.created_at       AS created_at,
-               m.is_bot           AS is_bot,
-               m.sender_name      AS sender_name
-        FROM public.messages m
-        JOIN ticket_scope s ON s.id = m.ticket_id
-        WHERE (:since IS NULL OR m.created_at >= :since)
-          AND (:until IS NULL OR m.created_at <  :until)
-        ORDER BY m.ticket_id, m.created_at
-    """)
-
-    params = {
-        "status": status if status else None,
-        "category": category if category else None,
-        "since": since if since else None,      # e.g. "2025-10-01"
-        "until": until if until else None,      # e.g. "2025-11-01"
-        "limit_tickets": int(limit_tickets),
-    }
+    sql = text(MESSAGES_EXTRACT_SQL)
+    params = messages_extract_params(status, category, since, until, limit_tickets)
 
     with engine.begin() as conn:
         rows = conn.execute(sql, params).mappings().all()